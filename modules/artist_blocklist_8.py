@@ -1,29 +1,125 @@
 # artist_blocklist_8.py
 
+import re
+
+from modules.song_store_10 import artist_key
+
+# Separators between collaborating artists ("A feat. B", "A & B", "A, B", "A ft B", "A vs. B").
+# The keywords must be whole words, so names such as "Feathers" or "Vsauce" are not split.
+_COLLABORATORS = re.compile(r"\s*(?:,|&|\+|\b(?:feat|ft|vs|featuring)\b\.?)\s*")
+
 class ArtistBlocklist:
     """
     Manages a list of blocked artists using a hash set for efficient operations.
+    Names are compared casefolded, aliases map to the artist they stand for, and a
+    song is blocked when any collaborator in its artist credit is blocked or the
+    credit matches one of the blocked patterns. The patterns are compiled into one
+    regular expression, and verdicts are cached per distinct artist name, so checks
+    stay O(1) on average no matter how many songs share an artist.
     """
-    def __init__(self):
-        # A set to store blocked artist names for O(1) average time complexity.
+    def __init__(self, store=None, journal=None):
+        # A set to store blocked artist names (casefolded) for O(1) average time complexity.
         self.blocked_artists = set()
+        # Alias (casefolded) -> the artist name (casefolded) it refers to.
+        self.aliases = {}
+        # Blocked regular expressions, matched case-insensitively against the artist credit.
+        self.patterns = []
+        # Optional shared SongStore, used to check stored songs by handle.
+        self.store = store
+        # Optional ChangeJournal that records every mutation.
+        self.journal = journal
+        self._matcher = None
+        # Cached verdicts per casefolded artist credit; cleared on every change.
+        self._verdicts = {}
 
     # O(1) average time complexity due to hash set insertion.
     def block_artist(self, artist_name):
         """Adds an artist to the blocklist."""
-        self.blocked_artists.add(artist_name.lower())
+        self.blocked_artists.add(self._canonical(artist_key(artist_name)))
+        self._changed()
+        if self.journal is not None:
+            self.journal.record("blocklist.block", artist_name)
 
     # O(1) average time complexity due to hash set removal.
     def unblock_artist(self, artist_name):
         """Removes an artist from the blocklist."""
-        self.blocked_artists.discard(artist_name.lower())
+        self.blocked_artists.discard(self._canonical(artist_key(artist_name)))
+        self._changed()
+        if self.journal is not None:
+            self.journal.record("blocklist.unblock", artist_name)
+
+    # O(1) average time.
+    def add_alias(self, alias, artist_name):
+        """
+        Makes `alias` refer to `artist_name` (e.g. a stage name or a former band name).
+        If the alias was blocked before, the artist it now refers to is blocked instead.
+        """
+        key = artist_key(alias)
+        self.aliases[key] = artist_key(artist_name)
+        if key in self.blocked_artists:
+            self.blocked_artists.discard(key)
+            self.blocked_artists.add(self._canonical(key))
+        self._changed()
+        if self.journal is not None:
+            self.journal.record("blocklist.alias", alias, artist_name)
+
+    # O(p) time to recompile p patterns.
+    def block_pattern(self, pattern):
+        """Blocks every artist credit matching a regular expression (case-insensitive search)."""
+        re.compile(pattern)
+        if pattern not in self.patterns:
+            self.patterns.append(pattern)
+            self._changed()
+        if self.journal is not None:
+            self.journal.record("blocklist.block_pattern", pattern)
+
+    # O(p) time to recompile p patterns.
+    def unblock_pattern(self, pattern):
+        """Removes a blocked pattern."""
+        if pattern in self.patterns:
+            self.patterns.remove(pattern)
+            self._changed()
+        if self.journal is not None:
+            self.journal.record("blocklist.unblock_pattern", pattern)
 
-    # O(1) average time complexity due to hash set lookup.
+    def _changed(self):
+        """Recompiles the pattern matcher and drops cached verdicts."""
+        self._matcher = re.compile("|".join(f"(?:{pattern})" for pattern in self.patterns),
+                                   re.IGNORECASE) if self.patterns else None
+        self._verdicts = {}
+
+    def _canonical(self, key):
+        return self.aliases.get(key, key)
+
+    # O(1) average time complexity for a previously seen artist credit.
     def is_blocked(self, artist_name):
-        """Checks if an artist is in the blocklist."""
-        return artist_name.lower() in self.blocked_artists
+        """Checks if an artist (or any collaborator in a credit) is blocked."""
+        key = artist_key(artist_name)
+        verdict = self._verdicts.get(key)
+        if verdict is None:
+            verdict = self._verdicts[key] = self._check(key)
+        return verdict
+
+    def _check(self, key):
+        blocked = self.blocked_artists
+        if self._canonical(key) in blocked:
+            return True
+        if any(self._canonical(part) in blocked for part in _COLLABORATORS.split(key) if part):
+            return True
+        return self._matcher is not None and self._matcher.search(key) is not None
+
+    # O(1) average time complexity: verdicts are cached per distinct artist credit.
+    def is_song_blocked(self, handle):
+        """Checks if the artist of a stored song (by SongStore handle) is blocked."""
+        return self.is_blocked(self.store.artist_keys[self.store.artist_ids[handle]])
+
+    # O(a) time for a distinct artists in the store.
+    def blocked_artist_ids(self):
+        """Interned artist ids (in the store) whose credit is blocked."""
+        keys = self.store.artist_keys
+        return [artist_id for artist_id in range(len(keys)) if self.is_blocked(keys[artist_id])]
 
     # O(n) time complexity to convert the set to a list, where n is the number of blocked artists.
     def get_all_blocked(self):
         """Returns a list of all blocked artists."""
-        return list(self.blocked_artists)
\ No newline at end of file
+        return list(self.blocked_artists)
@@ -0,0 +1,105 @@
+# artist_index_21.py - Per-artist Secondary Indexes
+
+from array import array
+
+class ArtistIndex:
+    """
+    Maps every artist to the handles of all stored songs by that artist, and every
+    casefolded artist key to the interned artist ids sharing it ("Drake", "DRAKE").
+    New songs are picked up lazily from the store's columns on the next query, so
+    adding songs costs nothing extra; artist changes arrive through the store's
+    reassign hook.
+    """
+    def __init__(self, store):
+        self.store = store
+        # artist id -> handles of its songs, in insertion order.
+        self._by_artist = {}
+        # casefolded artist key -> artist ids.
+        self._ids_by_key = {}
+        # Songs and artists of the store already indexed.
+        self._songs_indexed = 0
+        self._artists_indexed = 0
+        store.attach_index(self)
+
+    # O(new songs + new artists) time.
+    def _catch_up(self):
+        store = self.store
+        if self._artists_indexed < len(store.artist_keys):
+            for artist_id in range(self._artists_indexed, len(store.artist_keys)):
+                self._ids_by_key.setdefault(store.artist_keys[artist_id], []).append(artist_id)
+            self._artists_indexed = len(store.artist_keys)
+        if self._songs_indexed < len(store):
+            by_artist = self._by_artist
+            artist_ids = store.artist_ids
+            for handle in range(self._songs_indexed, len(store)):
+                handles = by_artist.get(artist_ids[handle])
+                if handles is None:
+                    handles = by_artist[artist_ids[handle]] = array('q')
+                handles.append(handle)
+            self._songs_indexed = len(store)
+
+    # O(s) time for s songs by the old artist (store hook).
+    def reassign(self, handle, old_artist_id, new_artist_id):
+        if handle >= self._songs_indexed:
+            # Not indexed yet; the catch-up will file it under the new artist.
+            return
+        handles = self._by_artist[old_artist_id]
+        del handles[handles.index(handle)]
+        self._by_artist.setdefault(new_artist_id, array('q')).append(handle)
+
+    def changed(self, handle, field, old_value, new_value):
+        """Store hook; titles and durations are not indexed here."""
+
+    # O(1) average time (after catching up with new songs).
+    def artist_ids(self, artist_key):
+        """Interned artist ids whose casefolded name equals `artist_key`."""
+        self._catch_up()
+        return list(self._ids_by_key.get(artist_key, ()))
+
+    # O(s) time for s songs by the artist.
+    def handles_of(self, artist_id):
+        """Handles of every stored song by an interned artist id."""
+        self._catch_up()
+        return list(self._by_artist.get(artist_id, ()))
+
+    # O(s) time for s songs by the artist.
+    def songs_by(self, artist_key):
+        """Handles of every stored song whose artist casefolds to `artist_key`."""
+        self._catch_up()
+        return [handle for artist_id in self._ids_by_key.get(artist_key, ())
+                for handle in self._by_artist.get(artist_id, ())]
+
+class PlaylistHandleIndex:
+    """
+    Engine index from store handle to the playlist nodes holding that song, so the
+    songs of one artist can be deleted from the playlist without scanning it.
+    Attach it with PlaylistEngine.attach_index.
+    """
+    def __init__(self):
+        # handle -> list of nodes (a song may appear in the playlist more than once).
+        self._nodes = {}
+
+    # O(1) average time (engine mutation hook).
+    def add(self, node):
+        nodes = self._nodes.get(node.handle)
+        if nodes is None:
+            self._nodes[node.handle] = [node]
+        else:
+            nodes.append(node)
+
+    # O(c) time for c copies of the song (engine mutation hook).
+    def remove(self, node):
+        nodes = self._nodes.get(node.handle)
+        if nodes is None or node not in nodes:
+            return
+        nodes.remove(node)
+        if not nodes:
+            del self._nodes[node.handle]
+
+    def update(self, node, field, old_value, new_value):
+        """Engine hook; the handle of a node never changes."""
+
+    # O(c) time.
+    def nodes_of(self, handle):
+        """The playlist nodes currently holding a song."""
+        return list(self._nodes.get(handle, ()))
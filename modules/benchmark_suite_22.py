@@ -0,0 +1,323 @@
+# benchmark_suite_22.py - Benchmark Harness for PlayWise Operations
+
+import argparse
+import gc
+import json
+import platform
+import random
+import time
+import tracemalloc
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+
+def synthetic_rows(count, seed=0):
+    """Yields `count` (title, artist, duration, rating, id) rows of a reproducible library."""
+    rng = random.Random(seed)
+    for i in range(count):
+        yield (f"Song {i}", f"Artist {i % 5000}", rng.randint(30, 600), rng.randint(1, 5), f"s{i}")
+
+# Each operation is (prepare, run, undo). prepare(pw, rng) picks the arguments outside the
+# timed region, run(pw, args) is the only timed call, and undo(pw, args, result) restores
+# the library size afterwards (also untimed) so every sample sees the same n.
+
+def _prepare_add(pw, rng):
+    i = rng.randrange(1 << 30)
+    return (f"Bench {i}", f"Artist {i % 5000}", 30 + i % 570)
+
+def _undo_add(pw, args, node):
+    pw.playlist_engine.delete_node(node)
+
+def _prepare_delete(pw, rng):
+    index = rng.randrange(pw.playlist_engine.size)
+    return index, pw.playlist_engine.get_at(index).handle
+
+def _undo_delete(pw, args, result):
+    index, handle = args
+    engine = pw.playlist_engine
+    engine.add_handle(handle)
+    engine.move_song(engine.size - 1, index)
+
+def _prepare_move(pw, rng):
+    size = pw.playlist_engine.size
+    return rng.randrange(size), rng.randrange(size)
+
+def _prepare_song_id(pw, rng):
+    return pw.song_store.song_ids[rng.randrange(len(pw.song_lookup.song_by_id))]
+
+def _prepare_title(pw, rng):
+    return pw.song_store.titles[rng.randrange(len(pw.song_lookup.song_by_id))]
+
+def _prepare_rating_delete(pw, rng):
+    song_id = _prepare_song_id(pw, rng)
+    handle = pw.song_store.handle_of(song_id)
+    return song_id, handle, pw.song_store.ratings[handle]
+
+def _undo_rating_delete(pw, args, removed):
+    _, handle, rating = args
+    if removed:
+        pw.song_rating_tree.insert_handle(handle, rating)
+
+def _sort_by(keys):
+    def prepare(pw, rng):
+        return pw.playlist_engine.physical_handles()
+    def run(pw, handles):
+        return pw.playlist_sorter.sort_handles(pw.song_store, handles, keys)
+    return prepare, run, None
+
+OPERATIONS = {
+    "add": (_prepare_add, lambda pw, args: pw.playlist_engine.add_song(*args), _undo_add),
+    "delete": (_prepare_delete, lambda pw, args: pw.playlist_engine.delete_song(args[0]), _undo_delete),
+    "move": (_prepare_move, lambda pw, args: pw.playlist_engine.move_song(*args), None),
+    "reverse": (None, lambda pw, args: pw.playlist_engine.reverse_playlist(), None),
+    "sort_title": _sort_by("title"),
+    "sort_duration": _sort_by([("duration", True)]),
+    "lookup_id": (_prepare_song_id, lambda pw, song_id: pw.song_lookup.get_by_id(song_id), None),
+    "lookup_title": (_prepare_title, lambda pw, title: pw.song_lookup.get_by_title(title), None),
+    "rating_search": (lambda pw, rng: rng.randint(1, 5),
+                      lambda pw, rating: pw.song_rating_tree.search_by_rating(rating), None),
+    "rating_delete": (_prepare_rating_delete,
+                      lambda pw, args: pw.song_rating_tree.delete_song(args[0]), _undo_rating_delete),
+    # The uncached producers: PlayWise's cached wrappers would time cache hits after the first run.
+    "snapshot": (None, lambda pw, args: pw.system_snapshot.export_snapshot(), None),
+    "duration_summary": (None, lambda pw, args: pw.duration_visualizer.get_duration_summary(), None),
+}
+
+def _percentile(ordered, q):
+    """Linear interpolation between the closest ranks of a sorted list."""
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+def summarize(samples_ns):
+    """Reduces timing samples (in nanoseconds) to min/median/mean/p90/p99/max and ops/sec."""
+    ordered = sorted(samples_ns)
+    median = _percentile(ordered, 50)
+    return {
+        "samples": len(ordered),
+        "min_ns": ordered[0],
+        "median_ns": round(median),
+        "mean_ns": round(sum(ordered) / len(ordered)),
+        "p90_ns": round(_percentile(ordered, 90)),
+        "p99_ns": round(_percentile(ordered, 99)),
+        "max_ns": ordered[-1],
+        "ops_per_sec": round(1e9 / median, 1) if median else None
+    }
+
+def timer_overhead_ns(rounds=1000):
+    """Median cost of an empty perf_counter_ns() pair, subtracted from every sample."""
+    clock = time.perf_counter_ns
+    samples = []
+    for _ in range(rounds):
+        start = clock()
+        samples.append(clock() - start)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+def build_playwise(size, factory, seed=0):
+    """A PlayWise instance (made by `factory`) holding `size` synthetic songs, all rated and indexed by ID."""
+    playwise = factory()
+    playwise.add_songs_bulk(synthetic_rows(size, seed))
+    return playwise
+
+# O(warmup + repetitions) calls of the operation.
+def time_operation(playwise, operation, warmup=3, repetitions=50, time_budget=2.0,
+                   min_samples=5, rng=None, overhead_ns=0):
+    """
+    Times one operation call per sample with perf_counter_ns, after `warmup` untimed
+    calls. Sampling stops after `repetitions` samples, or once `time_budget` seconds
+    have passed and at least `min_samples` were taken (so O(n) operations on large
+    libraries stay affordable). The garbage collector is paused while timing, and the
+    timer's own overhead is subtracted. Returns the raw samples in nanoseconds.
+    """
+    prepare, run, undo = operation
+    rng = rng or random.Random(0)
+    clock = time.perf_counter_ns
+    samples = []
+    deadline = time.perf_counter() + time_budget
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for round_number in range(warmup + repetitions):
+            args = prepare(playwise, rng) if prepare else None
+            start = clock()
+            result = run(playwise, args)
+            elapsed = clock() - start
+            if undo:
+                undo(playwise, args, result)
+            if round_number >= warmup:
+                samples.append(max(0, elapsed - overhead_ns))
+                if len(samples) >= min_samples and time.perf_counter() > deadline:
+                    break
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return samples
+
+def measure_memory(playwise, operation, rng=None):
+    """
+    Runs one call under tracemalloc (separately from the timing runs, which tracing
+    would slow down) and returns the peak bytes allocated during the call and the
+    bytes still held afterwards.
+    """
+    prepare, run, undo = operation
+    rng = rng or random.Random(0)
+    args = prepare(playwise, rng) if prepare else None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = run(playwise, args)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    if undo:
+        undo(playwise, args, result)
+    return {"peak_bytes": peak, "retained_bytes": current}
+
+def measure_build_memory(size, factory, seed=0):
+    """Bytes per song of a freshly built library (store, playlist, lookup and rating tree)."""
+    rows = list(synthetic_rows(size, seed))
+    gc.collect()
+    tracemalloc.start()
+    try:
+        playwise = build_playwise(0, factory, seed)
+        playwise.add_songs_bulk(rows)
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"bytes_per_song": round(current / max(1, size), 1)}
+
+def run_suite(factory, sizes=DEFAULT_SIZES, operations=None, warmup=3, repetitions=50, time_budget=2.0,
+              memory=True, seed=0, progress=None):
+    """
+    Benchmarks every operation (all of OPERATIONS by default) at each library size, on
+    fresh PlayWise instances made by `factory`.
+    Returns a JSON-serializable report: {"meta": {...}, "results": [...]}, one result per
+    (operation, size) with the timing summary and, with memory=True, the tracemalloc
+    figures from a separate run. Bulk ingest time is reported as the "bulk_add" operation.
+    """
+    names = list(operations or OPERATIONS)
+    unknown = [name for name in names if name not in OPERATIONS]
+    if unknown:
+        raise KeyError(f"unknown operations: {', '.join(unknown)}")
+    overhead = timer_overhead_ns()
+    results = []
+    for size in sizes:
+        start = time.perf_counter_ns()
+        playwise = build_playwise(size, factory, seed)
+        build_result = {"operation": "bulk_add", "size": size,
+                        **summarize([time.perf_counter_ns() - start])}
+        if memory:
+            build_result["memory"] = measure_build_memory(size, factory, seed)
+        results.append(build_result)
+        if progress:
+            progress(build_result)
+        for name in names:
+            rng = random.Random(f"{seed}-{name}-{size}")
+            samples = time_operation(playwise, OPERATIONS[name], warmup, repetitions, time_budget,
+                                     rng=rng, overhead_ns=overhead)
+            result = {"operation": name, "size": size, **summarize(samples)}
+            if memory:
+                result["memory"] = measure_memory(playwise, OPERATIONS[name], rng)
+            results.append(result)
+            if progress:
+                progress(result)
+        del playwise
+        gc.collect()
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "sizes": list(sizes),
+            "warmup": warmup,
+            "repetitions": repetitions,
+            "time_budget_sec": time_budget,
+            "timer_overhead_ns": overhead,
+            "seed": seed
+        },
+        "results": results
+    }
+
+def save_report(report, path):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+
+def load_report(path):
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+# O(r) time for r results.
+def compare_to_baseline(report, baseline, tolerance=0.20, min_delta_ns=1_000):
+    """
+    Compares median times with a stored baseline report, matching results by
+    (operation, size). A result is a "regression" when its median is more than
+    `tolerance` (a fraction) above the baseline and by at least `min_delta_ns`, which
+    keeps sub-microsecond noise from being flagged; "improvement" is the mirror case.
+    Returns one {"operation", "size", "baseline_ns", "current_ns", "change", "status"}
+    dict per result present in both reports.
+    """
+    previous = {(result["operation"], result["size"]): result["median_ns"] for result in baseline["results"]}
+    rows = []
+    for result in report["results"]:
+        baseline_ns = previous.get((result["operation"], result["size"]))
+        if baseline_ns is None:
+            continue
+        current_ns = result["median_ns"]
+        delta = current_ns - baseline_ns
+        change = delta / baseline_ns if baseline_ns else 0.0
+        status = "ok"
+        if abs(delta) >= min_delta_ns:
+            if change > tolerance:
+                status = "regression"
+            elif change < -tolerance:
+                status = "improvement"
+        rows.append({"operation": result["operation"], "size": result["size"], "baseline_ns": baseline_ns,
+                     "current_ns": current_ns, "change": round(change, 4), "status": status})
+    return rows
+
+def _format_ns(value):
+    for unit, scale in (("s", 1e9), ("ms", 1e6), ("us", 1e3)):
+        if value >= scale:
+            return f"{value / scale:.2f}{unit}"
+    return f"{value}ns"
+
+def main(factory, argv=None):
+    """
+    Command-line entry point (`factory` makes the PlayWise instances to benchmark):
+    python playwise.py bench [--sizes N ...] [--ops NAME ...] [--output FILE] [--baseline FILE]
+    Exits with status 1 when a regression against the baseline is found.
+    """
+    parser = argparse.ArgumentParser(prog="playwise.py bench")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--ops", nargs="+", choices=sorted(OPERATIONS), help="operations to run (default: all)")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--repetitions", type=int, default=50)
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds of sampling per operation and size")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc runs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.20)
+    args = parser.parse_args(argv)
+
+    def progress(result):
+        print(f"{result['operation']:>16} n={result['size']:<9} median {_format_ns(result['median_ns']):>9}"
+              f"  p99 {_format_ns(result['p99_ns']):>9}  ({result['samples']} samples)")
+
+    report = run_suite(factory, args.sizes, args.ops, args.warmup, args.repetitions, args.budget,
+                       memory=not args.no_memory, seed=args.seed, progress=progress)
+    if args.output:
+        save_report(report, args.output)
+    if not args.baseline:
+        return 0
+    rows = compare_to_baseline(report, load_report(args.baseline), args.tolerance)
+    regressions = [row for row in rows if row["status"] == "regression"]
+    for row in rows:
+        if row["status"] != "ok":
+            print(f"{row['status'].upper():>11}: {row['operation']} n={row['size']} "
+                  f"{_format_ns(row['baseline_ns'])} -> {_format_ns(row['current_ns'])} ({row['change']:+.1%})")
+    print(f"{len(regressions)} regression(s) against {args.baseline}")
+    return 1 if regressions else 0
@@ -0,0 +1,144 @@
+# bulk_ingest_15.py - Bulk Catalog Ingestion
+
+import csv
+import json
+from array import array
+
+# Column order for tuple rows and the field names used by CSV headers / JSON objects.
+FIELDS = ("title", "artist", "duration", "rating", "id")
+
+# O(n) time, O(1) memory per row (streams the file).
+def iter_csv_rows(path):
+    """
+    Yields (title, artist, duration, rating, id) tuples from a CSV file with a header row,
+    or None for a row with more or fewer fields than the header (rejected by ingest_songs).
+    """
+    with open(path, newline="", encoding="utf-8") as fp:
+        for record in csv.DictReader(fp):
+            # DictReader files extra fields under None and fills missing ones with None.
+            if None in record or None in record.values():
+                yield None
+                continue
+            yield tuple(record.get(field) for field in FIELDS)
+
+# O(n) time, O(1) memory per row (streams the file).
+def iter_jsonl_rows(path):
+    """
+    Yields (title, artist, duration, rating, id) tuples from a JSON Lines file of objects,
+    or None for a line that is not a JSON object (rejected by ingest_songs).
+    """
+    with open(path, encoding="utf-8") as fp:
+        for line in fp:
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    yield None
+                    continue
+                yield tuple(record.get(field) for field in FIELDS) if isinstance(record, dict) else None
+
+def _parse_rating(rating):
+    """
+    Numeric rating of a row: ints and floats as given, text as an int when it is
+    integral ("4") and as a float otherwise ("4.5"), like the interactive menu's ratings.
+    """
+    if isinstance(rating, bool):
+        raise TypeError("rating must be a number")
+    if isinstance(rating, (int, float)):
+        return rating
+    try:
+        return int(rating)
+    except ValueError:
+        return float(rating)
+
+def _parse_row(row):
+    """
+    Validates one row; returns (title, artist, duration, rating, id) with a numeric duration
+    and rating (None when absent), or None if the row is malformed or invalid.
+    """
+    if isinstance(row, dict):
+        row = tuple(row.get(field) for field in FIELDS)
+    if not isinstance(row, (tuple, list)) or len(row) != len(FIELDS):
+        return None
+    title, artist, duration, rating, song_id = row
+    try:
+        duration = int(duration)
+        rating = None if rating in (None, "") else _parse_rating(rating)
+    except (TypeError, ValueError):
+        return None
+    if not title or not isinstance(title, str) or duration < 0:
+        return None
+    if song_id is not None and (isinstance(song_id, bool) or not isinstance(song_id, (str, int))):
+        return None
+    return title, artist, duration, rating, song_id
+
+# O(n) time for parsing and filtering, O(n log n) to bulk-build the rating tree.
+def ingest_songs(playwise, rows):
+    """
+    Adds many songs to PlayWise in one pass and returns a report instead of printing.
+    Rows are (title, artist, duration, rating, id) tuples or dicts with those keys; rows of
+    the wrong shape, with a missing or non-string title, a non-numeric or negative
+    duration, a non-numeric rating or an ID that is not a string or integer are rejected
+    as "invalid", and rows whose song ID is already stored
+    or appears earlier in the batch as "duplicate".
+    Every row is validated before anything is stored, so an error while reading `rows`
+    leaves PlayWise unchanged. Blocked artists are checked once per distinct artist name;
+    accepted songs are appended to the playlist in one block, and the lookup tables and
+    rating tree are built in bulk.
+    """
+    store = playwise.song_store
+    blocklist = playwise.artist_blocklist
+    blocked_by_name = {}
+    accepted = []
+    batch_ids = set()
+    rejected = []
+
+    for row_number, row in enumerate(rows):
+        parsed = _parse_row(row)
+        if parsed is None:
+            if isinstance(row, dict):
+                title, artist = row.get("title"), row.get("artist")
+            elif isinstance(row, (tuple, list)):
+                title, artist = (list(row) + [None, None])[:2]
+            else:
+                title = artist = None
+            rejected.append({"row": row_number, "title": title, "artist": artist, "reason": "invalid"})
+            continue
+        title, artist, duration, rating, song_id = parsed
+        blocked = blocked_by_name.get(artist)
+        if blocked is None:
+            blocked = blocked_by_name[artist] = blocklist.is_blocked(artist or "")
+        if blocked:
+            rejected.append({"row": row_number, "title": title, "artist": artist, "reason": "blocked"})
+            continue
+        if song_id and (song_id in batch_ids or store.handle_of(song_id) is not None):
+            rejected.append({"row": row_number, "title": title, "artist": artist, "reason": "duplicate"})
+            continue
+        if song_id:
+            batch_ids.add(song_id)
+        accepted.append(parsed)
+
+    handles = array('q')
+    indexed = array('q')
+    rated = array('q')
+    # A list, not array('d'), so integral ratings stay ints in the rating tree.
+    ratings = []
+    for title, artist, duration, rating, song_id in accepted:
+        handle = store.add_song(title, artist, duration, song_id=song_id or None)
+        handles.append(handle)
+        # As in add_song_safe, only songs with an ID are indexed, and only rated ones are ranked.
+        if song_id:
+            indexed.append(handle)
+            if rating is not None:
+                rated.append(handle)
+                ratings.append(rating)
+
+    playwise.playlist_engine.extend_handles(handles)
+    playwise.song_lookup.sync_handles(indexed)
+    playwise.song_rating_tree.insert_handles(rated, ratings)
+
+    return {
+        "accepted": len(handles),
+        "rejected_count": len(rejected),
+        "rejected": rejected
+    }
@@ -0,0 +1,55 @@
+# change_journal_13.py - Versioned Journal of State Changes
+
+from collections import deque
+from itertools import islice
+
+class ChangeJournal:
+    """
+    Records every state-changing operation as a (version, op, args) entry.
+    The version counter increases by one per operation, so a client holding a version
+    can ask for exactly the operations that happened after it. Only the most recent
+    `capacity` entries are retained.
+    """
+    def __init__(self, capacity=100_000):
+        # Version of the most recent operation (0 before any change).
+        self.version = 0
+        self._entries = deque(maxlen=capacity)
+        # Callables (e.g. OperationLog.append) that receive every entry as it is recorded.
+        self._sinks = []
+
+    # O(1) time (plus O(1) per attached sink).
+    def record(self, op, *args):
+        """Appends an operation such as ("playlist.move", 3, 0) and returns its version."""
+        self.version += 1
+        entry = (self.version, op, args)
+        self._entries.append(entry)
+        for sink in self._sinks:
+            sink(entry)
+        return self.version
+
+    def attach(self, sink):
+        """Passes every future (version, op, args) entry to the callable `sink`."""
+        self._sinks.append(sink)
+
+    def detach(self, sink):
+        self._sinks.remove(sink)
+
+    # O(1) time.
+    def covers(self, version):
+        """True if every operation after `version` is still retained."""
+        if version >= self.version:
+            return True
+        return bool(self._entries) and self._entries[0][0] <= version + 1
+
+    # O(k) time for k returned entries (plus skipping within the retained window).
+    def since(self, version):
+        """
+        Yields the entries recorded after `version`, oldest first.
+        Raises ValueError if some of them have already been discarded.
+        """
+        if not self.covers(version):
+            raise ValueError(f"journal no longer holds changes since version {version}")
+        if version >= self.version:
+            return iter(())
+        start = version + 1 - self._entries[0][0]
+        return islice(self._entries, start, None)
\ No newline at end of file
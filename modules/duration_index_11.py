@@ -0,0 +1,81 @@
+# duration_index_11.py - Sorted Multiset of Songs by Duration
+
+from bisect import bisect_left, insort
+
+class DurationIndex:
+    """
+    Keeps the songs of a playlist grouped by duration, with a running total.
+    Distinct durations are held in a sorted list and each maps to an insertion-ordered
+    bucket of song nodes, so the shortest/longest song is available in O(1) and
+    updates cost O(log d) to locate the bucket (d = number of distinct durations).
+    """
+    def __init__(self):
+        self.total = 0
+        self.count = 0
+        # Sorted list of distinct durations currently present.
+        self._keys = []
+        # duration -> {node: None}; a dict keeps insertion order and O(1) removal.
+        self._buckets = {}
+
+    # O(1) average time when the duration is already present, O(d) to add a new distinct duration.
+    def add(self, node):
+        """Adds a song node under its current duration."""
+        duration = node.duration
+        bucket = self._buckets.get(duration)
+        if bucket is None:
+            bucket = self._buckets[duration] = {}
+            insort(self._keys, duration)
+        bucket[node] = None
+        self.total += duration
+        self.count += 1
+
+    # O(1) average time, O(d) when a bucket empties.
+    def remove(self, node, duration=None):
+        """
+        Removes a song node, indexed under `duration` (default: its current duration).
+        Returns False if the node was not indexed.
+        """
+        if duration is None:
+            duration = node.duration
+        bucket = self._buckets.get(duration)
+        if bucket is None or node not in bucket:
+            return False
+        del bucket[node]
+        if not bucket:
+            del self._buckets[duration]
+            del self._keys[bisect_left(self._keys, duration)]
+        self.total -= duration
+        self.count -= 1
+        return True
+
+    # O(1) average time, O(d) when a bucket is created or emptied (engine hook).
+    def update(self, node, field, old_value, new_value):
+        """Moves a song node whose duration was edited to its new bucket."""
+        if field == "duration" and self.remove(node, old_value):
+            self.add(node)
+
+    # O(1) time.
+    def shortest(self):
+        """Returns the earliest-added song with the minimum duration, or None."""
+        if not self._keys:
+            return None
+        return next(iter(self._buckets[self._keys[0]]))
+
+    # O(1) time.
+    def longest(self):
+        """Returns the earliest-added song with the maximum duration, or None."""
+        if not self._keys:
+            return None
+        return next(iter(self._buckets[self._keys[-1]]))
+
+    # O(1) per yielded song.
+    def iter_ascending(self):
+        """Yields song nodes from shortest to longest (ties in insertion order)."""
+        for duration in self._keys:
+            yield from self._buckets[duration]
+
+    # O(1) per yielded song.
+    def iter_descending(self):
+        """Yields song nodes from longest to shortest (ties in insertion order)."""
+        for duration in reversed(self._keys):
+            yield from self._buckets[duration]
\ No newline at end of file
@@ -0,0 +1,290 @@
+# instrumentation_23.py - Opt-in Call Counts, Latency Histograms and Traversal Lengths
+
+import json
+import threading
+import time
+from functools import wraps
+
+# Histogram layout (HDR-style log-linear buckets): values below 2**(SUB_BITS + 1) get one
+# bucket each, and every power-of-two range above that is split into 2**SUB_BITS equal
+# sub-buckets, so each recorded value is known to within 1/8 (12.5%) of its magnitude.
+SUB_BITS = 3
+_EXACT = 1 << (SUB_BITS + 1)
+
+# Marks a method that had no instance attribute before it was wrapped.
+_MISSING = object()
+
+def bucket_index(value):
+    """Bucket of a non-negative integer value."""
+    if value < _EXACT:
+        return value
+    shift = value.bit_length() - (SUB_BITS + 1)
+    return (shift << SUB_BITS) + (value >> shift)
+
+def bucket_bounds(index):
+    """Smallest and largest value that fall into a bucket."""
+    if index < _EXACT:
+        return index, index
+    shift = (index >> SUB_BITS) - 1
+    low = (index - (shift << SUB_BITS)) << shift
+    return low, low + (1 << shift) - 1
+
+class Histogram:
+    """
+    Log-linear histogram of non-negative integers (nanoseconds or node counts).
+    Recording is O(1) with no allocation; bucket counts live in a flat list that grows
+    only when a larger magnitude first appears.
+    """
+    __slots__ = ("counts", "count", "total", "minimum", "maximum")
+
+    def __init__(self):
+        self.counts = [0] * (_EXACT + (20 << SUB_BITS))
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = 0
+
+    # O(1) amortized time.
+    def record(self, value):
+        index = bucket_index(value)
+        counts = self.counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+
+    # O(b) time for b buckets.
+    def merge(self, other):
+        """Adds another histogram's samples to this one."""
+        counts = self.counts
+        if len(other.counts) > len(counts):
+            counts.extend([0] * (len(other.counts) - len(counts)))
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        if other.minimum is not None and (self.minimum is None or other.minimum < self.minimum):
+            self.minimum = other.minimum
+        self.maximum = max(self.maximum, other.maximum)
+
+    # O(b) time.
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile (None when empty)."""
+        if not self.count:
+            return None
+        rank = max(1, -(-self.count * q // 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_bounds(index)[1], self.maximum)
+        return self.maximum
+
+    def buckets(self):
+        """(upper bound, count) for every non-empty bucket, ascending."""
+        return [(bucket_bounds(index)[1], count) for index, count in enumerate(self.counts) if count]
+
+class Instrumentation:
+    """
+    Opt-in metrics for the PlayWise hot paths: call counts and latency histograms per
+    public method, plus the number of treap nodes walked by position lookups during
+    PlaylistEngine.delete_song, move_song and get_at.
+    - Zero cost when disabled: enabling wraps the methods of the given instances by
+      setting instance attributes; disabling deletes them again, so the original class
+      methods run with no extra check at all.
+    - Lock-free recording: each thread records into its own set of histograms; a lock is
+      taken only when a thread records for the first time. Exports merge the per-thread
+      histograms.
+    """
+    # Methods wrapped per component (component name -> attribute of PlayWise, methods).
+    COMPONENTS = {
+        "playlist_engine": ("playlist_engine", ("add_song", "add_handle", "delete_song", "delete_node",
+                                                "move_song", "reverse_playlist", "get_at")),
+        "rating_tree": ("song_rating_tree", ("insert_song", "insert_handle", "update_rating",
+                                             "search_by_rating", "search_range", "top_k",
+                                             "delete_song", "delete_many")),
+        "lookup": ("song_lookup", ("get_by_id", "get_by_title", "find_by_title", "search_titles",
+                                   "fuzzy_search", "sync_handle", "remove_handle")),
+        "sorter": ("playlist_sorter", ("sort_playlist", "sort_by", "sort_handles", "partial_sort")),
+        "snapshot": ("system_snapshot", ("export_snapshot", "stream_snapshot")),
+    }
+    # Engine methods whose treap walks are recorded.
+    WALKED = ("delete_song", "move_song", "get_at")
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Per-thread {(kind, name): Histogram} dictionaries.
+        self._shards = []
+        # (object, attribute, previous instance attribute or _MISSING) for every wrapped method.
+        self._patched = []
+
+    @property
+    def enabled(self):
+        return bool(self._patched)
+
+    def _histograms(self):
+        histograms = getattr(self._local, "histograms", None)
+        if histograms is None:
+            histograms = self._local.histograms = {}
+            self._local.walked = 0
+            with self._lock:
+                self._shards.append(histograms)
+        return histograms
+
+    # O(1) time.
+    def record(self, kind, name, value):
+        """Records one value, e.g. ("latency_ns", "lookup.get_by_id", 850)."""
+        histograms = self._histograms()
+        histogram = histograms.get((kind, name))
+        if histogram is None:
+            histogram = histograms[(kind, name)] = Histogram()
+        histogram.record(value)
+
+    def enable(self, playwise):
+        """Instruments the engine, rating tree, lookup, sorter and snapshot of a PlayWise instance."""
+        if self.enabled:
+            return
+        for component, (attribute, methods) in self.COMPONENTS.items():
+            target = getattr(playwise, attribute)
+            for method in methods:
+                walked = component == "playlist_engine" and method in self.WALKED
+                self._patch(target, method, self._timed(f"{component}.{method}", getattr(target, method), walked))
+        self._patch(playwise.playlist_engine, "_node_at", self._walking(playwise.playlist_engine._node_at))
+
+    def disable(self):
+        """Removes every wrapper, restoring the plain methods. Recorded metrics are kept."""
+        for target, attribute, previous in reversed(self._patched):
+            if previous is _MISSING:
+                delattr(target, attribute)
+            else:
+                setattr(target, attribute, previous)
+        self._patched = []
+
+    def reset(self):
+        """Drops all recorded metrics."""
+        with self._lock:
+            for histograms in self._shards:
+                histograms.clear()
+
+    def _patch(self, target, attribute, wrapper):
+        self._patched.append((target, attribute, vars(target).get(attribute, _MISSING)))
+        setattr(target, attribute, wrapper)
+
+    def _timed(self, name, method, walked):
+        clock = time.perf_counter_ns
+        local = self._local
+        record = self.record
+
+        if not walked:
+            @wraps(method)
+            def timed(*args, **kwargs):
+                start = clock()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    record("latency_ns", name, clock() - start)
+            return timed
+
+        @wraps(method)
+        def timed_walk(*args, **kwargs):
+            self._histograms()
+            outer = local.walked
+            local.walked = 0
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                record("latency_ns", name, elapsed)
+                record("nodes_walked", name, local.walked)
+                local.walked += outer
+        return timed_walk
+
+    def _walking(self, node_at):
+        local = self._local
+
+        @wraps(node_at)
+        def walking(index):
+            node = node_at(index)
+            # The descent visited exactly the found node's ancestors and the node itself.
+            depth = 0
+            current = node
+            while current is not None:
+                depth += 1
+                current = current.parent
+            local.walked = getattr(local, "walked", 0) + depth
+            return node
+        return walking
+
+    # O(t * m * b) time for t threads, m metrics and b buckets.
+    def _merged(self):
+        merged = {}
+        with self._lock:
+            shards = list(self._shards)
+        for histograms in shards:
+            for key, histogram in list(histograms.items()):
+                total = merged.get(key)
+                if total is None:
+                    total = merged[key] = Histogram()
+                total.merge(histogram)
+        return merged
+
+    def metrics(self):
+        """
+        Returns {"latency_ns": {name: summary}, "nodes_walked": {name: summary}}, where each
+        summary holds the call count, sum, min, max, mean and p50/p90/p99 (bucket upper bounds).
+        """
+        result = {"latency_ns": {}, "nodes_walked": {}}
+        for (kind, name), histogram in sorted(self._merged().items()):
+            if not histogram.count:
+                continue
+            result.setdefault(kind, {})[name] = {
+                "count": histogram.count,
+                "sum": histogram.total,
+                "min": histogram.minimum,
+                "max": histogram.maximum,
+                "mean": round(histogram.total / histogram.count, 1),
+                "p50": histogram.percentile(50),
+                "p90": histogram.percentile(90),
+                "p99": histogram.percentile(99)
+            }
+        return result
+
+    def to_json(self):
+        return json.dumps(self.metrics())
+
+    def to_prometheus(self):
+        """
+        Prometheus text exposition: playwise_calls_total counters, and the
+        playwise_call_duration_seconds and playwise_nodes_walked histograms with
+        cumulative buckets at the non-empty bucket bounds.
+        """
+        merged = sorted(self._merged().items())
+        lines = ["# HELP playwise_calls_total Calls per instrumented operation.",
+                 "# TYPE playwise_calls_total counter"]
+        for (kind, name), histogram in merged:
+            if kind == "latency_ns" and histogram.count:
+                lines.append(f'playwise_calls_total{{op="{name}"}} {histogram.count}')
+        for kind, metric, scale, help_text in (
+                ("latency_ns", "playwise_call_duration_seconds", 1e-9, "Latency per operation."),
+                ("nodes_walked", "playwise_nodes_walked", 1, "Treap nodes walked per operation.")):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} histogram")
+            for (histogram_kind, name), histogram in merged:
+                if histogram_kind != kind or not histogram.count:
+                    continue
+                cumulative = 0
+                for upper, count in histogram.buckets():
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{op="{name}",le="{upper * scale:g}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{op="{name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{metric}_sum{{op="{name}"}} {histogram.total * scale:g}')
+                lines.append(f'{metric}_count{{op="{name}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
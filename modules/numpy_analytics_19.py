@@ -0,0 +1,200 @@
+# numpy_analytics_19.py - Vectorized Duration and Rating Statistics (NumPy optional)
+
+import math
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the pure-Python paths below are used instead.
+    np = None
+
+class VectorAnalytics:
+    """
+    Duration and rating statistics over the playlist, computed on contiguous arrays.
+    With NumPy installed, the playlist's durations, ratings and artist ids are mirrored
+    into NumPy arrays (copied from the store's typed columns in playlist order) and every
+    statistic is a vectorized operation. The mirror is rebuilt lazily, only when the
+    playlist changed since the last query. Without NumPy (or with use_numpy=False) the
+    same methods run in pure Python over the store's columns and the engine's DurationIndex.
+    """
+    def __init__(self, playlist_engine, use_numpy=None):
+        self.engine = playlist_engine
+        self.store = playlist_engine.store
+        self.use_numpy = np is not None if use_numpy is None else use_numpy and np is not None
+        # Mutations seen through the engine hook (used when the engine has no journal).
+        self._changes = 0
+        self._mirror_key = None
+        self._handles = self._durations = self._ratings = self._artist_ids = None
+        playlist_engine.attach_index(self)
+
+    # O(1) time (engine mutation hooks).
+    def add(self, node):
+        self._changes += 1
+
+    def remove(self, node):
+        self._changes += 1
+
+    def update(self, node, field, old_value, new_value):
+        self._changes += 1
+
+    def _state_key(self):
+        journal = self.engine.journal
+        version = journal.version if journal is not None else None
+        return version, self._changes, self.engine.size, self.engine.is_reversed
+
+    def _playlist_handles(self):
+        handles = self.engine.physical_handles()
+        if self.engine.is_reversed:
+            handles.reverse()
+        return handles
+
+    # O(n) time, only after the playlist changed.
+    def _mirror(self):
+        """Refreshes the NumPy mirror of the playlist columns if it is stale."""
+        key = self._state_key()
+        if key == self._mirror_key:
+            return
+        store = self.store
+        # frombuffer over bytes copies, so the store's arrays stay free to grow.
+        handles = np.frombuffer(self._playlist_handles().tobytes(), dtype=np.int64)
+        self._handles = handles
+        self._durations = np.frombuffer(store.durations.tobytes(), dtype=np.int32)[handles].astype(np.int64)
+        self._ratings = np.frombuffer(store.ratings.tobytes(), dtype=np.float64)[handles]
+        self._artist_ids = np.frombuffer(store.artist_ids.tobytes(), dtype=np.uint32)[handles]
+        self._mirror_key = key
+
+    # O(n) vectorized, or O(1) from the DurationIndex.
+    def total_duration(self):
+        """Total playtime of the playlist in seconds."""
+        if self.use_numpy:
+            self._mirror()
+            return int(self._durations.sum())
+        return self.engine.duration_index.total
+
+    # O(n) vectorized (partition-based), or O(n) over the DurationIndex.
+    def percentiles(self, quantiles=(50, 90, 99)):
+        """
+        Returns {q: duration} for each percentile q, using linear interpolation between
+        the closest ranks (NumPy's default method). Empty playlists give None values.
+        """
+        if self.use_numpy:
+            self._mirror()
+            if not len(self._durations):
+                return {q: None for q in quantiles}
+            values = np.percentile(self._durations, list(quantiles))
+            return {q: float(value) for q, value in zip(quantiles, values)}
+        ordered = [node.duration for node in self.engine.duration_index.iter_ascending()]
+        result = {}
+        for q in quantiles:
+            if not ordered:
+                result[q] = None
+                continue
+            position = (len(ordered) - 1) * q / 100
+            low = math.floor(position)
+            high = min(low + 1, len(ordered) - 1)
+            result[q] = float(ordered[low] + (ordered[high] - ordered[low]) * (position - low))
+        return result
+
+    # O(n) time.
+    def duration_histogram(self, bucket_seconds=60):
+        """Counts songs per duration bucket: {bucket start in seconds: count}, ascending."""
+        if self.use_numpy:
+            self._mirror()
+            starts, counts = np.unique(self._durations // bucket_seconds, return_counts=True)
+            return {int(start) * bucket_seconds: int(count) for start, count in zip(starts, counts)}
+        durations = self.store.durations
+        counts = {}
+        for handle in self._playlist_handles():
+            start = durations[handle] // bucket_seconds * bucket_seconds
+            counts[start] = counts.get(start, 0) + 1
+        return dict(sorted(counts.items()))
+
+    # O(n) time.
+    def rating_distribution(self):
+        """Counts the playlist's songs per stored rating (0.0 for unrated songs), ascending."""
+        if self.use_numpy:
+            self._mirror()
+            ratings, counts = np.unique(self._ratings, return_counts=True)
+            return {float(rating): int(count) for rating, count in zip(ratings, counts)}
+        ratings = self.store.ratings
+        counts = {}
+        for handle in self._playlist_handles():
+            counts[ratings[handle]] = counts.get(ratings[handle], 0) + 1
+        return dict(sorted(counts.items()))
+
+    # O(n) time (grouping with bincount).
+    def artist_aggregates(self):
+        """Returns {artist: {"songs", "total_duration", "mean_duration", "mean_rating"}}."""
+        names = self.store.artist_names
+        if self.use_numpy:
+            self._mirror()
+            size = len(names)
+            songs = np.bincount(self._artist_ids, minlength=size)
+            totals = np.bincount(self._artist_ids, weights=self._durations, minlength=size)
+            rating_sums = np.bincount(self._artist_ids, weights=self._ratings, minlength=size)
+            present = np.flatnonzero(songs)
+            return {
+                names[artist_id]: {
+                    "songs": int(songs[artist_id]),
+                    "total_duration": int(totals[artist_id]),
+                    "mean_duration": float(totals[artist_id] / songs[artist_id]),
+                    "mean_rating": float(rating_sums[artist_id] / songs[artist_id])
+                }
+                for artist_id in present.tolist()
+            }
+        store = self.store
+        groups = {}
+        for handle in self._playlist_handles():
+            group = groups.get(store.artist_ids[handle])
+            if group is None:
+                group = groups[store.artist_ids[handle]] = [0, 0, 0.0]
+            group[0] += 1
+            group[1] += store.durations[handle]
+            group[2] += store.ratings[handle]
+        return {
+            names[artist_id]: {
+                "songs": songs,
+                "total_duration": total,
+                "mean_duration": total / songs,
+                "mean_rating": rating_sum / songs
+            }
+            for artist_id, (songs, total, rating_sum) in sorted(groups.items())
+        }
+
+    # O(n) vectorized selection plus O(k log k), or O(k) from the DurationIndex.
+    def top_k_longest(self, k=5):
+        """
+        Returns the k longest songs as title/duration dicts, longest first.
+        Ties go to the earliest-added song, as in the engine's DurationIndex.
+        """
+        store = self.store
+        if self.use_numpy:
+            self._mirror()
+            durations = self._durations
+            k = min(k, len(durations))
+            if k <= 0:
+                return []
+            # argpartition finds the k-th largest duration in O(n); songs above it are all
+            # kept, and the earliest-added songs (lowest handles) equal to it fill the rest.
+            handles = self._handles
+            kth = durations[np.argpartition(durations, len(durations) - k)[len(durations) - k]]
+            above = np.flatnonzero(durations > kth)
+            tied = np.flatnonzero(durations == kth)
+            tied = tied[np.argsort(handles[tied], kind="stable")][:k - len(above)]
+            chosen = np.concatenate((above, tied))
+            chosen = chosen[np.lexsort((handles[chosen], -durations[chosen]))]
+            return [{"title": store.titles[handle], "duration": store.durations[handle]}
+                    for handle in handles[chosen].tolist()]
+        nodes = islice(self.engine.duration_index.iter_descending(), k)
+        return [{"title": node.title, "duration": node.duration} for node in nodes]
+
+    def summary(self):
+        """All statistics in one dictionary."""
+        return {
+            "total_playtime_sec": self.total_duration(),
+            "percentiles": self.percentiles(),
+            "duration_histogram": self.duration_histogram(),
+            "rating_distribution": self.rating_distribution(),
+            "top_longest": self.top_k_longest(),
+            "backend": "numpy" if self.use_numpy else "python"
+        }
@@ -0,0 +1,268 @@
+# parallel_analytics_18.py - Process-pool Sorting and Aggregation over Shared Memory
+
+import heapq
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from multiprocessing import shared_memory
+
+from modules.playlist_sorter_5 import PlaylistSorter, _Descending
+
+# Below this many songs the serial code is faster than starting workers and copying columns.
+PARALLEL_THRESHOLD = 250_000
+
+def _share(data):
+    """Copies bytes into a new shared memory block (at least one byte long)."""
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    block.buf[:len(data)] = data
+    return block
+
+def _attach(name, typecode, count):
+    """Attaches to a shared block and returns (block, typed memoryview of `count` items)."""
+    block = shared_memory.SharedMemory(name=name)
+    view = block.buf.cast("B")
+    size = array(typecode).itemsize * count
+    return block, view[:size].cast(typecode)
+
+def _int_bytes(value):
+    """Encodes an int so that byte order matches numeric order (sign, length, magnitude)."""
+    magnitude = abs(value)
+    digits = magnitude.to_bytes((magnitude.bit_length() + 7) // 8, "big")
+    if value >= 0:
+        return b"\x01" + len(digits).to_bytes(4, "big") + digits
+    # Complemented, so a larger magnitude sorts first.
+    return b"\x00" + (0xFFFFFFFF - len(digits)).to_bytes(4, "big") + bytes(255 - byte for byte in digits)
+
+def _id_bytes(song_id):
+    """
+    Encodes a song ID so that byte order matches PlaylistSorter's ID order: a type tag
+    puts int IDs first, then str IDs, then missing IDs.
+    """
+    if song_id is None:
+        return b"\x02"
+    if isinstance(song_id, str):
+        return b"\x01" + song_id.encode("utf-8")
+    return b"\x00" + _int_bytes(song_id)
+
+class _SharedColumns:
+    """
+    The store's compact columns copied once into shared memory so workers can read
+    them without pickling: numeric columns as raw arrays, string columns as one UTF-8
+    blob plus an offsets array. Workers get only the block names and sizes.
+    """
+    def __init__(self, store, fields):
+        self.blocks = []
+        self.specs = {}
+        self.count = len(store)
+        for field in fields:
+            if field in self.specs:
+                continue
+            if field in ("duration", "rating"):
+                column = store.durations if field == "duration" else store.ratings
+                self.specs[field] = ("num", self._add(column.tobytes()), column.typecode, len(column))
+            elif field in ("title", "id"):
+                if field == "title":
+                    encoded = [value.encode("utf-8") for value in store.titles]
+                else:
+                    encoded = list(map(_id_bytes, store.song_ids))
+                offsets = array('q', accumulate(map(len, encoded), initial=0))
+                self.specs[field] = ("str", self._add(b"".join(encoded)), offsets[-1],
+                                     self._add(offsets.tobytes()), len(offsets))
+            elif field == "artist":
+                rank = PlaylistSorter()._column_key(store, "artist")
+                ranks = array('q', map(rank, range(self.count)))
+                self.specs[field] = ("num", self._add(ranks.tobytes()), 'q', len(ranks))
+            else:
+                raise KeyError(field)
+
+    def _add(self, data):
+        block = _share(data)
+        self.blocks.append(block)
+        return block.name
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+def _column_reader(spec, attached):
+    """Builds a key callable over handles from a column spec inside a worker."""
+    if spec[0] == "num":
+        _, name, typecode, count = spec
+        block, values = _attach(name, typecode, count)
+        attached.append((block, values))
+        return values.__getitem__
+    _, blob_name, blob_size, offsets_name, offsets_count = spec
+    blob_block, blob = _attach(blob_name, "B", blob_size)
+    offsets_block, offsets = _attach(offsets_name, "q", offsets_count)
+    attached.extend([(blob_block, blob), (offsets_block, offsets)])
+    # UTF-8 byte order matches code point order, so raw bytes compare like the decoded strings.
+    return lambda handle: bytes(blob[offsets[handle]:offsets[handle + 1]])
+
+def _release(attached):
+    for block, view in attached:
+        view.release()
+        block.close()
+
+def _sort_chunk(handles_spec, start, stop, key_specs):
+    """Worker: sorts handles[start:stop] in place in shared memory (one stable pass per key)."""
+    attached = []
+    try:
+        block, handles = _attach(*handles_spec)
+        attached.append((block, handles))
+        chunk = list(handles[start:stop])
+        for spec, descending in reversed(key_specs):
+            chunk.sort(key=_column_reader(spec, attached), reverse=descending)
+        handles[start:stop] = array('q', chunk)
+    finally:
+        _release(attached)
+
+def _aggregate_chunk(handles_spec, start, stop, duration_spec, rating_spec, k):
+    """Worker: duration total/min/max, rating counts and the k longest songs of a chunk."""
+    attached = []
+    try:
+        block, handles = _attach(*handles_spec)
+        attached.append((block, handles))
+        chunk = handles[start:stop].tolist()
+        duration = _column_reader(duration_spec, attached)
+        rating = _column_reader(rating_spec, attached)
+        durations = list(map(duration, chunk))
+        counts = {}
+        for value in map(rating, chunk):
+            counts[value] = counts.get(value, 0) + 1
+        # (duration, -position) keeps the earliest song first among equal durations.
+        longest = heapq.nlargest(k, zip(durations, range(-start, -stop, -1)))
+        shortest = min(zip(durations, range(start, stop)))
+        return sum(durations), shortest, longest, counts
+    finally:
+        _release(attached)
+
+class ParallelAnalytics:
+    """
+    Sorts and aggregates very large playlists across a ProcessPoolExecutor.
+    The playlist's handles and the needed store columns are placed in shared memory;
+    each worker sorts (or aggregates) one contiguous chunk, and the parent k-way merges
+    the sorted runs (or combines the partial aggregates). Playlists smaller than
+    `threshold`, or a single worker, use the serial code, which is faster at that size.
+    The merge still reads every key in the parent, so sorting only pays off with
+    several cores and expensive keys; aggregation returns O(k) data per worker.
+    """
+    def __init__(self, store, workers=None, threshold=PARALLEL_THRESHOLD):
+        self.store = store
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold = threshold
+        self.sorter = PlaylistSorter()
+
+    def _use_parallel(self, count):
+        return self.workers > 1 and count >= self.threshold
+
+    def _chunks(self, count):
+        step = -(-count // self.workers)
+        return [(start, min(start + step, count)) for start in range(0, count, step)]
+
+    # O((n/w) log n) time per worker plus O(n log w) for the run merge.
+    def sort_handles(self, handles, keys="title"):
+        """Returns the handles sorted by the given keys (same rules as PlaylistSorter.sort_handles)."""
+        handles = array('q', handles)
+        if not self._use_parallel(len(handles)):
+            return self.sorter.sort_handles(self.store, handles, keys)
+        keys = self.sorter.normalize_keys(keys)
+        columns = _SharedColumns(self.store, [field for field, _ in keys])
+        handles_block = _share(handles.tobytes())
+        try:
+            handles_spec = (handles_block.name, 'q', len(handles))
+            key_specs = [(columns.specs[field], descending) for field, descending in keys]
+            chunks = self._chunks(len(handles))
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                for future in [pool.submit(_sort_chunk, handles_spec, start, stop, key_specs)
+                               for start, stop in chunks]:
+                    future.result()
+            sorted_handles = array('q')
+            sorted_handles.frombytes(handles_block.buf[:len(handles) * sorted_handles.itemsize])
+        finally:
+            handles_block.close()
+            handles_block.unlink()
+            columns.close()
+        # The buffer now holds one sorted run per worker. Timsort detects presorted runs and
+        # merges them in C, which beats a Python-level heapq.merge of the same runs.
+        merged = sorted_handles.tolist()
+        if len(keys) == 1:
+            field, descending = keys[0]
+            merged.sort(key=self.sorter._column_key(self.store, field), reverse=descending)
+        else:
+            merged.sort(key=self._merge_key(keys))
+        return merged
+
+    def _merge_key(self, keys):
+        """Single composite key for the merge; descending keys are negated or wrapped."""
+        readers = [(self.sorter._column_key(self.store, field), descending) for field, descending in keys]
+        def composite(handle):
+            parts = []
+            for read, descending in readers:
+                value = read(handle)
+                if descending:
+                    value = -value if isinstance(value, (int, float)) else _Descending(value)
+                parts.append(value)
+            return tuple(parts)
+        return composite
+
+    # O(n/w) time per worker plus O(w k) to combine.
+    def aggregate(self, handles, k=5):
+        """
+        Computes the duration summary, rating counts and the k longest songs of the
+        given playlist order. Ties in duration report the earliest song in that order.
+        """
+        handles = array('q', handles)
+        if not handles:
+            return {"total_playtime_sec": 0, "shortest_song": None, "longest_song": None,
+                    "rating_counts": {}, "top_longest": []}
+        if not self._use_parallel(len(handles)):
+            parts = [self._aggregate_serial(handles, k)]
+        else:
+            columns = _SharedColumns(self.store, ["duration", "rating"])
+            handles_block = _share(handles.tobytes())
+            try:
+                handles_spec = (handles_block.name, 'q', len(handles))
+                with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                    futures = [pool.submit(_aggregate_chunk, handles_spec, start, stop,
+                                           columns.specs["duration"], columns.specs["rating"], k)
+                               for start, stop in self._chunks(len(handles))]
+                    parts = [future.result() for future in futures]
+            finally:
+                handles_block.close()
+                handles_block.unlink()
+                columns.close()
+
+        counts = {}
+        for _, _, _, part_counts in parts:
+            for rating, count in part_counts.items():
+                counts[rating] = counts.get(rating, 0) + count
+        shortest = min(part[1] for part in parts)
+        longest = heapq.nlargest(k, (entry for part in parts for entry in part[2]))
+        store = self.store
+
+        def song(position):
+            handle = handles[position]
+            return {"title": store.titles[handle], "duration": store.durations[handle]}
+
+        return {
+            "total_playtime_sec": sum(part[0] for part in parts),
+            "shortest_song": song(shortest[1]),
+            "longest_song": song(-longest[0][1]),
+            "rating_counts": counts,
+            "top_longest": [song(-position) for _, position in longest]
+        }
+
+    def _aggregate_serial(self, handles, k):
+        durations = self.store.durations
+        ratings = self.store.ratings
+        chunk_durations = [durations[handle] for handle in handles]
+        counts = {}
+        for handle in handles:
+            rating = ratings[handle]
+            counts[rating] = counts.get(rating, 0) + 1
+        longest = heapq.nlargest(k, zip(chunk_durations, range(0, -len(handles), -1)))
+        shortest = min(zip(chunk_durations, range(len(handles))))
+        return sum(chunk_durations), shortest, longest, counts
@@ -1,33 +1,69 @@
 # performance_analyzer_6.py - Analyze Time and Space Complexity
 
-import time
 import tracemalloc
 
+from modules.benchmark_suite_22 import run_suite
+from modules.playlist_engine_1 import PlaylistEngine
+from modules.song_lookup_4 import SongLookup
+from modules.song_rating_tree_3 import SongRatingBST
+from modules.song_store_10 import SongStore
+
+# Songs in the synthetic library benchmarked by run_analysis, small enough to finish in about a second.
+ANALYSIS_SIZE = 1_000
+
 class PerformanceAnalyzer:
     """
     Measures the time and space complexity of operations on the playlist.
     """
-    def __init__(self, playlist_engine):
+    def __init__(self, playlist_engine, factory):
         # The PlaylistEngine instance whose performance is to be analyzed.
         self.engine = playlist_engine
+        # Makes the empty PlayWise instances the benchmark suite fills with synthetic songs.
+        self.factory = factory
 
-    def run_analysis(self):
+    def run_analysis(self, size=ANALYSIS_SIZE, operations=None, repetitions=20, time_budget=0.5):
         """
-        Runs a performance analysis on a specific operation (e.g., reversing the playlist).
-        The time complexity of this method is determined by the analyzed operation (O(n) for reverse_playlist).
-        The space complexity is O(1) as it only stores a few variables for measurement.
+        Benchmarks the PlayWise operations on a synthetic library of `size` songs with the
+        benchmark suite (warmup, repeated perf_counter_ns samples, and a separate
+        tracemalloc run), so the user's own playlist is left untouched and the cost does
+        not grow with it.
+        Returns {"size": n, operation: {"median_us", "p99_us", "ops_per_sec", "peak_memory_kb"}}.
         """
-        tracemalloc.start()
-        start_time = time.time()
+        report = run_suite(self.factory, (size,), operations, repetitions=repetitions, time_budget=time_budget)
+        analysis = {"size": size}
+        for result in report["results"]:
+            analysis[result["operation"]] = {
+                "median_us": round(result["median_ns"] / 1000, 2),
+                "p99_us": round(result["p99_ns"] / 1000, 2),
+                "ops_per_sec": result["ops_per_sec"],
+                "peak_memory_kb": round(result["memory"]["peak_bytes"] / 1024, 2)
+                if "peak_bytes" in result["memory"] else None
+            }
+        return analysis
 
-        self.engine.reverse_playlist()  # Example operation to analyze
+    # O(n) time and space, where n is song_count.
+    def measure_bytes_per_song(self, song_count=1_000_000):
+        """
+        Measures the memory cost per song of the playlist, lookup tables and rating tree
+        combined, using tracemalloc on a synthetic library.
+        Title and ID strings are created before tracing starts, so only the structures are measured.
+        """
+        rows = [(f"Song {i}", f"Artist {i % 5000}", 120 + i % 400, 1 + i % 5, f"s{i}")
+                for i in range(song_count)]
 
-        end_time = time.time()
-        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.start()
+        store = SongStore()
+        engine = PlaylistEngine(store)
+        lookup = SongLookup(store)
+        rating_tree = SongRatingBST(store)
+        for title, artist, duration, rating, song_id in rows:
+            node = engine.add_song(title, artist, duration, song_id=song_id)
+            lookup.sync_handle(node.handle)
+            rating_tree.insert_handle(node.handle, rating)
+        current, _ = tracemalloc.get_traced_memory()
         tracemalloc.stop()
 
         return {
-            "execution_time_sec": round(end_time - start_time, 6),
-            "current_memory_kb": round(current / 1024, 2),
-            "peak_memory_kb": round(peak / 1024, 2)
+            "song_count": song_count,
+            "bytes_per_song": round(current / song_count, 1)
         }
\ No newline at end of file
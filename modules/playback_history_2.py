@@ -1,26 +1,335 @@
-# playback_history.py - Stack for Playback History
+# playback_history.py - Bounded Ring Buffer for Playback History
+
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left
+from heapq import nlargest
+from itertools import chain
+
+# Spill segment layout: play count, then the timestamps as doubles,
+# then the song names as NUL-separated UTF-8.
+_SEGMENT_HEADER = struct.Struct("<Q")
+_SEPARATOR = "\0"
+_SEGMENT_NAME = "history-{:06d}.seg"
+
+# Plays kept in memory by PlayWise unless configured otherwise.
+DEFAULT_CAPACITY = 10_000
+
+# Marks interning keys of unhashable songs, which are interned by identity.
+_UNHASHABLE = object()
+
+def _song_key(song):
+    """Interning key of a song: the song itself, or its identity if it is unhashable."""
+    try:
+        hash(song)
+    except TypeError:
+        return (_UNHASHABLE, id(song))
+    return song
+
+class _TimeView:
+    """Read-only sequence of the retained timestamps, oldest first, for bisect."""
+    def __init__(self, history):
+        self.history = history
+
+    def __getitem__(self, position):
+        history = self.history
+        return history._times[(history._start + position) % history._size]
+
+    def __len__(self):
+        return self.history._count
 
 class PlaybackHistory:
     """
-    Manages the history of played songs using a stack (LIFO principle).
+    Manages the history of played songs in two arrays (interned song ids and timestamps).
+    Songs are interned once, so each play costs 12 bytes no matter how long the title is.
+    Songs are normally hashable (e.g. titles); an unhashable song is interned by identity,
+    so equal but distinct unhashable objects count as different songs.
+    By default every play is kept, as with a plain stack. Opt-in limits:
+    - capacity: keep only the most recent `capacity` plays in a fixed-size ring buffer.
+      Older plays are dropped or, when `spill_dir` is given, written to disk in compact
+      segments of `segment_size` plays. Undo (LIFO) works within the retained window.
+    - monotonic: raise a timestamp earlier than the previous play to that play's time,
+      so windowed queries are always binary searches. Otherwise out-of-order timestamps
+      are kept as given and windowed queries fall back to a linear scan.
+    Play counts per song cover the whole history, including evicted plays.
     """
-    def __init__(self):
-        # A list acting as a stack to store played songs.
-        self.stack = []
+    def __init__(self, journal=None, capacity=None, spill_dir=None, segment_size=4096, monotonic=False):
+        if capacity is not None and capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.monotonic = monotonic
+        # Ring buffer of interned song ids and play timestamps; _start is the oldest slot.
+        # Without a capacity nothing is evicted (_start stays 0) and the arrays double as needed.
+        self._size = capacity if capacity is not None else 16
+        self._plays = array('I', bytes(4 * self._size))
+        self._times = array('d', bytes(8 * self._size))
+        self._start = 0
+        self._count = 0
+        # False once a timestamp earlier than its predecessor was recorded.
+        self._ordered = True
+        # Interned song table (song -> id, id -> song) and play counts indexed by song id.
+        self._song_ids = {}
+        self._songs = []
+        self._play_counts = array('I')
+        # Evicted plays waiting to be written, and (path, first time, last time, count)
+        # for each segment already on disk.
+        self.spill_dir = spill_dir
+        self.segment_size = segment_size
+        self._spill_plays = array('I')
+        self._spill_times = array('d')
+        self.segments = []
+        # Number tried first for the next segment file; names already on disk (e.g. from
+        # an earlier run) are skipped, never overwritten.
+        self._segment_number = 0
+        # Optional ChangeJournal that records every mutation.
+        self.journal = journal
 
-    # O(1) time and space complexity for appending to a list.
-    def add_played_song(self, song):
+    def __len__(self):
+        """Number of plays retained in memory."""
+        return self._count
+
+    @property
+    def stack(self):
+        """The retained plays, oldest first (a fresh list; O(n))."""
+        return self.last(self._count)
+
+    # O(1) amortized time; no per-play allocation once a bounded buffer is full.
+    def add_played_song(self, song, timestamp=None):
         """
-        Adds a song to the playback history stack.
+        Adds a song to the playback history. Timestamps default to the current time;
+        with monotonic=True they never go backwards.
         """
-        self.stack.append(song)
+        if timestamp is None:
+            timestamp = time.time()
+        if self._count:
+            previous = self._times[(self._start + self._count - 1) % self._size]
+            if timestamp < previous:
+                if self.monotonic:
+                    timestamp = previous
+                else:
+                    self._ordered = False
+        song_id = self._intern(song)
+        if self._count == self._size:
+            if self.capacity is None:
+                self._grow()
+            else:
+                self._evict()
+        slot = (self._start + self._count) % self._size
+        self._plays[slot] = song_id
+        self._times[slot] = timestamp
+        self._count += 1
+        self._play_counts[song_id] += 1
+        if self.journal is not None:
+            self.journal.record("history.play", song, timestamp)
 
-    # O(1) time and space complexity for popping from a list.
+    # O(1) time.
     def undo_last_play(self):
         """
         Removes and returns the most recently played song.
-        Returns None if the stack is empty.
+        Returns None if no play is retained in memory.
+        """
+        if not self._count:
+            return None
+        if self.journal is not None:
+            self.journal.record("history.undo")
+        self._count -= 1
+        song_id = self._plays[(self._start + self._count) % self._size]
+        self._play_counts[song_id] -= 1
+        return self._songs[song_id]
+
+    # O(n) time for the n plays returned.
+    def last(self, n=5):
+        """Returns the n most recent plays, oldest first."""
+        n = max(0, min(n, self._count))
+        return self._slice(self._count - n, self._count)
+
+    # O(n) time for n plays, O(segment_size) extra space.
+    def iter_plays(self, include_spilled=True):
+        """
+        Yields every play's song, oldest first, without building the whole history: the
+        spill segments one at a time (with include_spilled), the evicted plays not yet
+        written, then the plays retained in memory. Spilled songs come back as stored
+        on disk, i.e. as strings.
+        """
+        if include_spilled:
+            for path, _, _, _ in self.segments:
+                yield from self._read_segment(path)[1]
+            songs = self._songs
+            for song_id in self._spill_plays:
+                yield songs[song_id]
+        step = max(1, self.segment_size)
+        for begin in range(0, self._count, step):
+            yield from self._slice(begin, min(begin + step, self._count))
+
+    # O(log c + k) time for c retained plays and k plays returned (O(c) once
+    # timestamps went out of order).
+    def plays_since(self, timestamp, include_spilled=False):
         """
-        if self.stack:
-            return self.stack.pop()
-        return None
\ No newline at end of file
+        Returns the songs played at or after `timestamp`, in play order.
+        With include_spilled, matching plays are also read back from the spill segments
+        (while timestamps are in order, only the segments that overlap the window are opened).
+        """
+        songs = []
+        if include_spilled:
+            for path, _, last_time, _ in self.segments:
+                if last_time >= timestamp or not self._ordered:
+                    times, names = self._read_segment(path)
+                    songs.extend(self._select(times, names, timestamp))
+            songs.extend(self._select(self._spill_times,
+                                      [self._songs[song_id] for song_id in self._spill_plays], timestamp))
+        if self._ordered:
+            start = bisect_left(_TimeView(self), timestamp, 0, self._count)
+            songs.extend(self._slice(start, self._count))
+        else:
+            songs.extend(self._select(self.timestamps(), self.stack, timestamp))
+        return songs
+
+    def _select(self, times, songs, timestamp):
+        """The songs (parallel to `times`) played at or after `timestamp`."""
+        if self._ordered:
+            return songs[bisect_left(times, timestamp):]
+        return [song for song, played in zip(songs, times) if played >= timestamp]
+
+    # O(1) average time.
+    def play_count(self, song):
+        """Number of times a song has been played over the whole history."""
+        song_id = self._song_ids.get(_song_key(song))
+        return 0 if song_id is None else self._play_counts[song_id]
+
+    # O(s log k) time for s distinct songs.
+    def most_played(self, k=5):
+        """Returns the k most played songs as (song, count) pairs, most played first."""
+        top = nlargest(k, range(len(self._songs)), key=self._play_counts.__getitem__)
+        return [(self._songs[song_id], self._play_counts[song_id]) for song_id in top
+                if self._play_counts[song_id]]
+
+    def timestamps(self):
+        """The retained play timestamps, oldest first (parallel to stack)."""
+        return array('d', (self._times[(self._start + i) % self._size] for i in range(self._count)))
+
+    def play_counts(self):
+        """All songs with at least one play and their counts."""
+        return {song: count for song, count in zip(self._songs, self._play_counts) if count}
+
+    def spilled(self):
+        """The evicted plays not yet written to a segment, as (songs, timestamps), oldest first."""
+        return [self._songs[song_id] for song_id in self._spill_plays], self._spill_times
+
+    # O(n) time.
+    def restore(self, songs, timestamps=None, play_counts=None, segments=(), spilled=(), spilled_times=()):
+        """
+        Replaces the history with previously saved plays (oldest first), keeping the
+        last `capacity` of them (all of them without a capacity). Play counts default to
+        the counts of the given plays. `segments` and `spilled`/`spilled_times` restore
+        the spill state saved with the plays (segment files that no longer exist are
+        skipped); with a spill_dir, plays beyond the capacity are spilled, not dropped.
+        """
+        if self.capacity is None and len(songs) > self._size:
+            self._size = len(songs)
+            self._plays = array('I', bytes(4 * self._size))
+            self._times = array('d', bytes(8 * self._size))
+        self._start = 0
+        self._count = 0
+        self._ordered = True
+        self._song_ids = {}
+        self._songs = []
+        self._play_counts = array('I')
+        if timestamps is None:
+            timestamps = [0.0] * len(songs)
+        skip = max(0, len(songs) - self._size)
+        self.segments = [segment for segment in segments if os.path.exists(segment[0])]
+        self._spill_plays = array('I')
+        self._spill_times = array('d')
+        if self.spill_dir is not None:
+            for song, timestamp in chain(zip(spilled, spilled_times), zip(songs[:skip], timestamps[:skip])):
+                self._spill_plays.append(self._intern(song))
+                self._spill_times.append(timestamp)
+                if len(self._spill_plays) >= self.segment_size:
+                    self.flush()
+        for song, timestamp in zip(songs[skip:], timestamps[skip:]):
+            if self._count and timestamp < self._times[self._count - 1]:
+                self._ordered = False
+            self._plays[self._count] = self._intern(song)
+            self._times[self._count] = timestamp
+            self._count += 1
+        if play_counts is None:
+            for song in songs:
+                self._play_counts[self._intern(song)] += 1
+        else:
+            for song, count in play_counts.items():
+                self._play_counts[self._intern(song)] = count
+
+    def flush(self):
+        """Writes any evicted plays still held in memory to a new spill segment."""
+        if not self._spill_plays:
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        names = _SEPARATOR.join(str(self._songs[song_id]) for song_id in self._spill_plays)
+        while True:
+            path = os.path.join(self.spill_dir, _SEGMENT_NAME.format(self._segment_number))
+            self._segment_number += 1
+            try:
+                # "x" fails instead of overwriting a segment left by another run.
+                fp = open(path, "xb")
+            except FileExistsError:
+                continue
+            break
+        with fp:
+            fp.write(_SEGMENT_HEADER.pack(len(self._spill_plays)))
+            fp.write(self._spill_times.tobytes())
+            fp.write(names.encode("utf-8"))
+        self.segments.append((path, self._spill_times[0], self._spill_times[-1], len(self._spill_plays)))
+        self._spill_plays = array('I')
+        self._spill_times = array('d')
+
+    def _intern(self, song):
+        key = _song_key(song)
+        song_id = self._song_ids.get(key)
+        if song_id is None:
+            # An unhashable song stays referenced by _songs, so its id() is never reused.
+            song_id = self._song_ids[key] = len(self._songs)
+            self._songs.append(song)
+            self._play_counts.append(0)
+        return song_id
+
+    def _evict(self):
+        """Drops the oldest retained play, spilling it to disk when configured."""
+        if self.spill_dir is not None:
+            self._spill_plays.append(self._plays[self._start])
+            self._spill_times.append(self._times[self._start])
+            if len(self._spill_plays) >= self.segment_size:
+                self.flush()
+        self._start = (self._start + 1) % self._size
+        self._count -= 1
+
+    def _grow(self):
+        """Doubles the buffer of an unbounded history (whose oldest play is always slot 0)."""
+        self._plays.frombytes(bytes(4 * self._size))
+        self._times.frombytes(bytes(8 * self._size))
+        self._size *= 2
+
+    def _slice(self, begin, end):
+        """Songs at logical positions [begin, end) of the ring, oldest first."""
+        start = self._start + begin
+        stop = self._start + end
+        songs = self._songs
+        size = self._size
+        if stop <= size:
+            return [songs[song_id] for song_id in self._plays[start:stop]]
+        if start >= size:
+            return [songs[song_id] for song_id in self._plays[start - size:stop - size]]
+        return [songs[song_id] for song_id in self._plays[start:size]] + \
+               [songs[song_id] for song_id in self._plays[:stop - size]]
+
+    @staticmethod
+    def _read_segment(path):
+        with open(path, "rb") as fp:
+            data = fp.read()
+        (count,) = _SEGMENT_HEADER.unpack_from(data, 0)
+        offset = _SEGMENT_HEADER.size + 8 * count
+        times = array('d')
+        times.frombytes(data[_SEGMENT_HEADER.size:offset])
+        names = data[offset:].decode("utf-8").split(_SEPARATOR) if count else []
+        return times, names
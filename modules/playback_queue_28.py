@@ -0,0 +1,360 @@
+# playback_queue_28.py - Shuffle and Smart Playback Queues
+
+import random
+from array import array
+from collections import deque
+
+# Draws that may be retried when they land on a song inside the no-repeat window.
+_RETRIES = 8
+
+def rating_weight(rating):
+    """Default selection weight: unrated songs weigh 1, a 5-star song weighs 6."""
+    return 1.0 + max(rating, 0.0)
+
+class SongPool:
+    """
+    The distinct songs of the playlist in dense slots, each with a selection weight,
+    shared by every listener's PlaybackQueue.
+    - Attached to the PlaylistEngine as an index, so add/remove keep it current in
+      O(log n). A song listed twice occupies one slot; a removed slot is filled with
+      the last one (swap-remove).
+    - Weights are weight(rating), taken from the rating tree's journal entries, and 0 for
+      songs by blocked artists. Songs not in the rating tree (never rated, or deleted from
+      it) weigh weight(0.0). They live in a Fenwick tree (prefix sums), so a weight
+      changes and a weighted draw runs in O(log n). An alias table would draw in O(1)
+      but needs an O(n) rebuild after every rating change or playlist edit.
+    - A blocklist change marks all weights stale; they are recomputed in O(n) on the next
+      draw, since blocklist edits are rare compared to draws.
+    """
+    def __init__(self, store, blocklist=None, journal=None, weight=rating_weight, rating_tree=None):
+        self.store = store
+        self.blocklist = blocklist
+        # The store keeps a song's last rating after it leaves the tree, so membership
+        # is checked here when weights are recomputed.
+        self.rating_tree = rating_tree
+        self.weight = weight
+        # slot -> handle, handle -> slot, and playlist entries per handle.
+        self.handles = array('q')
+        self._slot_of = {}
+        self._entries = {}
+        # slot -> weight, plus the Fenwick tree over the same slots.
+        self.weights = array('d')
+        self._tree = []
+        self._stale = False
+        # Incremental float updates drift; the tree is rebuilt after len(pool) of them.
+        self._updates = 0
+        if journal is not None:
+            journal.attach(self._observe)
+        # Artist edits may (un)block a song: the store reports them through reassign().
+        store.attach_index(self)
+
+    def __len__(self):
+        return len(self.handles)
+
+    def __contains__(self, handle):
+        return handle in self._slot_of
+
+    def attach(self, playlist_engine):
+        """Fills the pool from the engine's songs and keeps it current from then on."""
+        # The current songs are added without touching the tree, which is built once after.
+        self._stale = True
+        playlist_engine.attach_index(self)
+        self.refresh()
+        return self
+
+    def _weight_of(self, handle):
+        if self.blocklist is not None and self.blocklist.is_song_blocked(handle):
+            return 0.0
+        if self.rating_tree is not None and not self.rating_tree._contains(handle):
+            return self.weight(0.0)
+        return self.weight(self.store.ratings[handle])
+
+    # O(log n) time (engine mutation hook).
+    def add(self, node):
+        handle = node.handle
+        entries = self._entries.get(handle, 0)
+        self._entries[handle] = entries + 1
+        if entries:
+            return
+        slot = len(self.handles)
+        weight = 0.0 if self._stale else self._weight_of(handle)
+        self._slot_of[handle] = slot
+        self.handles.append(handle)
+        self.weights.append(weight)
+        if self._stale:
+            return
+        # The new tree entry covers slots [slot & (slot + 1), slot].
+        self._tree.append(weight + self._prefix(slot) - self._prefix(slot & (slot + 1)))
+
+    # O(log n) time (engine mutation hook).
+    def remove(self, node):
+        self.refresh()
+        handle = node.handle
+        entries = self._entries.get(handle, 0) - 1
+        if entries > 0:
+            self._entries[handle] = entries
+            return
+        self._entries.pop(handle, None)
+        slot = self._slot_of.pop(handle, None)
+        if slot is None:
+            return
+        last = len(self.handles) - 1
+        if slot != last:
+            moved = self.handles[last]
+            self.handles[slot] = moved
+            self._slot_of[moved] = slot
+            self._set_weight(slot, self.weights[last])
+        # No tree entry below `last` covers it, so dropping the last entry is exact.
+        self.handles.pop()
+        self.weights.pop()
+        self._tree.pop()
+
+    # O(1) time (journal sink); O(log n) when a pooled song's rating changed.
+    def _observe(self, entry):
+        op = entry[1]
+        if op == "rating.insert" or op == "rating.delete":
+            handle = self.store.handle_of(entry[2][0])
+            if handle is not None and handle in self._slot_of:
+                if self.blocklist is not None and self.blocklist.is_song_blocked(handle):
+                    weight = 0.0
+                else:
+                    # A song taken out of the rating tree plays as unrated.
+                    weight = self.weight(0.0 if op == "rating.delete" else entry[2][1])
+                self._set_weight(self._slot_of[handle], weight)
+        elif op.startswith("blocklist."):
+            self._stale = True
+
+    # O(log n) time (store hook).
+    def reassign(self, handle, old_artist_id, new_artist_id):
+        slot = self._slot_of.get(handle)
+        if slot is not None:
+            self._set_weight(slot, self._weight_of(handle))
+
+    def changed(self, handle, field, old_value, new_value):
+        """Store hook; weights do not depend on titles or durations."""
+
+    def update(self, node, field, old_value, new_value):
+        """Engine hook; artist changes already arrive through reassign()."""
+
+    def _set_weight(self, slot, weight):
+        delta = weight - self.weights[slot]
+        if not delta:
+            return
+        self.weights[slot] = weight
+        tree = self._tree
+        while slot < len(tree):
+            tree[slot] += delta
+            slot |= slot + 1
+        self._updates += 1
+        if self._updates > len(tree):
+            self._build_tree()
+
+    def refresh(self):
+        """Recomputes stale weights after a blocklist change (O(n)); cheap otherwise."""
+        if self._stale:
+            self.weights = array('d', map(self._weight_of, self.handles))
+            self._build_tree()
+            self._stale = False
+
+    def _build_tree(self):
+        tree = list(self.weights)
+        for i in range(len(tree)):
+            parent = i | (i + 1)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+        self._updates = 0
+
+    def _prefix(self, slot):
+        """Total weight of the slots before `slot`."""
+        tree = self._tree
+        total = 0.0
+        slot -= 1
+        while slot >= 0:
+            total += tree[slot]
+            slot = (slot & (slot + 1)) - 1
+        return total
+
+    @property
+    def total_weight(self):
+        self.refresh()
+        return self._prefix(len(self._tree))
+
+    def eligible(self, slot):
+        """True if the song in a slot may be played (not blocked, positive weight)."""
+        return self.weights[slot] > 0
+
+    # O(log n) time.
+    def sample(self, rng=random):
+        """
+        Draws a handle with probability proportional to its weight, by descending the
+        Fenwick tree. Returns None when no song has a positive weight.
+        """
+        self.refresh()
+        tree = self._tree
+        total = self._prefix(len(tree))
+        if total <= 0:
+            return None
+        # Rounding can land a draw on a zero-weight neighbour; such draws are repeated.
+        for _ in range(_RETRIES):
+            target = rng.random() * total
+            position = -1
+            step = 1 << len(tree).bit_length()
+            while step:
+                following = position + step
+                if following < len(tree) and tree[following] <= target:
+                    target -= tree[following]
+                    position = following
+                step >>= 1
+            slot = min(position + 1, len(tree) - 1)
+            if self.weights[slot] > 0:
+                return self.handles[slot]
+        return None
+
+class PlaybackQueue:
+    """
+    One listener's queue over a shared SongPool, in one of two modes:
+    - "shuffle": every playable song once per cycle, in random order. The Fisher-Yates
+      permutation is built lazily: only the positions touched by a draw are stored (in a
+      dict), so a draw is O(1) and nothing is copied up front. Songs added mid-cycle
+      join the current cycle; a removal may skip or repeat one song in it.
+    - "weighted": independent draws favouring higher ratings (SongPool.sample, O(log n)).
+    In both modes songs played within the last `window` plays are redrawn (a bounded
+    number of times). The window starts from the end of the PlaybackHistory, and every
+    track handed out by next_track() is recorded in that history.
+    Blocked songs are never returned.
+    """
+    MODES = ("shuffle", "weighted")
+
+    def __init__(self, pool, mode="shuffle", window=20, history=None, rng=None):
+        if mode not in self.MODES:
+            raise ValueError(f"mode must be one of {', '.join(self.MODES)}")
+        self.pool = pool
+        self.mode = mode
+        self.window = window
+        self.history = history
+        self.rng = rng if rng is not None else random.Random()
+        # Lazy Fisher-Yates state: positions [0, _drawn) are done for this cycle, and
+        # _swaps holds every position whose slot differs from the identity permutation.
+        self._swaps = {}
+        self._drawn = 0
+        # No-repeat window of recently played handles, so songs sharing a title do not
+        # block each other.
+        self._recent = deque()
+        self._recent_counts = {}
+        # Handles already drawn by upcoming() and not yet played.
+        self._upcoming = deque()
+        if history is not None and window:
+            self._remember_titles(history.last(window))
+
+    def _remember_titles(self, titles):
+        """Seeds the window from plays recorded as titles (every pooled song with that title)."""
+        if not titles:
+            return
+        wanted = set(titles)
+        by_title = {}
+        store_titles = self.pool.store.titles
+        for handle in self.pool.handles:
+            title = store_titles[handle]
+            if title in wanted:
+                by_title.setdefault(title, []).append(handle)
+        for title in titles:
+            for handle in by_title.get(title, ()):
+                self._remember(handle)
+
+    def _remember(self, handle):
+        self._recent.append(handle)
+        self._recent_counts[handle] = self._recent_counts.get(handle, 0) + 1
+        if len(self._recent) > self.window:
+            oldest = self._recent.popleft()
+            count = self._recent_counts[oldest] - 1
+            if count:
+                self._recent_counts[oldest] = count
+            else:
+                del self._recent_counts[oldest]
+
+    def _is_recent(self, handle):
+        return handle in self._recent_counts
+
+    # O(1) expected time per draw (plus one step per blocked song skipped).
+    def _draw_shuffled(self):
+        pool = self.pool
+        if pool.total_weight <= 0:
+            return None
+        swaps = self._swaps
+        retries = 0
+        while True:
+            size = len(pool)
+            if self._drawn >= size:
+                # New cycle: back to the identity permutation.
+                swaps.clear()
+                self._drawn = 0
+            drawn = self._drawn
+            chosen = self.rng.randrange(drawn, size)
+            slot = swaps.get(chosen, chosen)
+            swaps[chosen] = swaps.get(drawn, drawn)
+            swaps[drawn] = slot
+            self._drawn = drawn + 1
+            if slot >= size or not pool.eligible(slot):
+                # Removed from the pool or blocked: done for this cycle.
+                continue
+            handle = pool.handles[slot]
+            if retries < _RETRIES and self._is_recent(handle):
+                # Put it back among the undrawn positions and draw again.
+                self._drawn = drawn
+                retries += 1
+                continue
+            return handle
+
+    # O(log n) time per draw.
+    def _draw_weighted(self):
+        handle = None
+        for _ in range(_RETRIES + 1):
+            handle = self.pool.sample(self.rng)
+            if handle is None or not self._is_recent(handle):
+                return handle
+        return handle
+
+    def _draw(self):
+        return self._draw_shuffled() if self.mode == "shuffle" else self._draw_weighted()
+
+    def _playable(self, handle):
+        pool = self.pool
+        return handle in pool and pool.eligible(pool._slot_of[handle])
+
+    def upcoming(self, count=10):
+        """The next `count` tracks as {"id", "metadata"} entries, without playing them."""
+        self.pool.refresh()
+        upcoming = deque(handle for handle in self._upcoming if self._playable(handle))
+        while len(upcoming) < count:
+            handle = self._draw()
+            if handle is None:
+                break
+            upcoming.append(handle)
+        self._upcoming = upcoming
+        return [self._entry(handle) for handle in list(upcoming)[:count]]
+
+    def next_track(self):
+        """
+        Picks and plays the next track: returns its {"id", "metadata"} entry and records
+        it in the no-repeat window and the PlaybackHistory. None when nothing is playable.
+        """
+        self.pool.refresh()
+        handle = None
+        while self._upcoming:
+            candidate = self._upcoming.popleft()
+            if self._playable(candidate):
+                handle = candidate
+                break
+        if handle is None:
+            handle = self._draw()
+            if handle is None:
+                return None
+        self._remember(handle)
+        if self.history is not None:
+            self.history.add_played_song(self.pool.store.titles[handle])
+        return self._entry(handle)
+
+    def _entry(self, handle):
+        store = self.pool.store
+        return {"id": store.song_ids[handle], "metadata": store.metadata(handle)}
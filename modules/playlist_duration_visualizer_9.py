@@ -8,32 +8,23 @@ class PlayDurationVisualizer:
         # The PlaylistEngine instance to be analyzed.
         self.engine = playlist_engine
 
-    # O(n) time, O(1) space, where n is the number of songs.
+    # O(1) time and space: the engine maintains the total and the min/max incrementally,
+    # including duration edits made through the store (SongStore.update_song, lookup syncs).
     def get_duration_summary(self):
         """
         Calculates and returns a summary of the playlist's total playtime,
         as well as the shortest and longest songs.
+        When several songs share the extreme duration, the earliest added one is reported.
         """
-        current = self.engine.head
-        if not current:
+        index = self.engine.duration_index
+        if not index.count:
             # Return an empty summary if the playlist is empty.
             return {"total": 0, "longest": None, "shortest": None}
 
-        total = 0
-        min_song = {"title": current.title, "duration": current.duration}
-        max_song = {"title": current.title, "duration": current.duration}
-
-        while current:
-            # Iterate through the linked list to calculate totals and find min/max.
-            total += current.duration
-            if current.duration < min_song["duration"]:
-                min_song = {"title": current.title, "duration": current.duration}
-            if current.duration > max_song["duration"]:
-                max_song = {"title": current.title, "duration": current.duration}
-            current = current.next
-
+        min_song = index.shortest()
+        max_song = index.longest()
         return {
-            "total_playtime_sec": total,
-            "shortest_song": min_song,
-            "longest_song": max_song
+            "total_playtime_sec": index.total,
+            "shortest_song": {"title": min_song.title, "duration": min_song.duration},
+            "longest_song": {"title": max_song.title, "duration": max_song.duration}
         }
\ No newline at end of file
@@ -1,92 +1,526 @@
+import random
+from array import array
+from itertools import islice
+
+from modules.song_store_10 import SongStore
+from modules.duration_index_11 import DurationIndex
+from modules.artist_index_21 import PlaylistHandleIndex
+
 class SongNode:
-    """Represents a single song in the doubly linked list."""
-    def __init__(self, title, artist, duration):
-        self.title = title
-        self.artist = artist
-        self.duration = duration
+    """
+    Represents a single song in the doubly linked list.
+    Each node is also a node of the order-statistic treap that indexes playlist positions.
+    Metadata is not copied into the node: it holds a handle into the shared SongStore.
+    """
+    __slots__ = ("store", "handle", "prev", "next", "left", "right", "parent", "priority", "size")
+
+    def __init__(self, store, handle):
+        self.store = store
+        self.handle = handle
         self.prev = None
         self.next = None
+        # Treap links: ordered by playlist position, heap-ordered by priority.
+        self.left = None
+        self.right = None
+        self.parent = None
+        self.priority = random.random()
+        # Number of nodes in the subtree rooted here (used for positional lookups).
+        self.size = 1
+
+    @property
+    def title(self):
+        return self.store.titles[self.handle]
+
+    @property
+    def artist(self):
+        store = self.store
+        return store.artist_names[store.artist_ids[self.handle]]
+
+    @property
+    def duration(self):
+        return self.store.durations[self.handle]
+
+def _size(node):
+    return node.size if node else 0
+
+def _update(node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+
+def _build_treap(nodes):
+    """
+    Builds a treap over nodes already in positional order in O(m), using the right-spine
+    stack of Cartesian-tree construction. A node's subtree spans the positions between its
+    nearest higher-priority neighbours, which gives its size without a second pass.
+    Returns the root.
+    """
+    stack = []
+    # start[i]: first position covered by node i's subtree.
+    start = [0] * len(nodes)
+    for i, node in enumerate(nodes):
+        priority = node.priority
+        last = None
+        while stack and nodes[stack[-1]].priority < priority:
+            last = stack.pop()
+            nodes[last].size = i - start[last]
+        if last is not None:
+            child = nodes[last]
+            node.left = child
+            child.parent = node
+        if stack:
+            parent = nodes[stack[-1]]
+            parent.right = node
+            node.parent = parent
+            start[i] = stack[-1] + 1
+        stack.append(i)
+    for i in stack:
+        nodes[i].size = len(nodes) - start[i]
+    root = nodes[stack[0]]
+    root.parent = None
+    return root
 
 class PlaylistEngine:
     """
     Manages the playlist using a doubly linked list data structure.
+    An implicit treap (order-statistic tree keyed by position) over the same nodes
+    gives O(log n) expected time for positional access, deletion and moves.
+    Reversal is lazy: the nodes keep their physical order and an orientation flag
+    decides which end is the head, so `prev`/`next` links are physical, not logical.
     """
-    def __init__(self):
-        self.head = None
-        self.tail = None
+    def __init__(self, store=None, journal=None):
+        # Shared song metadata; a private store is created when none is given.
+        self.store = store if store is not None else SongStore()
+        # Optional ChangeJournal that records every mutation.
+        self.journal = journal
+        # Physical ends of the linked list; use `head`/`tail` for the logical ends.
+        self._first = None
+        self._last = None
         self.size = 0
+        # Root of the order-statistic treap.
+        self._root = None
+        # True when the logical order is the reverse of the physical order.
+        self._reversed = False
+        # Running duration total plus min/max, kept current on add and delete.
+        self._duration_index = DurationIndex()
+        # Secondary indexes notified on every add/delete through add(node)/remove(node),
+        # and through update(node, field, old_value, new_value) when a listed song's
+        # title, artist or duration is edited in the store.
+        self._indexes = [self._duration_index]
+        # Handles (in physical order) restored from disk whose nodes are not built yet.
+        self._pending = None
+        # Playlist nodes per handle; attached on the first nodes_of() call or store edit.
+        self._handle_index = None
+        self.store.attach_index(self)
+
+    @property
+    def head(self):
+        """The first song in playlist order (respects reversal)."""
+        self._ensure_loaded()
+        return self._last if self._reversed else self._first
+
+    @property
+    def tail(self):
+        """The last song in playlist order (respects reversal)."""
+        self._ensure_loaded()
+        return self._first if self._reversed else self._last
+
+    @property
+    def is_reversed(self):
+        """True when the playlist is currently reversed relative to its physical order."""
+        return self._reversed
 
-    def add_song(self, title, artist, duration):
-        """Adds a new song to the end of the playlist."""
-        new_node = SongNode(title, artist, duration)
-        if not self.head:
-            self.head = self.tail = new_node
+    @property
+    def duration_index(self):
+        """Running duration total plus min/max, kept current on add and delete."""
+        self._ensure_loaded()
+        return self._duration_index
+
+    # O(n) time to visit every song, O(1) space.
+    def __iter__(self):
+        """Yields the song nodes in playlist order, honouring the orientation flag."""
+        self._ensure_loaded()
+        if self._reversed:
+            current = self._last
+            while current:
+                yield current
+                current = current.prev
+        else:
+            current = self._first
+            while current:
+                yield current
+                current = current.next
+
+    # O(n) time to visit every song, O(1) space.
+    def iter_songs(self, blocklist=None):
+        """
+        Lazily yields the song nodes in playlist order. With an ArtistBlocklist, songs by
+        blocked artists are skipped; the check runs on the handle, before any metadata is read.
+        """
+        if blocklist is None:
+            return iter(self)
+        blocked = blocklist.is_song_blocked
+        return (node for node in self if not blocked(node.handle))
+
+    # O(log n + k) expected time for k songs, O(1) space.
+    def iter_range(self, start, stop=None, blocklist=None):
+        """
+        Lazily yields the song nodes at playlist positions [start, stop) (to the end when
+        stop is None), optionally skipping blocked artists. The first node is found through
+        the treap; the rest are reached by following the list links.
+        """
+        stop = self.size if stop is None else min(stop, self.size)
+        start = max(0, start)
+        if start >= stop:
+            return
+        self._ensure_loaded()
+        blocked = blocklist.is_song_blocked if blocklist is not None else None
+        current = self._node_at(self._physical(start))
+        for _ in range(stop - start):
+            if blocked is None or not blocked(current.handle):
+                yield current
+            current = current.prev if self._reversed else current.next
+
+    # O(log n) expected time for the treap merge, O(1) for the list append.
+    def add_song(self, title, artist, duration, song_id=None):
+        """
+        Adds a new song to the end of the playlist and returns its node.
+        Raises ValueError if the song ID is already taken; use add_handle to list a
+        stored song again.
+        """
+        handle = self.store.add_song(title, artist, duration, song_id=song_id)
+        return self.add_handle(handle)
+
+    # O(log n) expected time for the treap merge, O(1) for the list append.
+    def add_handle(self, handle):
+        """Appends a song that already exists in the store and returns its node."""
+        self._ensure_loaded()
+        new_node = SongNode(self.store, handle)
+        if self._reversed:
+            # The logical end is the physical front.
+            self._insert_at(0, new_node)
         else:
-            self.tail.next = new_node
-            new_node.prev = self.tail
-            self.tail = new_node
+            if not self._first:
+                self._first = self._last = new_node
+            else:
+                self._last.next = new_node
+                new_node.prev = self._last
+                self._last = new_node
+            self._root = self._merge(self._root, new_node)
+            self._root.parent = None
         self.size += 1
+        for attached in self._indexes:
+            attached.add(new_node)
+        if self.journal is not None:
+            store = self.store
+            self.journal.record("playlist.add", store.titles[handle], store.artist(handle),
+                                store.durations[handle], store.song_ids[handle])
+        return new_node
+
+    # O(m) time for m songs (plus O(log n) to join with the existing playlist).
+    def extend_handles(self, handles):
+        """
+        Appends many stored songs at once. The new nodes are linked in one pass and
+        assembled into a treap in linear time (Cartesian-tree construction over their
+        random priorities), instead of m separate merges.
+        """
+        self._ensure_loaded()
+        nodes = [SongNode(self.store, handle) for handle in handles]
+        if not nodes:
+            return
+        self._append_block(nodes)
+        if self.journal is not None:
+            store = self.store
+            for node in nodes:
+                handle = node.handle
+                self.journal.record("playlist.add", store.titles[handle], store.artist(handle),
+                                    store.durations[handle], store.song_ids[handle])
+
+    # O(1) time; the nodes are built on first use.
+    def restore_handles(self, handles, reversed_order=False):
+        """
+        Loads an empty playlist from stored handles in physical order (as returned by
+        physical_handles) and the saved orientation. Nodes, the treap and the attached
+        indexes are only built when the playlist is first traversed or modified.
+        """
+        if self.size:
+            raise ValueError("restore_handles requires an empty playlist")
+        self._pending = handles
+        self.size = len(handles)
+        self._reversed = reversed_order
+
+    # O(n) time.
+    def physical_handles(self):
+        """Returns the song handles in physical (unreversed) order as an array."""
+        if self._pending is not None:
+            return array('q', self._pending)
+        handles = array('q')
+        current = self._first
+        while current:
+            handles.append(current.handle)
+            current = current.next
+        return handles
+
+    # O(log n) expected time.
+    def get_at(self, index):
+        """Returns the song node at a given index, or None if the index is out of range."""
+        if index < 0 or index >= self.size:
+            return None
+        self._ensure_loaded()
+        return self._node_at(self._physical(index))
 
+    # O(log n) expected time.
     def delete_song(self, index):
         """Deletes a song at a given index."""
         if index < 0 or index >= self.size:
             return
-        current = self.head
-        for _ in range(index):
-            current = current.next
-        if current.prev:
-            current.prev.next = current.next
-        else:
-            self.head = current.next
-        if current.next:
-            current.next.prev = current.prev
-        else:
-            self.tail = current.prev
+        self._ensure_loaded()
+        current = self._node_at(self._physical(index))
+        self._unlink(current)
+        self._detach(current)
         self.size -= 1
+        for attached in self._indexes:
+            attached.remove(current)
+        if self.journal is not None:
+            self.journal.record("playlist.delete", index)
+
+    # O(log n) expected time.
+    def index_of(self, node):
+        """Returns the current playlist index of a node in this playlist (walks up the treap)."""
+        self._ensure_loaded()
+        position = _size(node.left)
+        while node.parent:
+            if node.parent.right is node:
+                position += _size(node.parent.left) + 1
+            node = node.parent
+        return self._physical(position)
+
+    # O(log n) expected time.
+    def delete_node(self, node):
+        """Deletes a specific song node (e.g. one found through a secondary index)."""
+        self.delete_song(self.index_of(node))
 
+    # O(log n) expected time.
     def move_song(self, from_index, to_index):
         """Moves a song from one index to another."""
         if from_index == to_index or from_index < 0 or to_index < 0 or from_index >= self.size or to_index >= self.size:
             return
 
+        self._ensure_loaded()
         # Isolate the song node to be moved
-        current = self.head
-        for _ in range(from_index):
-            current = current.next
+        current = self._node_at(self._physical(from_index))
+        self._unlink(current)
+        self._detach(current)
 
-        if current.prev:
-            current.prev.next = current.next
-        else:
-            self.head = current.next
-        if current.next:
-            current.next.prev = current.prev
+        # Insert the song node so that it ends up at to_index. The size is unchanged,
+        # so the same index mapping applies to the destination.
+        self._insert_at(self._physical(to_index), current)
+        if self.journal is not None:
+            self.journal.record("playlist.move", from_index, to_index)
+
+    # O(1) time: only the orientation flag changes.
+    def reverse_playlist(self):
+        """Reverses the order of the playlist."""
+        self._reversed = not self._reversed
+        if self.journal is not None:
+            self.journal.record("playlist.reverse")
+
+    # O(n) time to load the existing songs into the index.
+    def attach_index(self, index):
+        """
+        Registers a secondary index exposing add(node) and remove(node).
+        It is filled with the current songs and then kept up to date on every add and delete.
+        """
+        self._ensure_loaded()
+        for node in self:
+            index.add(node)
+        self._indexes.append(index)
+
+    # O(i) time, where i is the number of attached indexes.
+    def detach_index(self, index):
+        """Stops notifying a previously attached index."""
+        self._indexes.remove(index)
+
+    # O(c) time for c copies of the song; O(n) for the first call.
+    def nodes_of(self, handle):
+        """The playlist nodes currently holding a stored song."""
+        if self._handle_index is None:
+            self._handle_index = PlaylistHandleIndex()
+            self.attach_index(self._handle_index)
+        return self._handle_index.nodes_of(handle)
+
+    # O(c * i) time (store hook).
+    def reassign(self, handle, old_artist_id, new_artist_id):
+        names = self.store.artist_names
+        self.changed(handle, "artist", names[old_artist_id], names[new_artist_id])
+
+    # O(c * i) time for c copies of the song and i attached indexes (store hook).
+    def changed(self, handle, field, old_value, new_value):
+        """Passes an edit of a stored song on to the indexes of every node holding it."""
+        if self._pending is not None:
+            # No index is filled yet; the nodes are indexed with their new values when built.
+            return
+        for node in self.nodes_of(handle):
+            for index in self._indexes:
+                index.update(node, field, old_value, new_value)
+
+    def _ensure_loaded(self):
+        """Builds the nodes for handles passed to restore_handles, if any are pending."""
+        if self._pending is None:
+            return
+        pending = self._pending
+        self._pending = None
+        self.size = 0
+        nodes = [SongNode(self.store, handle) for handle in pending]
+        if self._reversed:
+            # _append_block expects playlist order.
+            nodes.reverse()
+        if nodes:
+            self._append_block(nodes)
+
+    def _append_block(self, nodes):
+        """Joins new nodes, given in playlist order, to the logical end of the playlist."""
+        if self._reversed:
+            # The logical end is the physical front, so the block goes there backwards.
+            nodes.reverse()
+        for previous, node in zip(nodes, islice(nodes, 1, None)):
+            previous.next = node
+            node.prev = previous
+        block = _build_treap(nodes)
+        if self._reversed:
+            if self._first:
+                nodes[-1].next = self._first
+                self._first.prev = nodes[-1]
+            else:
+                self._last = nodes[-1]
+            self._first = nodes[0]
+            self._root = self._merge(block, self._root)
         else:
-            self.tail = current.prev
+            if self._last:
+                self._last.next = nodes[0]
+                nodes[0].prev = self._last
+            else:
+                self._first = nodes[0]
+            self._last = nodes[-1]
+            self._root = self._merge(self._root, block)
+        self._root.parent = None
+        self.size += len(nodes)
+        if self._reversed:
+            nodes.reverse()
+        for attached in self._indexes:
+            for node in nodes:
+                attached.add(node)
+
+    def _physical(self, index):
+        """Maps a logical playlist index to its physical position."""
+        return self.size - 1 - index if self._reversed else index
 
-        # Find the insertion point
-        target = self.head
-        for _ in range(to_index):
-            target = target.next
+    # ---- Linked list helpers ----
 
-        # Insert the song node at the new position
-        if target.prev:
-            target.prev.next = current
-            current.prev = target.prev
+    def _unlink(self, node):
+        """Removes a node from the doubly linked list (O(1))."""
+        if node.prev:
+            node.prev.next = node.next
         else:
-            self.head = current
-            current.prev = None
+            self._first = node.next
+        if node.next:
+            node.next.prev = node.prev
+        else:
+            self._last = node.prev
+        node.prev = node.next = None
 
-        current.next = target
-        target.prev = current
+    def _insert_at(self, index, node):
+        """Inserts a detached node so that it ends up at the given physical index."""
+        # The node currently at `index` becomes the new node's successor.
+        target = self._node_at(index) if index < _size(self._root) else None
+        if target:
+            if target.prev:
+                target.prev.next = node
+                node.prev = target.prev
+            else:
+                self._first = node
+            node.next = target
+            target.prev = node
+        else:
+            if self._last:
+                self._last.next = node
+                node.prev = self._last
+            else:
+                self._first = node
+            self._last = node
 
-    def reverse_playlist(self):
-        """Reverses the order of the playlist."""
-        current = self.head
-        prev_node = None
-        while current:
-            next_node = current.next
-            current.next = current.prev
-            current.prev = next_node
-            prev_node = current
-            current = next_node
-        self.head, self.tail = self.tail, self.head
\ No newline at end of file
+        left, right = self._split(self._root, index)
+        self._root = self._merge(self._merge(left, node), right)
+        self._root.parent = None
+
+    # ---- Treap helpers ----
+
+    def _node_at(self, index):
+        """Descends the treap using subtree sizes to find the node at a position."""
+        node = self._root
+        while node:
+            left_size = _size(node.left)
+            if index < left_size:
+                node = node.left
+            elif index == left_size:
+                return node
+            else:
+                index -= left_size + 1
+                node = node.right
+        return None
+
+    def _merge(self, a, b):
+        """Merges two treaps where every node of `a` precedes every node of `b`."""
+        if not a:
+            return b
+        if not b:
+            return a
+        if a.priority > b.priority:
+            a.right = self._merge(a.right, b)
+            a.right.parent = a
+            _update(a)
+            return a
+        b.left = self._merge(a, b.left)
+        b.left.parent = b
+        _update(b)
+        return b
+
+    def _split(self, node, count):
+        """Splits a treap into its first `count` nodes and the rest."""
+        if not node:
+            return None, None
+        left_size = _size(node.left)
+        if count <= left_size:
+            left, right = self._split(node.left, count)
+            node.left = right
+            if right:
+                right.parent = node
+            if left:
+                left.parent = None
+            _update(node)
+            return left, node
+        left, right = self._split(node.right, count - left_size - 1)
+        node.right = left
+        if left:
+            left.parent = node
+        if right:
+            right.parent = None
+        _update(node)
+        return node, right
+
+    def _detach(self, node):
+        """Removes a node from the treap by replacing it with the merge of its children."""
+        replacement = self._merge(node.left, node.right)
+        parent = node.parent
+        if replacement:
+            replacement.parent = parent
+        if parent is None:
+            self._root = replacement
+        else:
+            if parent.left is node:
+                parent.left = replacement
+            else:
+                parent.right = replacement
+            while parent:
+                parent.size -= 1
+                parent = parent.parent
+        node.left = node.right = node.parent = None
+        node.size = 1
\ No newline at end of file
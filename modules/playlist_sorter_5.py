@@ -1,50 +1,136 @@
-# playlist_sorter_5.py - Sort Playlist using Merge Sort
+# playlist_sorter_5.py - Sort Playlist with a key-once, multi-key sort engine
+
+import heapq
+from operator import itemgetter
+
+class _Descending:
+    """Wraps a sort key so that it orders in reverse (for non-numeric keys in composite tuples)."""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return isinstance(other, _Descending) and self.value == other.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+def _id_order(song_id):
+    """
+    Sort key for song IDs: int IDs first, then str IDs, then songs without an ID (None),
+    so a library mixing int and str IDs still sorts.
+    """
+    if song_id is None:
+        return (True, True, "")
+    return (False, isinstance(song_id, str), song_id)
+
+def _field_key(field):
+    """Key callable reading one field of a song dict (IDs ordered with _id_order)."""
+    if field == "id":
+        return lambda song: _id_order(song["id"])
+    return itemgetter(field)
 
 class PlaylistSorter:
     """
-    Sorts a list of songs using the Merge Sort algorithm.
+    Sorts lists of songs using Python's built-in Timsort.
+    Sort keys are extracted once per song (key= callables), ordering is stable, and several
+    keys can be combined, e.g. artist, then duration descending, then title.
     """
     # O(n log n) time, O(n) space complexity
     def merge_sort(self, songs, key, reverse=False):
         """
-        Recursively sorts a list of songs by a given key.
+        Sorts a list of songs by a given key.
+        Kept for backwards compatibility; it no longer recurses or slices the list.
         """
-        # Base case for recursion: a list of one or zero elements is already sorted.
-        if len(songs) <= 1:
-            return songs
+        return self.sort_by(songs, [(key, reverse)])
 
-        # Divide the list into two halves.
-        mid = len(songs) // 2
-        left = self.merge_sort(songs[:mid], key, reverse)
-        right = self.merge_sort(songs[mid:], key, reverse)
-
-        # Conquer: merge the sorted halves.
-        return self._merge(left, right, key, reverse)
-
-    def _merge(self, left, right, key, reverse):
+    # O(k * n log n) time for k sort keys, O(n) space complexity
+    def sort_by(self, songs, keys):
         """
-        Merges two sorted sublists into a single sorted list.
+        Returns a new list of songs sorted by several keys, most significant first.
+        Each key is a field name or a (field, descending) pair. The sort is stable.
         """
-        result = []
-        i = j = 0
+        result = list(songs)
+        # Stable sorts applied from the least to the most significant key compose
+        # into a multi-key ordering, with a direction per key.
+        for field, descending in reversed(self.normalize_keys(keys)):
+            result.sort(key=_field_key(field), reverse=descending)
+        return result
 
-        # Compare elements from both lists and add the smaller/larger to the result.
-        while i < len(left) and j < len(right):
-            if (left[i][key] < right[j][key] and not reverse) or (left[i][key] > right[j][key] and reverse):
-                result.append(left[i])
-                i += 1
-            else:
-                result.append(right[j])
-                j += 1
+    # O(n log k) time, O(k) space complexity
+    def partial_sort(self, songs, k, keys="title"):
+        """
+        Returns only the first k songs of the sorted order, using a bounded heap
+        instead of sorting the whole list. Ties keep their input order.
+        """
+        return heapq.nsmallest(k, songs, key=self._composite_key(self.normalize_keys(keys)))
 
-        # Append any remaining elements.
-        result.extend(left[i:])
-        result.extend(right[j:])
+    # O(k * n log n) time for k sort keys, O(n) space complexity
+    def sort_handles(self, store, handles, keys):
+        """
+        Sorts SongStore handles by reading keys straight from the store's columns,
+        avoiding per-song dicts entirely. Returns a new list of handles.
+        Supported fields: title, artist, duration, rating and id.
+        """
+        result = list(handles)
+        for field, descending in reversed(self.normalize_keys(keys)):
+            result.sort(key=self._column_key(store, field), reverse=descending)
         return result
 
     # Entry point for the sorting process.
     def sort_playlist(self, songs, key="title", reverse=False):
         """
         Public method to sort the playlist. Defaults to sorting by title.
+        `key` may also be a list of fields or (field, descending) pairs for a multi-key sort,
+        in which case `reverse` flips every key.
         """
-        return self.merge_sort(songs, key, reverse)
\ No newline at end of file
+        if isinstance(key, str):
+            return self.sort_by(songs, [(key, reverse)])
+        keys = self.normalize_keys(key)
+        if reverse:
+            keys = [(field, not descending) for field, descending in keys]
+        return self.sort_by(songs, keys)
+
+    def normalize_keys(self, keys):
+        """Turns a field name or a list of fields / (field, descending) pairs into pairs."""
+        if isinstance(keys, str):
+            return [(keys, False)]
+        return [(k, False) if isinstance(k, str) else (k[0], bool(k[1])) for k in keys]
+
+    def _composite_key(self, keys):
+        """Builds a single tuple key for heap-based selection; numeric keys are negated to descend."""
+        def composite(song):
+            parts = []
+            for field, descending in keys:
+                value = _id_order(song[field]) if field == "id" else song[field]
+                if descending:
+                    value = -value if isinstance(value, (int, float)) else _Descending(value)
+                parts.append(value)
+            return tuple(parts)
+        return composite
+
+    def _column_key(self, store, field):
+        """Returns a key callable over handles for one store column."""
+        if field == "title":
+            return store.titles.__getitem__
+        if field == "duration":
+            return store.durations.__getitem__
+        if field == "rating":
+            return store.ratings.__getitem__
+        if field == "id":
+            song_ids = store.song_ids
+            return lambda handle: _id_order(song_ids[handle])
+        if field == "artist":
+            # Rank the (small) interned artist table once, then compare integers per song.
+            names = store.artist_names
+            order = sorted(range(len(names)), key=names.__getitem__)
+            rank = [0] * len(names)
+            for position, artist_id in enumerate(order):
+                rank[artist_id] = position
+            artist_ids = store.artist_ids
+            return lambda handle: rank[artist_ids[handle]]
+        raise KeyError(field)
\ No newline at end of file
@@ -0,0 +1,242 @@
+# playwise_server_17.py - Asyncio JSON Lines Server for PlayWise
+
+import argparse
+import asyncio
+import json
+from functools import partial
+
+from modules.bulk_ingest_15 import ingest_songs
+from modules.playback_history_2 import DEFAULT_CAPACITY
+
+# Protocol: each request is one JSON object per line, {"id": ..., "op": ..., ...}
+# (e.g. {"id": 7, "op": "add", "title": ..., "artist": ..., "duration": ..., "song_id": ..., "rating": ...});
+# each response is one line {"id": ..., "ok": true, "result": ...} or
+# {"id": ..., "ok": false, "error": ...}. Responses come back in request order, so a
+# client may pipeline any number of requests without waiting for replies.
+
+def _sort(playwise, request):
+    keys = request.get("keys") or [(request.get("key", "title"), bool(request.get("reverse", False)))]
+    songs = playwise.get_sorted_playlist(keys)
+    limit = request.get("limit")
+    return songs if limit is None else songs[:limit]
+
+def _page(playwise, request):
+    return playwise.page_sorted(request.get("field", "title"), request.get("offset", 0),
+                                request.get("limit", 50), bool(request.get("descending", False)))
+
+def _block(playwise, request):
+    # With "purge": true the artist's songs are removed; the result is the number purged.
+    purged = playwise.block_artist(request["artist"], purge=bool(request.get("purge")))
+    return purged if request.get("purge") else True
+
+def _unblock(playwise, request):
+    playwise.artist_blocklist.unblock_artist(request["artist"])
+    return True
+
+# One handler per menu operation; "add" is handled separately so runs of adds can be batched.
+HANDLERS = {
+    "ping": lambda playwise, request: "pong",
+    "get_by_id": lambda playwise, request: playwise.song_lookup.get_by_id(request["song_id"]),
+    "get_by_title": lambda playwise, request: playwise.song_lookup.get_by_title(request["title"]),
+    "snapshot": lambda playwise, request: playwise.export_snapshot(),
+    "metrics": lambda playwise, request: playwise.export_metrics(request.get("format", "json")),
+    "search_by_rating": lambda playwise, request: playwise.search_by_rating(request["rating"]),
+    "cache_stats": lambda playwise, request: playwise.result_cache.stats(),
+    "next_track": lambda playwise, request: playwise.next_track(request.get("listener", "default"),
+                                                                request.get("mode")),
+    "upcoming": lambda playwise, request: playwise.playback_queue(
+        request.get("listener", "default"), request.get("mode")).upcoming(request.get("count", 10)),
+    "block": _block,
+    "unblock": _unblock,
+    "blocked": lambda playwise, request: sorted(playwise.artist_blocklist.get_all_blocked()),
+    "duration_summary": lambda playwise, request: playwise.get_duration_summary(),
+    "sort": _sort,
+    "page": _page,
+}
+
+# Slow operations that never touch the live PlayWise state; they run in the default
+# executor's worker threads so the event loop keeps serving every other client meanwhile.
+BACKGROUND_HANDLERS = {
+    "analyze": lambda playwise, request: playwise.analyze_performance(),
+}
+
+class PlayWiseServer:
+    """
+    Serves one PlayWise instance to many clients over TCP or a Unix socket.
+    All requests run on the event loop thread, so PlayWise needs no locking.
+    - Pipelining: each connection has a reader task feeding a bounded queue of
+      request batches and a worker task answering requests in order.
+    - Batching: consecutive "add" requests within a batch (up to `batch_size`
+      requests) are applied with one bulk ingest.
+    - Backpressure: when the queue is full the reader stops reading the socket, and
+      the worker waits for the transport to drain before taking more requests.
+    """
+    READ_SIZE = 1 << 16
+    # Longest request line accepted; longer lines close the connection.
+    MAX_LINE = 1 << 20
+
+    def __init__(self, playwise, queue_size=64, batch_size=512):
+        self.playwise = playwise
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+
+    async def start(self, host="127.0.0.1", port=8765, path=None):
+        """Starts listening on a Unix socket (when `path` is given) or TCP; returns the asyncio server."""
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle_connection, path=path)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def handle_connection(self, reader, writer):
+        queue = asyncio.Queue(self.queue_size)
+        worker = asyncio.create_task(self._answer(queue, writer))
+        partial = b""
+        try:
+            while True:
+                # Read whatever has arrived and queue its complete lines as one batch,
+                # so a pipelined burst costs one queue round trip rather than one per request.
+                chunk = await reader.read(self.READ_SIZE)
+                if not chunk:
+                    break
+                lines = (partial + chunk).split(b"\n")
+                partial = lines.pop()
+                if len(partial) > self.MAX_LINE:
+                    break
+                if lines:
+                    await queue.put(lines)
+        except ConnectionError:
+            pass
+        except asyncio.CancelledError:
+            worker.cancel()
+            writer.close()
+            raise
+        await queue.put(None)
+        await worker
+        writer.close()
+
+    async def _answer(self, queue, writer):
+        connected = True
+        while True:
+            lines = await queue.get()
+            if lines is None:
+                return
+            # Requests are still applied after the client disconnects, so the reader
+            # never blocks on a full queue; only the responses are dropped.
+            for start in range(0, len(lines), self.batch_size):
+                parts = []
+                for part in self.respond(lines[start:start + self.batch_size]):
+                    if not isinstance(part, str):
+                        # A background operation: wait for it without blocking the loop.
+                        part = await asyncio.get_running_loop().run_in_executor(None, part)
+                    parts.append(part)
+                responses = "".join(parts)
+                if connected:
+                    writer.write(responses.encode("utf-8"))
+                    try:
+                        await writer.drain()
+                    except ConnectionError:
+                        connected = False
+
+    # O(b) requests handled per call; runs of adds cost one bulk ingest.
+    def respond(self, lines):
+        """
+        Answers a batch of raw request lines in order; yields response lines, or for a
+        background operation a callable returning its response line (the caller runs it
+        in an executor).
+        """
+        adds = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                op = request["op"]
+                if not isinstance(op, str):
+                    raise TypeError("op must be a string")
+            except (ValueError, TypeError, KeyError):
+                yield from self._flush_adds(adds)
+                yield _encode({"id": None, "ok": False, "error": "malformed request"})
+                continue
+            if op == "add":
+                adds.append(request)
+                continue
+            yield from self._flush_adds(adds)
+            handler = HANDLERS.get(op)
+            if handler is not None:
+                yield self._call(handler, request)
+            elif op in BACKGROUND_HANDLERS:
+                yield partial(self._call, BACKGROUND_HANDLERS[op], request)
+            else:
+                yield _encode({"id": request.get("id"), "ok": False, "error": f"unknown op {op!r}"})
+        yield from self._flush_adds(adds)
+
+    def _call(self, handler, request):
+        """Runs one handler and returns its response line."""
+        try:
+            result = handler(self.playwise, request)
+        except (KeyError, TypeError, ValueError, IndexError) as error:
+            return _encode({"id": request.get("id"), "ok": False, "error": f"bad request: {error!r}"})
+        except Exception as error:
+            # Any other failure is reported too; an exception escaping here would end
+            # the connection's _answer task and leave the client without replies.
+            return _encode({"id": request.get("id"), "ok": False, "error": f"request failed: {error!r}"})
+        return _encode({"id": request.get("id"), "ok": True, "result": result})
+
+    def _flush_adds(self, adds):
+        if not adds:
+            return
+        rows = [(request.get("title"), None if request.get("artist") is None else str(request["artist"]),
+                 request.get("duration"), request.get("rating"), request.get("song_id")) for request in adds]
+        try:
+            # Every row is validated before anything is stored (see ingest_songs).
+            report = ingest_songs(self.playwise, rows)
+        except Exception as error:
+            for request in adds:
+                yield _encode({"id": request.get("id"), "ok": False, "error": f"request failed: {error!r}"})
+            adds.clear()
+            return
+        reasons = {rejected["row"]: rejected["reason"] for rejected in report["rejected"]}
+        for row, request in enumerate(adds):
+            reason = reasons.get(row)
+            if reason == "invalid":
+                yield _encode({"id": request.get("id"), "ok": False, "error": "invalid song"})
+            elif reason == "duplicate":
+                yield _encode({"id": request.get("id"), "ok": False, "error": "duplicate song ID"})
+            else:
+                # Like add_song_safe: False means the artist is blocked.
+                yield _encode({"id": request.get("id"), "ok": True, "result": reason is None})
+        adds.clear()
+
+def _encode(response):
+    return json.dumps(response, default=str) + "\n"
+
+def serve(playwise, host="127.0.0.1", port=8765, path=None, **options):
+    """Runs the server until interrupted."""
+    async def run():
+        server = await PlayWiseServer(playwise, **options).start(host, port, path)
+        async with server:
+            await server.serve_forever()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+def main(factory, argv=None):
+    """
+    Command-line entry point: python playwise.py serve [--host H] [--port P] [--unix PATH]
+    [--state FILE] [--history-capacity N] [--history-spill-dir DIR].
+    `factory` is the PlayWise class to serve (its load() restores --state).
+    """
+    parser = argparse.ArgumentParser(prog="playwise.py serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--state", help="binary state file to load at startup")
+    parser.add_argument("--history-capacity", type=int, default=DEFAULT_CAPACITY,
+                        help="plays kept in memory (0 keeps every play)")
+    parser.add_argument("--history-spill-dir", help="directory for plays evicted from memory")
+    args = parser.parse_args(argv)
+    options = {"history_capacity": args.history_capacity or None, "history_spill_dir": args.history_spill_dir}
+    playwise = factory.load(args.state, **options) if args.state else factory(**options)
+    where = args.unix or f"{args.host}:{args.port}"
+    print(f"PlayWise serving JSON lines on {where}")
+    serve(playwise, args.host, args.port, args.unix)
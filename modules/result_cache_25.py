@@ -0,0 +1,95 @@
+# result_cache_25.py - Versioned LRU/TTL Cache for Query Results
+
+import time
+from collections import OrderedDict
+
+# Journal op prefixes ("playlist.add" -> "playlist"), one mutation counter each.
+DOMAINS = ("playlist", "rating", "lookup", "blocklist", "history")
+
+class ResultCache:
+    """
+    Caches derived query results (snapshots, summaries, sorted views, rating searches)
+    until the state they were computed from changes.
+    - Versioned: the cache is attached to the ChangeJournal and keeps one mutation
+      counter per domain (playlist, rating, lookup, blocklist, history). Each entry
+      remembers the counters of the domains it depends on and is recomputed when any
+      of them moved, so e.g. a play does not invalidate a sorted playlist.
+    - Bounded: at most `max_entries` results are kept, evicting the least recently used.
+    - Optional TTL: with `ttl` seconds (globally or per call) entries also expire by age.
+    Cached results are shared between callers and must be treated as read-only.
+    """
+    def __init__(self, journal, max_entries=256, ttl=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._versions = dict.fromkeys(DOMAINS, 0)
+        # key -> (dependency versions, expiry time or None, result), least recently used first.
+        self._entries = OrderedDict()
+        self._hits = {}
+        self._misses = {}
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        journal.attach(self._observe)
+
+    def __len__(self):
+        return len(self._entries)
+
+    # O(1) time (journal sink, called once per mutation).
+    def _observe(self, entry):
+        domain = entry[1].partition(".")[0]
+        self._versions[domain] = self._versions.get(domain, 0) + 1
+
+    def version(self, depends):
+        """Current mutation counters of the given domains."""
+        return tuple(self._versions[domain] for domain in depends)
+
+    # O(1) average time on a hit; the cost of `compute` on a miss.
+    def get_or_compute(self, name, args, depends, compute, ttl=None):
+        """
+        Returns the cached result of query `name` with hashable `args`, calling
+        compute() on a miss. `depends` names the domains whose changes invalidate it.
+        """
+        key = (name, args)
+        version = self.version(depends)
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry_version, expires, result = entry
+            if entry_version != version:
+                self.invalidations += 1
+            elif expires is not None and self.clock() >= expires:
+                self.expirations += 1
+            else:
+                self._entries.move_to_end(key)
+                self._hits[name] = self._hits.get(name, 0) + 1
+                return result
+        self._misses[name] = self._misses.get(name, 0) + 1
+        result = compute()
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = (version, None if ttl is None else self.clock() + ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def clear(self):
+        """Drops every cached result (the statistics are kept)."""
+        self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counts (overall and per query), hit ratio, evictions and expirations."""
+        hits = sum(self._hits.values())
+        misses = sum(self._misses.values())
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "queries": {name: {"hits": self._hits.get(name, 0), "misses": self._misses.get(name, 0)}
+                        for name in sorted(set(self._hits) | set(self._misses))}
+        }
@@ -0,0 +1,165 @@
+# sharded_service_16.py - Multi-tenant PlayWise Service with Per-shard Locks
+
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+class _Shard:
+    """A group of tenants sharing one writer lock and one published-snapshot table."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Tenant ID -> PlayWise instance (mutated only under the lock).
+        self.tenants = {}
+        # Tenant ID -> (journal version, snapshot dict). Entries are replaced, never
+        # mutated, so readers can use them without taking the lock.
+        self.published = {}
+
+class ShardedPlayWise:
+    """
+    Multi-tenant front for PlayWise: every user or playlist ID gets its own PlayWise
+    instance, and tenants are spread over `shard_count` shards by a stable hash.
+    Writes (and reads that touch live structures) hold only their shard's lock, so
+    tenants on different shards never contend. Snapshot reads are lock-free: they
+    return the last published immutable snapshot, which is republished at most once
+    per change (the first reader after a write rebuilds it under the lock).
+
+    Note: under CPython's GIL, threads on different shards do not execute Python code
+    in parallel; they scale on a free-threaded build, or across processes with one
+    ShardedPlayWise per worker owning a disjoint set of tenants (see run_benchmark).
+    """
+    def __init__(self, factory, shard_count=16):
+        # Makes the empty PlayWise instance of a new tenant.
+        self.factory = factory
+        self.shards = [_Shard() for _ in range(shard_count)]
+
+    def shard_for(self, tenant_id):
+        """Returns the shard that owns a tenant (crc32 is stable across processes)."""
+        return self.shards[zlib.crc32(str(tenant_id).encode("utf-8")) % len(self.shards)]
+
+    # O(1) time plus the cost of fn.
+    def write(self, tenant_id, fn, *args, **kwargs):
+        """Runs fn(playwise, *args, **kwargs) for a tenant under its shard's lock."""
+        shard = self.shard_for(tenant_id)
+        with shard.lock:
+            playwise = shard.tenants.get(tenant_id)
+            if playwise is None:
+                playwise = shard.tenants[tenant_id] = self.factory()
+            return fn(playwise, *args, **kwargs)
+
+    # O(1) time plus the cost of fn.
+    def read(self, tenant_id, fn, *args, **kwargs):
+        """
+        Runs fn(playwise, *args, **kwargs) under the shard's lock; returns None for an
+        unknown tenant. Live structures need the lock because lazy indexes are built on
+        first use and a concurrent writer could be mid-update.
+        """
+        shard = self.shard_for(tenant_id)
+        with shard.lock:
+            playwise = shard.tenants.get(tenant_id)
+            return None if playwise is None else fn(playwise, *args, **kwargs)
+
+    # O(1) time when the published snapshot is current.
+    def snapshot(self, tenant_id):
+        """
+        Returns the tenant's latest snapshot (treat it as read-only), without taking the
+        lock when it is current. Returns None for an unknown tenant.
+        """
+        shard = self.shard_for(tenant_id)
+        playwise = shard.tenants.get(tenant_id)
+        if playwise is None:
+            return None
+        published = shard.published.get(tenant_id)
+        if published is not None and published[0] == playwise.journal.version:
+            return published[1]
+        with shard.lock:
+            published = shard.published.get(tenant_id)
+            version = playwise.journal.version
+            if published is None or published[0] != version:
+                published = (version, playwise.export_snapshot())
+                shard.published[tenant_id] = published
+            return published[1]
+
+    # Convenience wrappers for the common operations.
+    def add_song(self, tenant_id, title, artist, duration, song_id=None, rating=None):
+        return self.write(tenant_id, lambda playwise: playwise.add_song_safe(title, artist, duration,
+                                                                              song_id=song_id, rating=rating))
+
+    def add_songs_bulk(self, tenant_id, rows):
+        return self.write(tenant_id, lambda playwise: playwise.add_songs_bulk(rows))
+
+    def play(self, tenant_id, song):
+        return self.write(tenant_id, lambda playwise: playwise.playback_history.add_played_song(song))
+
+    def block_artist(self, tenant_id, artist):
+        return self.write(tenant_id, lambda playwise: playwise.artist_blocklist.block_artist(artist))
+
+    def get_by_id(self, tenant_id, song_id):
+        return self.read(tenant_id, lambda playwise: playwise.song_lookup.get_by_id(song_id))
+
+    def tenant_ids(self):
+        """All tenant IDs created so far."""
+        return [tenant_id for shard in self.shards for tenant_id in list(shard.tenants)]
+
+def _run_workload(service, tenants, operations, read_ratio, seed):
+    """Runs a mixed read/write workload against the given tenants; returns the op count."""
+    rng = random.Random(seed)
+    songs_added = 0
+    for _ in range(operations):
+        tenant = rng.choice(tenants)
+        if rng.random() < read_ratio:
+            if rng.random() < 0.5:
+                service.snapshot(tenant)
+            else:
+                service.get_by_id(tenant, f"{seed}-{rng.randrange(songs_added + 1)}")
+        else:
+            songs_added += 1
+            service.add_song(tenant, f"Song {songs_added}", f"Artist {songs_added % 50}",
+                             120 + songs_added % 300, song_id=f"{seed}-{songs_added}", rating=1 + songs_added % 5)
+    return operations
+
+def _process_worker(factory, shard_count, tenants, operations, read_ratio, seed):
+    """One process owning its own service and a disjoint set of tenants."""
+    return _run_workload(ShardedPlayWise(factory, shard_count), tenants, operations, read_ratio, seed)
+
+# O(w * operations) total work for w workers.
+def run_benchmark(factory, worker_counts=(1, 2, 4), operations=20_000, read_ratio=0.8,
+                  tenant_count=64, shard_count=16, mode="thread"):
+    """
+    Measures mixed read/write throughput as the number of workers grows.
+    Each worker performs `operations` requests (so total work scales with the worker
+    count) against its own slice of the tenants. mode="thread" shares one service
+    between threads; mode="process" gives every worker process its own service, which
+    is how the shards scale across cores under the GIL. `factory` makes each tenant's
+    PlayWise instance (it must be picklable, e.g. a class, for mode="process").
+    Returns a list of {"workers", "ops_per_sec", "speedup"} dicts.
+    """
+    tenants = [f"user-{i}" for i in range(tenant_count)]
+    results = []
+    baseline = None
+    for workers in worker_counts:
+        slices = [tenants[i::workers] or tenants for i in range(workers)]
+        if mode == "process":
+            start = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_process_worker, factory, shard_count, slices[i], operations, read_ratio, i)
+                           for i in range(workers)]
+                total = sum(future.result() for future in futures)
+        else:
+            service = ShardedPlayWise(factory, shard_count)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_run_workload, service, slices[i], operations, read_ratio, i)
+                           for i in range(workers)]
+                total = sum(future.result() for future in futures)
+        elapsed = time.perf_counter() - start
+        ops_per_sec = total / elapsed
+        if baseline is None:
+            baseline = ops_per_sec
+        results.append({
+            "workers": workers,
+            "ops_per_sec": round(ops_per_sec),
+            "speedup": round(ops_per_sec / baseline, 2)
+        })
+    return results
@@ -1,31 +1,172 @@
+from array import array
+
+from modules.song_store_10 import SongStore
+from modules.title_search_20 import TitleSearchIndex
+
 class SongLookup:
     """
     Provides fast lookup for songs using hash maps (dictionaries).
+    The maps hold integer handles into the shared SongStore rather than metadata copies.
     """
-    def __init__(self):
-        # Hash map for O(1) lookup by song ID.
-        self.song_by_id = {}
-        # Hash map for O(1) lookup by song title.
-        self.song_by_title = {}
+    def __init__(self, store=None, journal=None):
+        # Shared song metadata; a private store is created when none is given.
+        self.store = store if store is not None else SongStore()
+        # Optional ChangeJournal that records every mutation.
+        self.journal = journal
+        # Hash map for O(1) lookup by song ID (song ID -> handle).
+        self._song_by_id = {}
+        # Hash map for O(1) lookup by song title (title -> handle).
+        self._song_by_title = {}
+        # Handles from a bulk load whose dictionaries are built on first use.
+        self._pending = None
+        # Normalized, multi-valued title index for prefix and fuzzy search; handles
+        # waiting to be indexed are kept in _title_pending until the first search.
+        self._title_index = TitleSearchIndex(self.store)
+        self._title_pending = None
+
+    @property
+    def song_by_id(self):
+        """Hash map from song ID to store handle."""
+        if self._pending is not None:
+            self._build_pending()
+        return self._song_by_id
+
+    @property
+    def song_by_title(self):
+        """Hash map from song title to store handle."""
+        if self._pending is not None:
+            self._build_pending()
+        return self._song_by_title
+
+    @property
+    def title_index(self):
+        """Search index over the titles of every synced song (duplicates included)."""
+        if self._title_pending is not None:
+            pending = self._title_pending
+            self._title_pending = None
+            self._title_index.add_many(pending)
+        return self._title_index
 
     # O(1) average time complexity for insertion.
     def sync_song(self, song_id, title, metadata):
         """
         Adds or updates a song's metadata in both lookup dictionaries.
         """
-        self.song_by_id[song_id] = metadata
-        self.song_by_title[title] = metadata
+        metadata = metadata or {}
+        handle = self.store.handle_of(song_id)
+        if handle is None:
+            # A song already added without an ID (e.g. to the playlist) is reused.
+            handle = self.store.bind_id(song_id, title)
+        if handle is None:
+            handle = self.store.add_song(title, metadata.get("artist"), metadata.get("duration"), song_id=song_id)
+        else:
+            self.store.update_song(handle, title, metadata.get("artist"), metadata.get("duration"))
+        self.sync_handle(handle)
+
+    # O(1) average time complexity for insertion.
+    def sync_handle(self, handle):
+        """
+        Indexes a song that already exists in the store under its ID and title.
+        """
+        song_id = self.store.song_ids[handle]
+        title = self.store.titles[handle]
+        self.song_by_id[song_id] = handle
+        self.song_by_title[title] = handle
+        if self._title_pending is not None:
+            self._title_pending.append(handle)
+        else:
+            self._title_index.add(handle)
+        if self.journal is not None:
+            metadata = self.store.metadata(handle)
+            self.journal.record("lookup.sync", song_id, title,
+                                {"artist": metadata["artist"], "duration": metadata["duration"]})
+
+    # O(m) time for m handles.
+    def sync_handles(self, handles):
+        """
+        Indexes many stored songs at once with two bulk dictionary updates.
+        """
+        song_ids = self.store.song_ids
+        titles = self.store.titles
+        self.song_by_id.update(zip([song_ids[handle] for handle in handles], handles))
+        self.song_by_title.update(zip([titles[handle] for handle in handles], handles))
+        if self._title_pending is not None:
+            self._title_pending.extend(handles)
+        else:
+            self._title_index.add_many(handles)
+        if self.journal is not None:
+            for handle in handles:
+                metadata = self.store.metadata(handle)
+                self.journal.record("lookup.sync", song_ids[handle], titles[handle],
+                                    {"artist": metadata["artist"], "duration": metadata["duration"]})
+
+    # O(t) time for t songs sharing the song's title.
+    def remove_handle(self, handle):
+        """
+        Removes a stored song from the lookup tables and the title index.
+        Entries that already point at another song (e.g. a newer song with the same title) are kept.
+        """
+        song_id = self.store.song_ids[handle]
+        title = self.store.titles[handle]
+        if self.song_by_id.get(song_id) == handle:
+            del self.song_by_id[song_id]
+        if self.song_by_title.get(title) == handle:
+            del self.song_by_title[title]
+        self.title_index.remove(handle)
+        if self.journal is not None:
+            self.journal.record("lookup.remove", song_id)
+
+    # O(1) time; the dictionaries are rebuilt in O(n) on first use.
+    def load_handles(self, id_handles, title_handles):
+        """
+        Bulk-loads both lookup dictionaries from the handles they should point to,
+        keyed by each song's current ID and title in the store.
+        """
+        self._pending = (id_handles, title_handles)
+        self._title_pending = array('q', id_handles)
+
+    def _build_pending(self):
+        id_handles, title_handles = self._pending
+        self._pending = None
+        song_ids = self.store.song_ids
+        titles = self.store.titles
+        self._song_by_id = dict(zip([song_ids[handle] for handle in id_handles], id_handles))
+        self._song_by_title = dict(zip([titles[handle] for handle in title_handles], title_handles))
 
     # O(1) average time complexity for lookup.
     def get_by_id(self, song_id):
         """
         Retrieves song metadata using its unique ID.
         """
-        return self.song_by_id.get(song_id)
+        handle = self.song_by_id.get(song_id)
+        return None if handle is None else self.store.metadata(handle)
 
     # O(1) average time complexity for lookup.
     def get_by_title(self, title):
         """
         Retrieves song metadata using its title.
         """
-        return self.song_by_title.get(title)
\ No newline at end of file
+        handle = self.song_by_title.get(title)
+        return None if handle is None else self.store.metadata(handle)
+
+    # O(1 + k) average time complexity, where k is the number of matching songs returned.
+    def find_by_title(self, title):
+        """
+        Returns every song whose title matches ignoring case and diacritics,
+        as {"id", "metadata"} entries in the order they were added.
+        """
+        return [self._entry(handle) for handle in self.title_index.exact(title)]
+
+    # O(log n + limit) time complexity.
+    def search_titles(self, prefix, limit=10):
+        """Autocomplete: up to `limit` songs whose normalized title starts with `prefix`."""
+        return [self._entry(handle) for handle in self.title_index.prefix(prefix, limit)]
+
+    # Bounded time: at most a fixed number of candidates are compared by edit distance.
+    def fuzzy_search(self, title, limit=10, max_distance=2):
+        """Songs whose normalized title is within `max_distance` edits, closest first."""
+        return [dict(self._entry(handle), distance=distance)
+                for handle, distance in self.title_index.fuzzy(title, limit, max_distance)]
+
+    def _entry(self, handle):
+        return {"id": self.store.song_ids[handle], "metadata": self.store.metadata(handle)}
@@ -1,47 +1,313 @@
-# song_rating_tree.py - Binary Search Tree for Song Ratings
+# song_rating_tree.py - Self-balancing (AVL) Binary Search Tree for Song Ratings
+
+from array import array
+from bisect import bisect_right
+from itertools import islice
+
+from modules.song_store_10 import SongStore
 
 class RatingNode:
     """Represents a node in the BST, holding songs of a specific rating."""
     def __init__(self, rating):
         self.rating = rating
-        self.songs = []  # A list of songs with this rating.
+        self.songs = array('q')  # Handles (into the SongStore) of songs with this rating.
         self.left = None
         self.right = None
+        self.height = 1  # Height of the subtree rooted here, used for AVL balancing.
+
+def _height(node):
+    return node.height if node else 0
+
+def _rotate_right(node):
+    pivot = node.left
+    node.left = pivot.right
+    pivot.right = node
+    node.height = 1 + max(_height(node.left), _height(node.right))
+    pivot.height = 1 + max(_height(pivot.left), _height(pivot.right))
+    return pivot
+
+def _rotate_left(node):
+    pivot = node.right
+    node.right = pivot.left
+    pivot.left = node
+    node.height = 1 + max(_height(node.left), _height(node.right))
+    pivot.height = 1 + max(_height(pivot.left), _height(pivot.right))
+    return pivot
+
+def _rebalance(node):
+    """Restores the AVL invariant at a node whose subtrees differ in height by at most 2."""
+    node.height = 1 + max(_height(node.left), _height(node.right))
+    balance = _height(node.left) - _height(node.right)
+    if balance > 1:
+        if _height(node.left.left) < _height(node.left.right):
+            node.left = _rotate_left(node.left)
+        return _rotate_right(node)
+    if balance < -1:
+        if _height(node.right.right) < _height(node.right.left):
+            node.right = _rotate_right(node.right)
+        return _rotate_left(node)
+    return node
+
+def _pop_min(node):
+    """Detaches the minimum node of a subtree; returns (new subtree root, detached node)."""
+    if not node.left:
+        return node.right, node
+    node.left, minimum = _pop_min(node.left)
+    return _rebalance(node), minimum
 
 class SongRatingBST:
     """
     A Binary Search Tree (BST) to efficiently store and retrieve songs by their rating.
-    The tree structure is based on the rating value.
+    The tree structure is based on the rating value; song metadata lives in the shared SongStore.
+    The tree is kept height-balanced (AVL), so its depth stays O(log r) for r distinct ratings,
+    and ratings may be fractional (e.g. 4.5).
+    A reverse index (handle -> slot in its rating node's song array) makes deletion and
+    re-rating O(log n) with swap-remove, so the order of songs within a rating is not stable.
     """
-    def __init__(self):
+    def __init__(self, store=None, journal=None):
+        # Shared song metadata; a private store is created when none is given.
+        self.store = store if store is not None else SongStore()
+        # Optional ChangeJournal that records every mutation.
+        self.journal = journal
         self.root = None
+        # Reverse index: slot of each handle in its node's songs array, -1 if not in the tree.
+        # The song's node is found again from its rating in the store.
+        # None after a bulk load until first needed.
+        self._slots = array('q')
 
-    # O(log n) on average, O(n) in the worst-case (unbalanced tree), where n is the number of unique ratings.
+    # O(log n) time, where n is the number of unique ratings.
     def insert_song(self, song_id, rating, metadata):
         """
         Inserts a new song into the BST based on its rating.
         If a node for the rating exists, the song is added to that node's list.
         """
+        metadata = metadata or {}
+        handle = self.store.handle_of(song_id)
+        if handle is None:
+            # A song already added without an ID (e.g. to the playlist) is reused.
+            handle = self.store.bind_id(song_id, metadata.get("title"))
+        if handle is None:
+            handle = self.store.add_song(metadata.get("title"), metadata.get("artist"),
+                                         metadata.get("duration"), song_id=song_id)
+        self.insert_handle(handle, rating)
+
+    # O(log n) time, where n is the number of unique ratings.
+    def insert_handle(self, handle, rating):
+        """
+        Inserts a song that already exists in the store under the given rating.
+        A song that is already in the tree is moved to the new rating.
+        """
+        slots = self._slot_index()
+        if handle >= len(slots):
+            slots.extend([-1] * (len(self.store) - len(slots)))
+        elif slots[handle] >= 0:
+            self._remove_handle(handle)
+        self.store.ratings[handle] = rating
+
+        # Recursion depth is bounded by the AVL height (about 1.44 log2 n).
         def insert(node):
             if not node:
                 new_node = RatingNode(rating)
-                new_node.songs.append({"id": song_id, "metadata": metadata})
+                slots[handle] = 0
+                new_node.songs.append(handle)
                 return new_node
             if rating < node.rating:
                 node.left = insert(node.left)
             elif rating > node.rating:
                 node.right = insert(node.right)
             else:
-                node.songs.append({"id": song_id, "metadata": metadata})
-            return node
+                slots[handle] = len(node.songs)
+                node.songs.append(handle)
+                return node
+            return _rebalance(node)
 
         self.root = insert(self.root)
+        if self.journal is not None:
+            self.journal.record("rating.insert", self.store.song_ids[handle], rating, self.store.metadata(handle))
 
-    # O(log n) on average, O(n) in the worst-case, where n is the number of unique ratings.
+    # O(m log m) time for m handles.
+    def insert_handles(self, handles, ratings):
+        """
+        Inserts many stored songs under the given ratings (parallel to handles; the last
+        rating wins for a repeated handle). An empty tree is bulk-built balanced from the
+        songs sorted by rating; otherwise each song is inserted in O(log n).
+        """
+        rating_of = dict(zip(handles, ratings))
+        if self.root is not None:
+            for handle, rating in rating_of.items():
+                self.insert_handle(handle, rating)
+            return
+        store = self.store
+        for handle, rating in rating_of.items():
+            store.ratings[handle] = rating
+        # The groups keep each rating as given (4 stays an int), as insert_handle would;
+        # equal ratings of different types share the node of the first one.
+        ordered = sorted(rating_of, key=rating_of.__getitem__)
+        groups = []
+        for handle in ordered:
+            rating = rating_of[handle]
+            if groups and groups[-1][0] == rating:
+                groups[-1][1] += 1
+            else:
+                groups.append([rating, 1])
+        self.load_sorted(ordered, groups)
+        if self.journal is not None:
+            for handle, rating in rating_of.items():
+                self.journal.record("rating.insert", store.song_ids[handle], rating, store.metadata(handle))
+
+    # O(s + n) time for s songs and n unique ratings (O(n) when the groups are given).
+    def load_sorted(self, handles, groups=None):
+        """
+        Bulk-loads an empty tree from handles already ordered by their stored rating,
+        building a perfectly balanced tree instead of inserting songs one by one.
+        `groups` optionally lists (rating, song count) pairs in the same order, which
+        saves reading every song's rating. The reverse index is rebuilt on first use.
+        """
+        if self.root:
+            raise ValueError("load_sorted requires an empty tree")
+        handles = array('q', handles)
+        if groups is None:
+            ratings = self.store.ratings
+            sorted_ratings = array('d', [ratings[handle] for handle in handles])
+            groups = []
+            start = 0
+            while start < len(handles):
+                end = bisect_right(sorted_ratings, sorted_ratings[start], start)
+                groups.append((sorted_ratings[start], end - start))
+                start = end
+        nodes = []
+        start = 0
+        for rating, count in groups:
+            node = RatingNode(rating)
+            node.songs = handles[start:start + count]
+            nodes.append(node)
+            start += count
+        self._slots = None
+
+        # Recursion depth is O(log n) because each call halves the range.
+        def build(low, high):
+            if low > high:
+                return None
+            middle = (low + high) // 2
+            node = nodes[middle]
+            node.left = build(low, middle - 1)
+            node.right = build(middle + 1, high)
+            node.height = 1 + max(_height(node.left), _height(node.right))
+            return node
+
+        self.root = build(0, len(nodes) - 1)
+
+    # O(log n) time, where n is the number of unique ratings.
+    def update_rating(self, song_id, new_rating):
+        """
+        Moves a song to a new rating. Returns False if the song is not in the tree.
+        """
+        handle = self.store.handle_of(song_id)
+        if handle is None or not self._contains(handle):
+            return False
+        self.insert_handle(handle, new_rating)
+        return True
+
+    # O(log n) time, where n is the number of unique ratings.
     def search_by_rating(self, rating):
         """
         Searches for and returns all songs that have a specific rating.
         """
+        node = self._find_node(rating)
+        if not node:
+            return []
+        return [self._song_entry(handle) for handle in node.songs]
+
+    # O(log n + m + k) time, where m is the number of rating nodes in range and k the songs returned.
+    def search_range(self, min_rating, max_rating):
+        """
+        Returns all songs whose rating lies in [min_rating, max_rating], in ascending rating order.
+        """
+        return list(self.iter_range(min_rating, max_rating))
+
+    # O(log n + k) time, where k is the number of songs returned.
+    def top_k(self, k):
+        """
+        Returns up to k songs with the highest ratings, best-rated first.
+        Songs that share a rating are returned in storage order.
+        """
+        return list(islice(self.iter_in_order(descending=True), max(k, 0)))
+
+    # O(1) space; O(log n) time to reach the first song, then O(1) per song.
+    def iter_in_order(self, descending=False, blocklist=None):
+        """
+        Lazily yields every song as an {"id", "metadata"} entry in rating order (songs that
+        share a rating in storage order). With an ArtistBlocklist, blocked songs are skipped
+        before their entry is built.
+        """
+        return self.iter_range(None, None, descending, blocklist)
+
+    # O(log n) time to reach the range, then O(1) per song.
+    def iter_range(self, min_rating, max_rating, descending=False, blocklist=None):
+        """Lazily yields the songs rated within [min_rating, max_rating] (None leaves a side open)."""
+        blocked = blocklist.is_song_blocked if blocklist is not None else None
+        for node in self._nodes_in_range(min_rating, max_rating, descending):
+            for handle in node.songs:
+                if blocked is None or not blocked(handle):
+                    yield self._song_entry(handle)
+
+    # O(log n) time, where n is the number of unique ratings.
+    def delete_song(self, song_id):
+        """
+        Deletes a song by its ID using the reverse index. Returns True if a song was removed.
+        """
+        handle = self.store.handle_of(song_id)
+        if handle is None or not self._contains(handle):
+            return False
+        self._remove_handle(handle)
+        if self.journal is not None:
+            self.journal.record("rating.delete", song_id)
+        return True
+
+    # O(m log n) time for m IDs.
+    def delete_many(self, song_ids):
+        """
+        Deletes many songs at once (e.g. a catalog takedown) and returns how many were removed.
+        Rating nodes emptied by the batch are pruned once at the end.
+        """
+        emptied = []
+        removed = 0
+        for song_id in song_ids:
+            handle = self.store.handle_of(song_id)
+            if handle is None or not self._contains(handle):
+                continue
+            node = self._remove_handle(handle, prune=False)
+            if not node.songs:
+                emptied.append(node.rating)
+            removed += 1
+            if self.journal is not None:
+                self.journal.record("rating.delete", song_id)
+        for rating in emptied:
+            node = self._find_node(rating)
+            if node and not node.songs:
+                self.root = self._delete_node(self.root, rating)
+        return removed
+
+    # O(n) time to visit all rating nodes, O(log n) extra space.
+    def rating_nodes(self):
+        """Yields the rating nodes in ascending rating order."""
+        return self._nodes_in_range(None, None)
+
+    def _contains(self, handle):
+        slots = self._slot_index()
+        return handle < len(slots) and slots[handle] >= 0
+
+    def _slot_index(self):
+        """Returns the reverse index, rebuilding it from the nodes after a bulk load."""
+        if self._slots is None:
+            slots = array('q', [-1]) * len(self.store)
+            for node in self.rating_nodes():
+                for slot, handle in enumerate(node.songs):
+                    slots[handle] = slot
+            self._slots = slots
+        return self._slots
+
+    def _find_node(self, rating):
         current = self.root
         while current:
             if rating < current.rating:
@@ -49,20 +315,77 @@ class SongRatingBST:
             elif rating > current.rating:
                 current = current.right
             else:
-                return current.songs
-        return []
+                return current
+        return None
 
-    # O(s) where s is the total number of songs in the tree.
-    # This is not a typical BST deletion; it's a full traversal to find and remove a specific song ID.
-    def delete_song(self, song_id):
+    def _remove_handle(self, handle, prune=True):
         """
-        Deletes a song by its ID, traversing the entire tree.
+        Swap-removes a handle from its rating node and returns that node.
+        With prune=True, a node left without songs is deleted from the tree.
         """
-        def delete_in_node(node):
-            if not node:
-                return
-            node.songs = [s for s in node.songs if s["id"] != song_id]
-            delete_in_node(node.left)
-            delete_in_node(node.right)
+        slots = self._slot_index()
+        node = self._find_node(self.store.ratings[handle])
+        songs = node.songs
+        slot = slots[handle]
+        last = songs[-1]
+        songs[slot] = last
+        slots[last] = slot
+        songs.pop()
+        slots[handle] = -1
+        if prune and not songs:
+            self.root = self._delete_node(self.root, node.rating)
+        return node
+
+    def _delete_node(self, node, rating):
+        """Standard AVL deletion of the node holding `rating`; returns the new subtree root."""
+        if not node:
+            return None
+        if rating < node.rating:
+            node.left = self._delete_node(node.left, rating)
+        elif rating > node.rating:
+            node.right = self._delete_node(node.right, rating)
+        else:
+            if not node.left:
+                return node.right
+            if not node.right:
+                return node.left
+            right, successor = _pop_min(node.right)
+            successor.left = node.left
+            successor.right = right
+            node = successor
+        return _rebalance(node)
+
+    def _nodes_in_range(self, min_rating, max_rating, descending=False):
+        """
+        Yields the rating nodes with min_rating <= rating <= max_rating in sorted order,
+        using an explicit stack and pruning subtrees that fall outside the range.
+        A bound of None leaves that side of the range open.
+        """
+        stack = []
+        node = self.root
+        while stack or node:
+            if node:
+                stack.append(node)
+                if descending:
+                    # Skip the right subtree when everything in it is above the range.
+                    node = node.right if max_rating is None or node.rating < max_rating else None
+                else:
+                    node = node.left if min_rating is None or node.rating > min_rating else None
+                continue
+            node = stack.pop()
+            if descending:
+                if min_rating is not None and node.rating < min_rating:
+                    return
+                if max_rating is None or node.rating <= max_rating:
+                    yield node
+                node = node.left
+            else:
+                if max_rating is not None and node.rating > max_rating:
+                    return
+                if min_rating is None or node.rating >= min_rating:
+                    yield node
+                node = node.right
 
-        delete_in_node(self.root)
\ No newline at end of file
+    def _song_entry(self, handle):
+        """Materializes the {"id", "metadata"} view of a stored song."""
+        return {"id": self.store.song_ids[handle], "metadata": self.store.metadata(handle)}
\ No newline at end of file
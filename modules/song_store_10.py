@@ -0,0 +1,188 @@
+# song_store_10.py - Columnar Song Storage
+
+from array import array
+from collections import deque
+
+def artist_key(name):
+    """Case-insensitive key for an artist name (Unicode casefolding, e.g. "ß" == "ss")."""
+    return (name or "").casefold()
+
+class SongStore:
+    """
+    Central columnar store for song metadata.
+    Every song is addressed by an integer handle. Its fields live in parallel columns
+    (lists for strings, typed arrays for numbers) so the playlist, lookup tables,
+    rating tree and blocklist can all reference one copy of the metadata.
+    """
+    def __init__(self):
+        # String columns, indexed by handle.
+        self.titles = []
+        self.song_ids = []
+        # Interned artist table: each distinct artist name is stored once and
+        # songs reference it by artist id.
+        self.artist_names = []
+        # Casefolded artist names, parallel to artist_names (used for blocklist checks).
+        self.artist_keys = []
+        self._artist_index = {}
+        # Numeric columns, indexed by handle.
+        self.artist_ids = array('I')
+        self.durations = array('i')
+        self.ratings = array('d')
+        # Hash map from external song ID to handle (None until rebuilt after a bulk load).
+        self._handle_by_id = {}
+        # Title -> handles of songs added without an ID, oldest first; built on the
+        # first bind_id() call and maintained from then on.
+        self._unbound_by_title = None
+        # Secondary indexes notified through reassign(handle, old_artist_id, new_artist_id)
+        # when a song's artist changes, and changed(handle, field, old_value, new_value)
+        # when its title or duration changes.
+        self._indexes = []
+
+    def __len__(self):
+        return len(self.titles)
+
+    # O(1) amortized time.
+    def add_song(self, title, artist, duration, song_id=None, rating=0.0):
+        """
+        Appends a song to the store and returns its handle.
+        Raises ValueError if the song ID is already taken (use update_song to edit a song).
+        """
+        if song_id is not None and song_id in self._id_index():
+            raise ValueError(f"duplicate song ID: {song_id!r}")
+        handle = len(self.titles)
+        self.titles.append(title)
+        self.song_ids.append(song_id)
+        self.artist_ids.append(self.intern_artist(artist))
+        self.durations.append(duration or 0)
+        self.ratings.append(rating)
+        if song_id is not None:
+            self._handle_by_id[song_id] = handle
+        elif self._unbound_by_title is not None:
+            self._unbound_by_title.setdefault(title, deque()).append(handle)
+        return handle
+
+    # O(1) average time; O(n) for the first call, which builds the title map.
+    def bind_id(self, song_id, title):
+        """
+        Gives a new song ID to the oldest song stored without an ID under `title` (e.g.
+        added to the playlist before being rated or indexed) and returns its handle,
+        or None if there is no such song. The ID must not be taken yet.
+        """
+        unbound = self._unbound_by_title
+        if unbound is None:
+            unbound = self._unbound_by_title = {}
+            for handle, (known_id, known_title) in enumerate(zip(self.song_ids, self.titles)):
+                if known_id is None:
+                    unbound.setdefault(known_title, deque()).append(handle)
+        handles = unbound.get(title)
+        if not handles:
+            return None
+        handle = handles.popleft()
+        if not handles:
+            del unbound[title]
+        self.song_ids[handle] = song_id
+        self._id_index()[song_id] = handle
+        return handle
+
+    # O(a) time for a distinct artists; the ID hash map is rebuilt on first use.
+    def load_columns(self, titles, song_ids, artist_names, artist_ids, durations, ratings):
+        """
+        Bulk-loads an empty store from prebuilt columns (e.g. read from a state file).
+        The lists are adopted as-is; the arrays must use the store's typecodes.
+        """
+        if self.titles:
+            raise ValueError("load_columns requires an empty store")
+        self.titles = titles
+        self.song_ids = song_ids
+        self.artist_names = artist_names
+        self.artist_keys = [artist_key(name) for name in artist_names]
+        self._artist_index = {name: artist_id for artist_id, name in enumerate(artist_names)}
+        self.artist_ids = artist_ids
+        self.durations = durations
+        self.ratings = ratings
+        self._handle_by_id = None
+        self._unbound_by_title = None
+
+    # O(1) average time.
+    def update_song(self, handle, title=None, artist=None, duration=None):
+        """
+        Overwrites the given fields of an existing song; None leaves a field unchanged.
+        Attached indexes are told about every field whose value actually changed.
+        Edits made here are not journaled; PlayWise.update_song is the journaled way.
+        """
+        if title is not None and title != self.titles[handle]:
+            old_title = self.titles[handle]
+            self.titles[handle] = title
+            for attached in self._indexes:
+                attached.changed(handle, "title", old_title, title)
+        if artist is not None:
+            artist_id = self.intern_artist(artist)
+            old_artist_id = self.artist_ids[handle]
+            if artist_id != old_artist_id:
+                self.artist_ids[handle] = artist_id
+                for attached in self._indexes:
+                    attached.reassign(handle, old_artist_id, artist_id)
+        if duration is not None and duration != self.durations[handle]:
+            old_duration = self.durations[handle]
+            self.durations[handle] = duration
+            for attached in self._indexes:
+                attached.changed(handle, "duration", old_duration, duration)
+
+    # O(1) time.
+    def attach_index(self, index):
+        """
+        Registers a secondary index exposing reassign(handle, old_artist_id, new_artist_id)
+        and changed(handle, field, old_value, new_value) ("title" or "duration").
+        """
+        self._indexes.append(index)
+
+    # O(1) average time.
+    def intern_artist(self, artist):
+        """Returns the artist id for a name, adding it to the artist table if needed."""
+        if artist is None:
+            artist = ""
+        artist_id = self._artist_index.get(artist)
+        if artist_id is None:
+            artist_id = len(self.artist_names)
+            self.artist_names.append(artist)
+            self.artist_keys.append(artist_key(artist))
+            self._artist_index[artist] = artist_id
+        return artist_id
+
+    # O(1) average time.
+    def handle_of(self, song_id):
+        """Returns the handle bound to a song ID, or None."""
+        return self._id_index().get(song_id)
+
+    # O(1) time accessors.
+    def title(self, handle):
+        return self.titles[handle]
+
+    def artist(self, handle):
+        return self.artist_names[self.artist_ids[handle]]
+
+    def duration(self, handle):
+        return self.durations[handle]
+
+    def rating(self, handle):
+        return self.ratings[handle]
+
+    def song_id(self, handle):
+        return self.song_ids[handle]
+
+    # O(1) time; builds a fresh dict, nothing is cached per song.
+    def metadata(self, handle):
+        """Returns the song's metadata as a dictionary."""
+        return {
+            "title": self.titles[handle],
+            "artist": self.artist_names[self.artist_ids[handle]],
+            "duration": self.durations[handle]
+        }
+
+    def _id_index(self):
+        """Returns the ID -> handle map, building it in one pass after load_columns."""
+        if self._handle_by_id is None:
+            index = dict(zip(self.song_ids, range(len(self.song_ids))))
+            index.pop(None, None)
+            self._handle_by_id = index
+        return self._handle_by_id
\ No newline at end of file
@@ -0,0 +1,277 @@
+# sorted_views_26.py - Incrementally Maintained Sorted Views of the Playlist
+
+from bisect import bisect_left, bisect_right, insort
+from itertools import count
+
+class SortedBuckets:
+    """
+    Sorted multiset with positional access, stored as a list of short sorted lists
+    ("buckets" of at most 2 * `load` items) plus the largest item of each bucket.
+    - insert/remove: a bisect over the bucket maxima, then a bisect and an insert/delete
+      inside one bucket of O(load) items, i.e. O(log n) comparisons and a small memmove.
+      Buckets split when they grow past 2 * load and disappear when they empty.
+    - Positional access: a Fenwick tree over the bucket sizes finds the bucket holding
+      position i in O(log(n / load)). It is updated in place on insert/remove and rebuilt
+      lazily (O(n / load)) only after a bucket splits or disappears.
+    Items must be unique and totally ordered.
+    """
+    def __init__(self, items=(), load=512):
+        self.load = load
+        self._buckets = []
+        self._maxes = []
+        self._tree = None
+        self._len = 0
+        self.update(items)
+
+    def __len__(self):
+        return self._len
+
+    # O(m log m) time for m items (plus O(n) when the container is not empty).
+    def update(self, items):
+        """Adds many items at once by re-bucketing the merged sorted sequence."""
+        items = sorted(items)
+        if not items:
+            return
+        if self._buckets:
+            # Timsort merges the two sorted runs in linear time.
+            items = sorted([*self._iter_all(), *items])
+        load = self.load
+        self._buckets = [items[start:start + load] for start in range(0, len(items), load)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._len = len(items)
+        self._tree = None
+
+    def _iter_all(self):
+        for bucket in self._buckets:
+            yield from bucket
+
+    # O(log n) comparisons plus O(load) to shift items within a bucket.
+    def insert(self, item):
+        buckets = self._buckets
+        maxes = self._maxes
+        if not buckets:
+            buckets.append([item])
+            maxes.append(item)
+            self._len = 1
+            self._tree = None
+            return
+        position = bisect_left(maxes, item)
+        if position == len(maxes):
+            position -= 1
+            buckets[position].append(item)
+            maxes[position] = item
+        else:
+            insort(buckets[position], item)
+        self._len += 1
+        if len(buckets[position]) > 2 * self.load:
+            bucket = buckets[position]
+            buckets[position:position + 1] = [bucket[:self.load], bucket[self.load:]]
+            maxes[position:position + 1] = [bucket[self.load - 1], bucket[-1]]
+            self._tree = None
+        elif self._tree is not None:
+            self._tree_add(position, 1)
+
+    # O(log n) comparisons plus O(load) to shift items within a bucket.
+    def remove(self, item):
+        """Removes an item; raises ValueError if it is not present."""
+        maxes = self._maxes
+        position = bisect_left(maxes, item)
+        if position == len(maxes):
+            raise ValueError("item not in SortedBuckets")
+        bucket = self._buckets[position]
+        index = bisect_left(bucket, item)
+        if index == len(bucket) or bucket[index] != item:
+            raise ValueError("item not in SortedBuckets")
+        del bucket[index]
+        self._len -= 1
+        if not bucket:
+            del self._buckets[position]
+            del maxes[position]
+            self._tree = None
+            return
+        if index == len(bucket):
+            maxes[position] = bucket[-1]
+        if self._tree is not None:
+            self._tree_add(position, -1)
+
+    # O(log n) time.
+    def bisect_left(self, item):
+        """Number of items smaller than `item`."""
+        position = bisect_left(self._maxes, item)
+        if position == len(self._maxes):
+            return self._len
+        return self._prefix(position) + bisect_left(self._buckets[position], item)
+
+    # O(log n) time.
+    def bisect_right(self, item):
+        """Number of items smaller than or equal to `item`."""
+        position = bisect_right(self._maxes, item)
+        if position == len(self._maxes):
+            return self._len
+        return self._prefix(position) + bisect_right(self._buckets[position], item)
+
+    # O(log n + limit) time.
+    def islice(self, start, stop=None, reverse=False):
+        """Yields the items at positions [start, stop), in descending order with reverse=True."""
+        stop = self._len if stop is None else min(stop, self._len)
+        start = max(0, start)
+        if start >= stop:
+            return
+        if reverse:
+            # Position i from the end is position len - 1 - i from the start.
+            start, stop = self._len - stop, self._len - start
+            bucket_index, offset = self._locate(stop - 1)
+            remaining = stop - start
+            while remaining > 0:
+                bucket = self._buckets[bucket_index]
+                take = min(offset + 1, remaining)
+                yield from reversed(bucket[offset + 1 - take:offset + 1])
+                remaining -= take
+                bucket_index -= 1
+                if bucket_index >= 0:
+                    offset = len(self._buckets[bucket_index]) - 1
+            return
+        bucket_index, offset = self._locate(start)
+        remaining = stop - start
+        while remaining > 0:
+            bucket = self._buckets[bucket_index]
+            chunk = bucket[offset:offset + remaining]
+            yield from chunk
+            remaining -= len(chunk)
+            bucket_index += 1
+            offset = 0
+
+    def __iter__(self):
+        return self._iter_all()
+
+    # ---- Fenwick tree over bucket sizes ----
+
+    def _build_tree(self):
+        tree = [len(bucket) for bucket in self._buckets]
+        for i in range(len(tree)):
+            parent = i | (i + 1)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, position, delta):
+        tree = self._tree
+        while position < len(tree):
+            tree[position] += delta
+            position |= position + 1
+
+    def _prefix(self, position):
+        """Total size of the buckets before `position`."""
+        if self._tree is None:
+            self._build_tree()
+        tree = self._tree
+        total = 0
+        position -= 1
+        while position >= 0:
+            total += tree[position]
+            position = (position & (position + 1)) - 1
+        return total
+
+    def _locate(self, index):
+        """(bucket, offset) of the item at a position, by descending the Fenwick tree."""
+        if self._tree is None:
+            self._build_tree()
+        tree = self._tree
+        position = -1
+        step = 1 << len(tree).bit_length()
+        while step:
+            following = position + step
+            if following < len(tree) and tree[following] <= index:
+                index -= tree[following]
+                position = following
+            step >>= 1
+        return position + 1, index
+
+class SortedView:
+    """
+    Playlist songs kept sorted by one field ("title", "duration" or "artist"), updated
+    through the PlaylistEngine mutation hooks instead of re-sorting on every request.
+    Ties are kept in the order songs were added to the playlist, and title, duration
+    and artist edits move a song to its new position. Attach it with
+    PlaylistEngine.attach_index; the current songs are bulk-loaded in one sort.
+    Pages are O(log n + limit), so paging through a large playlist never re-sorts it.
+    """
+    FIELDS = ("title", "duration", "artist")
+
+    def __init__(self, field):
+        if field not in self.FIELDS:
+            raise KeyError(field)
+        self.field = field
+        self._items = SortedBuckets()
+        # node -> its (key, sequence, node) item, so a node can be found and removed
+        # by the key it was indexed under.
+        self._item_of = {}
+        self._sequence = count()
+        # Nodes passed to add() while the view is being attached, loaded in one sort.
+        self._staged = None
+
+    def __len__(self):
+        return len(self._items)
+
+    def _key(self, node):
+        if self.field == "title":
+            return node.title
+        if self.field == "duration":
+            return node.duration
+        return node.artist
+
+    def attach(self, playlist_engine):
+        """Attaches the view to an engine, bulk-loading its current songs."""
+        self._staged = []
+        try:
+            playlist_engine.attach_index(self)
+            self._items.update(self._staged)
+        finally:
+            self._staged = None
+        return self
+
+    # O(log n) time (engine mutation hook).
+    def add(self, node):
+        item = (self._key(node), next(self._sequence), node)
+        self._item_of[node] = item
+        if self._staged is not None:
+            self._staged.append(item)
+        else:
+            self._items.insert(item)
+
+    # O(log n) time (engine mutation hook).
+    def remove(self, node):
+        item = self._item_of.pop(node, None)
+        if item is not None:
+            self._items.remove(item)
+
+    # O(log n) time (engine hook for edits of a listed song).
+    def update(self, node, field, old_value, new_value):
+        """Moves the node to its new sorted position when the view's field was edited."""
+        if field != self.field:
+            return
+        item = self._item_of.get(node)
+        if item is None:
+            return
+        self._items.remove(item)
+        # The sequence is kept, so ties stay in the order the songs were added.
+        item = (new_value, item[1], node)
+        self._item_of[node] = item
+        self._items.insert(item)
+
+    # O(log n + limit) time.
+    def page(self, offset=0, limit=50, descending=False):
+        """Song metadata dicts at sorted positions [offset, offset + limit)."""
+        return [node.store.metadata(node.handle)
+                for _, _, node in self._items.islice(offset, offset + limit, reverse=descending)]
+
+    # O(log n + limit) time.
+    def nodes(self, offset=0, limit=None, descending=False):
+        """Iterates the song nodes in sorted order, starting at a sorted position."""
+        stop = None if limit is None else offset + limit
+        return (node for _, _, node in self._items.islice(offset, stop, reverse=descending))
+
+    # O(log n) time.
+    def rank(self, value):
+        """Sorted position of the first song whose key is >= `value` (e.g. to jump to a letter)."""
+        return self._items.bisect_left((value,))
@@ -0,0 +1,204 @@
+# state_format_14.py - Binary State File (fixed-width columns plus string tables)
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from itertools import chain
+
+# File layout:
+#   header   : magic, format version, byte order, playlist orientation, journal version, section count
+#   sections : table of (tag, offset, length) entries, followed by the section payloads
+# Numeric sections are raw fixed-width arrays indexed by song handle (or lists of handles);
+# string sections are UTF-8 strings separated by NUL bytes.
+MAGIC = b"PLYWISE\0"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sHBBQI")
+_SECTION = struct.Struct("<4sQQ")
+_SEPARATOR = "\0"
+# Per-song type tags of the SIDT section, so song IDs load back as they were given
+# (the SIDS strings cannot tell None from "" or 1 from "1").
+_ID_NONE, _ID_STR, _ID_INT = 0, 1, 2
+
+def _pack_strings(strings):
+    """Joins strings into one NUL-separated UTF-8 blob."""
+    strings = ["" if value is None else str(value) for value in strings]
+    for value in strings:
+        if _SEPARATOR in value:
+            raise ValueError(f"cannot store string containing NUL: {value!r}")
+    return _SEPARATOR.join(strings).encode("utf-8")
+
+def _id_types(song_ids):
+    """Type tag of every song ID, as stored in the SIDT section."""
+    return array('B', (_ID_NONE if song_id is None else _ID_INT if isinstance(song_id, int) else _ID_STR
+                       for song_id in song_ids))
+
+def _unpack_strings(view, count):
+    """Splits a NUL-separated UTF-8 blob back into `count` strings with one decode."""
+    if count == 0:
+        return []
+    strings = bytes(view).decode("utf-8").split(_SEPARATOR)
+    if len(strings) != count:
+        raise ValueError(f"corrupt string table: expected {count} entries, found {len(strings)}")
+    return strings
+
+def _read_array(view, typecode, swap):
+    values = array(typecode)
+    values.frombytes(view)
+    if swap:
+        values.byteswap()
+    return values
+
+# O(n) time, where n is the number of stored songs.
+def save_state(playwise, path):
+    """
+    Writes the whole PlayWise state to a binary file.
+    Lookup tables and the rating tree are stored as handle lists (the rating tree's
+    already sorted by rating, with per-rating counts) so they can be bulk-loaded
+    without re-inserting songs.
+    """
+    store = playwise.song_store
+    engine = playwise.playlist_engine
+    rated = array('q')
+    group_ratings = array('d')
+    group_counts = array('q')
+    # 1 for ratings given as integers, so they are not read back as floats (3 -> 3.0).
+    group_integral = array('B')
+    for node in playwise.song_rating_tree.rating_nodes():
+        rated.extend(node.songs)
+        group_ratings.append(node.rating)
+        group_counts.append(len(node.songs))
+        group_integral.append(isinstance(node.rating, int))
+    history = playwise.playback_history
+    history_songs = history.stack
+    play_counts = history.play_counts()
+    # Spill segments stay on disk; the file lists them and holds the evicted plays
+    # not yet written to one.
+    segment_bounds = array('d')
+    segment_counts = array('q')
+    for _, first_time, last_time, count in history.segments:
+        segment_bounds.extend((first_time, last_time))
+        segment_counts.append(count)
+    spilled_songs, spilled_times = history.spilled()
+
+    sections = [
+        (b"TITL", _pack_strings(store.titles)),
+        (b"SIDS", _pack_strings(store.song_ids)),
+        (b"SIDT", _id_types(store.song_ids).tobytes()),
+        (b"ARTN", _pack_strings(store.artist_names)),
+        (b"ARTI", store.artist_ids.tobytes()),
+        (b"DURS", store.durations.tobytes()),
+        (b"RATS", store.ratings.tobytes()),
+        (b"PLAY", engine.physical_handles().tobytes()),
+        (b"RTRE", rated.tobytes()),
+        (b"RGRT", group_ratings.tobytes()),
+        (b"RGCT", group_counts.tobytes()),
+        (b"RGIN", group_integral.tobytes()),
+        (b"LKID", array('q', playwise.song_lookup.song_by_id.values()).tobytes()),
+        (b"LKTT", array('q', playwise.song_lookup.song_by_title.values()).tobytes()),
+        (b"BLCK", _pack_strings(playwise.artist_blocklist.blocked_artists)),
+        (b"BALS", _pack_strings(chain.from_iterable(playwise.artist_blocklist.aliases.items()))),
+        (b"BPAT", _pack_strings(playwise.artist_blocklist.patterns)),
+        (b"HIST", _pack_strings(history_songs)),
+        (b"HSTM", history.timestamps().tobytes()),
+        (b"HSNG", _pack_strings(play_counts.keys())),
+        (b"HCNT", array('I', play_counts.values()).tobytes()),
+        (b"HSGP", _pack_strings(os.path.abspath(path) for path, _, _, _ in history.segments)),
+        (b"HSGT", segment_bounds.tobytes()),
+        (b"HSGC", segment_counts.tobytes()),
+        (b"HSPS", _pack_strings(spilled_songs)),
+        (b"HSPT", array('d', spilled_times).tobytes()),
+    ]
+    counts = struct.pack("<QQQQ", len(store), len(store.artist_names),
+                         len(playwise.artist_blocklist.blocked_artists), len(history_songs))
+    sections.insert(0, (b"CNTS", counts))
+
+    offset = _HEADER.size + _SECTION.size * len(sections)
+    with open(path, "wb") as fp:
+        fp.write(_HEADER.pack(MAGIC, FORMAT_VERSION, sys.byteorder == "little",
+                              engine.is_reversed, playwise.journal.version, len(sections)))
+        for tag, payload in sections:
+            fp.write(_SECTION.pack(tag, offset, len(payload)))
+            offset += len(payload)
+        for _, payload in sections:
+            fp.write(payload)
+
+# O(n) time with bulk array copies; playlist nodes are built lazily on first use.
+def load_state(playwise, path):
+    """
+    Restores a state file written by save_state into a freshly constructed PlayWise.
+    The file is memory-mapped and each column is copied out with a single bulk read.
+    """
+    with open(path, "rb") as fp:
+        mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    sections = {}
+    try:
+        magic, version, little_endian, reversed_order, journal_version, section_count = \
+            _HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a PlayWise state file (version {FORMAT_VERSION})")
+        swap = bool(little_endian) != (sys.byteorder == "little")
+        for i in range(section_count):
+            tag, offset, length = _SECTION.unpack_from(view, _HEADER.size + i * _SECTION.size)
+            sections[tag] = view[offset:offset + length]
+
+        song_count, artist_count, blocked_count, history_count = struct.unpack("<QQQQ", sections[b"CNTS"])
+        song_ids = _unpack_strings(sections[b"SIDS"], song_count)
+        if b"SIDT" in sections:
+            song_ids = [song_id if kind == _ID_STR else None if kind == _ID_NONE else int(song_id)
+                        for song_id, kind in zip(song_ids, _read_array(sections[b"SIDT"], 'B', False))]
+        else:
+            # Files written before SIDT stored every ID as text and None as "".
+            song_ids = [song_id or None for song_id in song_ids]
+
+        playwise.song_store.load_columns(
+            _unpack_strings(sections[b"TITL"], song_count),
+            song_ids,
+            _unpack_strings(sections[b"ARTN"], artist_count),
+            _read_array(sections[b"ARTI"], 'I', swap),
+            _read_array(sections[b"DURS"], 'i', swap),
+            _read_array(sections[b"RATS"], 'd', swap)
+        )
+        playwise.playlist_engine.restore_handles(_read_array(sections[b"PLAY"], 'q', swap),
+                                                 bool(reversed_order))
+        group_ratings = _read_array(sections[b"RGRT"], 'd', swap)
+        if b"RGIN" in sections:
+            group_ratings = [int(rating) if integral else rating
+                             for rating, integral in zip(group_ratings, _read_array(sections[b"RGIN"], 'B', False))]
+        groups = zip(group_ratings, _read_array(sections[b"RGCT"], 'q', swap))
+        playwise.song_rating_tree.load_sorted(_read_array(sections[b"RTRE"], 'q', swap), groups)
+        playwise.song_lookup.load_handles(_read_array(sections[b"LKID"], 'q', swap),
+                                          _read_array(sections[b"LKTT"], 'q', swap))
+        blocklist = playwise.artist_blocklist
+        blocklist.blocked_artists = set(_unpack_strings(sections[b"BLCK"], blocked_count))
+        if b"BALS" in sections and len(sections[b"BALS"]):
+            pairs = bytes(sections[b"BALS"]).decode("utf-8").split(_SEPARATOR)
+            blocklist.aliases = dict(zip(pairs[::2], pairs[1::2]))
+        if b"BPAT" in sections and len(sections[b"BPAT"]):
+            blocklist.patterns = bytes(sections[b"BPAT"]).decode("utf-8").split(_SEPARATOR)
+        blocklist._changed()
+        history_times = _read_array(sections[b"HSTM"], 'd', swap) if b"HSTM" in sections else None
+        play_counts = None
+        if b"HCNT" in sections:
+            count_values = _read_array(sections[b"HCNT"], 'I', swap)
+            play_counts = dict(zip(_unpack_strings(sections[b"HSNG"], len(count_values)), count_values))
+        segments = []
+        spilled = spilled_times = ()
+        if b"HSGC" in sections:
+            segment_counts = _read_array(sections[b"HSGC"], 'q', swap)
+            segment_bounds = _read_array(sections[b"HSGT"], 'd', swap)
+            segments = [(path, segment_bounds[2 * i], segment_bounds[2 * i + 1], count) for i, (path, count)
+                        in enumerate(zip(_unpack_strings(sections[b"HSGP"], len(segment_counts)), segment_counts))]
+            spilled_times = _read_array(sections[b"HSPT"], 'd', swap)
+            spilled = _unpack_strings(sections[b"HSPS"], len(spilled_times))
+        playwise.playback_history.restore(_unpack_strings(sections[b"HIST"], history_count),
+                                          history_times, play_counts, segments, spilled, spilled_times)
+        playwise.journal.version = journal_version
+    finally:
+        # Sub-views must be released before the mapping can be closed.
+        sections.clear()
+        view.release()
+        mapped.close()
+    return playwise
\ No newline at end of file
@@ -0,0 +1,73 @@
+# stream_pipeline_27.py - Lazy, Composable Pipelines over Songs
+
+from itertools import islice
+
+class Pipeline:
+    """
+    A lazy chain of stages over any iterable of songs (playlist nodes, rating-tree
+    entries, handles...). Each stage wraps the previous iterator, so nothing runs until
+    the pipeline is iterated and memory stays O(1) per song (O(size) for batch), e.g.
+
+        Pipeline.playlist(engine, blocklist=blocklist) \\
+            .filter(lambda node: node.duration > 300).map(song_metadata).take(20)
+
+    A pipeline is consumed by iterating it once.
+    """
+    def __init__(self, source):
+        self._source = iter(source)
+
+    def __iter__(self):
+        return self._source
+
+    @classmethod
+    def playlist(cls, playlist_engine, start=0, stop=None, blocklist=None):
+        """Playlist nodes at positions [start, stop); blocked artists are skipped at the source."""
+        if start == 0 and stop is None:
+            return cls(playlist_engine.iter_songs(blocklist))
+        return cls(playlist_engine.iter_range(start, stop, blocklist))
+
+    @classmethod
+    def ratings(cls, rating_tree, min_rating=None, max_rating=None, descending=False, blocklist=None):
+        """Rating-tree entries in rating order; blocked artists are skipped at the source."""
+        return cls(rating_tree.iter_range(min_rating, max_rating, descending, blocklist))
+
+    def filter(self, predicate):
+        return Pipeline(filter(predicate, self._source))
+
+    def map(self, function):
+        return Pipeline(map(function, self._source))
+
+    def take(self, count):
+        """Stops after `count` songs; the source is not advanced any further."""
+        return Pipeline(islice(self._source, count))
+
+    def skip(self, count):
+        return Pipeline(islice(self._source, count, None))
+
+    def not_blocked(self, blocklist):
+        """Drops playlist nodes by blocked artists (for sources without a blocklist pushdown)."""
+        blocked = blocklist.is_song_blocked
+        return self.filter(lambda node: not blocked(node.handle))
+
+    def batch(self, size):
+        """Groups songs into lists of up to `size` items."""
+        def batches(source):
+            while True:
+                chunk = list(islice(source, size))
+                if not chunk:
+                    return
+                yield chunk
+        return Pipeline(batches(self._source))
+
+    def collect(self):
+        return list(self._source)
+
+    def first(self, default=None):
+        return next(self._source, default)
+
+    def count(self):
+        return sum(1 for _ in self._source)
+
+def song_metadata(node):
+    """Map stage: playlist node -> metadata dict, as returned by SongStore.metadata."""
+    return node.store.metadata(node.handle)
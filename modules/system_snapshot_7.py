@@ -1,34 +1,54 @@
+import json
+from itertools import islice
+
+from modules.top_k_index_12 import TopKIndex
+
+def _chunks(iterable, size):
+    """Yields lists of up to `size` items without materializing the whole iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
 class SystemSnapshot:
     """
     Captures a snapshot of key data from various parts of the system.
     """
-    def __init__(self, playlist_engine, playback_history, rating_tree):
+    def __init__(self, playlist_engine, playback_history, rating_tree,
+                 song_lookup=None, artist_blocklist=None, journal=None, instrumentation=None):
         self.playlist_engine = playlist_engine
         self.playback_history = playback_history
         self.rating_tree = rating_tree
+        # Optional sources used by the streaming export.
+        self.song_lookup = song_lookup
+        self.artist_blocklist = artist_blocklist
+        self.journal = journal
+        # Optional Instrumentation whose metrics are included while it is enabled.
+        self.instrumentation = instrumentation
+        # Incrementally maintained top-5 longest songs of the playlist.
+        self.top_longest = TopKIndex(playlist_engine, k=5, longest=True)
 
     def export_snapshot(self):
         """
         Creates and returns a dictionary containing a summary of system state.
         """
-        return {
+        snapshot = {
             "top_5_longest_songs": self.get_top_5_longest_songs(),
-            "recently_played": self.playback_history.stack[-5:],
+            "recently_played": self.playback_history.last(5),
             "rating_counts": self.get_rating_counts()
         }
+        if self.instrumentation is not None and self.instrumentation.enabled:
+            snapshot["metrics"] = self.instrumentation.metrics()
+        return snapshot
 
     def get_top_5_longest_songs(self):
         """
         Retrieves the top 5 longest songs from the playlist.
-        O(n log n) due to sorting, where n is the number of songs.
+        O(1) time (O(K) for K = 5), read from the engine's duration index.
         """
-        current = self.playlist_engine.head
-        songs = []
-        while current:
-            songs.append({"title": current.title, "duration": current.duration})
-            current = current.next
-        songs.sort(key=lambda x: x["duration"], reverse=True)
-        return songs[:5]
+        return self.top_longest.top()
 
     def get_rating_counts(self):
         """
@@ -42,4 +62,71 @@ class SystemSnapshot:
                 traverse(node.left)
                 traverse(node.right)
         traverse(self.rating_tree.root)
-        return counts
\ No newline at end of file
+        return counts
+
+    # O(n) time, O(chunk_size) extra space for a full snapshot; O(k) for a delta of k changes.
+    def stream_snapshot(self, destination, since=None, chunk_size=1000):
+        """
+        Writes the system state as JSON Lines to a path or text file object, one chunk of
+        records per line, without building the whole snapshot in memory.
+        With `since` (a journal version) only the operations recorded after it are written;
+        if the journal no longer covers that version a full snapshot is written instead.
+        Returns the version the snapshot corresponds to.
+        """
+        if isinstance(destination, str):
+            with open(destination, "w", encoding="utf-8") as fp:
+                return self.stream_snapshot(fp, since, chunk_size)
+
+        version = self.journal.version if self.journal is not None else 0
+        delta = since is not None and self.journal is not None and self.journal.covers(since)
+        header = {"type": "header", "mode": "delta" if delta else "full", "version": version}
+        if delta:
+            header["since"] = since
+        self._write_record(destination, header)
+        if delta:
+            entries = ([entry_version, op, *args] for entry_version, op, args in self.journal.since(since))
+            for chunk in _chunks(entries, chunk_size):
+                self._write_record(destination, {"type": "ops", "items": chunk})
+        else:
+            for record in self._full_records(chunk_size):
+                self._write_record(destination, record)
+        self._write_record(destination, {"type": "end", "version": version})
+        return version
+
+    def _full_records(self, chunk_size):
+        """Yields the chunked records that make up a full snapshot."""
+        store = self.playlist_engine.store
+        playlist = ([node.title, node.artist, node.duration, store.song_ids[node.handle]]
+                    for node in self.playlist_engine.iter_songs())
+        for chunk in _chunks(playlist, chunk_size):
+            yield {"type": "playlist", "items": chunk}
+
+        if self.song_lookup is not None:
+            lookup = self.song_lookup
+            by_id = ([song_id, lookup.store.titles[handle], lookup.store.artist(handle), lookup.store.durations[handle]]
+                     for song_id, handle in lookup.song_by_id.items())
+            for chunk in _chunks(by_id, chunk_size):
+                yield {"type": "lookup_ids", "items": chunk}
+            by_title = ([title, lookup.store.song_ids[handle]] for title, handle in lookup.song_by_title.items())
+            for chunk in _chunks(by_title, chunk_size):
+                yield {"type": "lookup_titles", "items": chunk}
+
+        rating_store = self.rating_tree.store
+        for node in self.rating_tree.rating_nodes():
+            ids = (rating_store.song_ids[handle] for handle in node.songs)
+            for chunk in _chunks(ids, chunk_size):
+                yield {"type": "ratings", "rating": node.rating, "items": chunk}
+
+        if self.artist_blocklist is not None:
+            for chunk in _chunks(self.artist_blocklist.blocked_artists, chunk_size):
+                yield {"type": "blocklist", "items": chunk}
+            if self.artist_blocklist.aliases or self.artist_blocklist.patterns:
+                yield {"type": "blocklist_rules", "aliases": self.artist_blocklist.aliases,
+                       "patterns": self.artist_blocklist.patterns}
+
+        for chunk in _chunks(self.playback_history.iter_plays(), chunk_size):
+            yield {"type": "history", "items": chunk}
+
+    def _write_record(self, fp, record):
+        fp.write(json.dumps(record, default=str))
+        fp.write("\n")
\ No newline at end of file
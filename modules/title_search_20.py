@@ -0,0 +1,233 @@
+# title_search_20.py - Normalized Title Index with Prefix and Fuzzy Search
+
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from heapq import merge, nlargest
+
+# The Unicode "Combining Diacritical Marks" blocks, removed after NFKD decomposition.
+_COMBINING_MARKS = re.compile("[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]")
+
+def normalize_title(title):
+    """Search key for a title: diacritics stripped, casefolded, whitespace collapsed."""
+    if not title:
+        return ""
+    if title.isascii():
+        return " ".join(title.casefold().split())
+    stripped = _COMBINING_MARKS.sub("", unicodedata.normalize("NFKD", title))
+    return " ".join(stripped.casefold().split())
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _contains(keys, key):
+    position = bisect_left(keys, key)
+    return position < len(keys) and keys[position] == key
+
+def _edit_distance(a, b, limit):
+    """Levenshtein distance, or limit + 1 as soon as it is certain to exceed `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+class TitleSearchIndex:
+    """
+    Multi-valued index from normalized titles to SongStore handles.
+    - Exact: each distinct key maps to a bucket of every song with that title. Buckets
+      are compact: the first handle per key lives in a typed array, and only keys with
+      duplicates get an overflow array.
+    - Prefix: distinct keys are kept sorted (a large main list plus a small insertion
+      buffer merged into it when it grows past `buffer_limit`), so autocomplete is a
+      bisect plus a scan of at most `limit` keys. Keys whose bucket empties stay as
+      tombstones until the next merge.
+    - Fuzzy: a trigram inverted index (built on the first fuzzy query) proposes a bounded
+      set of candidates, which are ranked by edit distance.
+    """
+    def __init__(self, store, buffer_limit=4096):
+        self.store = store
+        self.buffer_limit = buffer_limit
+        # key id -> normalized key and normalized key -> key id.
+        self._keys = []
+        self._key_ids = {}
+        # Buckets: first handle per key id (-1 when empty) plus key id -> later handles.
+        self._first = array('q')
+        self._more = {}
+        # Key id of each handle (-1 when not indexed), so a renamed song can leave its old bucket.
+        self._key_of = array('i')
+        self._count = 0
+        # Sorted distinct keys: main list plus small insertion buffer.
+        self._sorted = []
+        self._buffer = []
+        # trigram -> array of key ids; None until the first fuzzy query.
+        self._grams = None
+
+    def __len__(self):
+        return self._count
+
+    # O(log n + b) time for b buffered keys (plus an O(n) merge every `buffer_limit` new keys).
+    def add(self, handle):
+        """Indexes (or re-indexes after a rename) a stored song under its current title."""
+        key = self._index(handle)
+        if key is not None:
+            insort(self._buffer, key)
+            if len(self._buffer) > self.buffer_limit:
+                self._merge_buffer()
+
+    # O(m + n log n) time for m handles; the sorted keys are rebuilt once.
+    def add_many(self, handles):
+        """Indexes many stored songs at once."""
+        new_keys = [key for key in map(self._index, handles) if key is not None]
+        if new_keys:
+            self._buffer.extend(new_keys)
+            self._buffer.sort()
+            self._merge_buffer()
+
+    def _index(self, handle):
+        """Puts a song in its bucket; returns its key if the key must enter the sorted keys."""
+        key = normalize_title(self.store.titles[handle])
+        key_id = self._key_ids.get(key)
+        if handle >= len(self._key_of):
+            self._key_of.extend([-1] * (len(self.store) - len(self._key_of)))
+        elif self._key_of[handle] >= 0:
+            if self._key_of[handle] == key_id:
+                return None
+            self.remove(handle)
+        sorted_key = None
+        if key_id is None:
+            key_id = self._key_ids[key] = len(self._keys)
+            self._keys.append(key)
+            self._first.append(-1)
+            if self._grams is not None:
+                for gram in _trigrams(key):
+                    self._grams.setdefault(gram, array('I')).append(key_id)
+            sorted_key = key
+        elif self._first[key_id] < 0 and not (_contains(self._sorted, key) or _contains(self._buffer, key)):
+            # A tombstoned key that a merge already dropped.
+            sorted_key = key
+        if self._first[key_id] < 0:
+            self._first[key_id] = handle
+        else:
+            self._more.setdefault(key_id, array('q')).append(handle)
+        self._key_of[handle] = key_id
+        self._count += 1
+        return sorted_key
+
+    # O(t) time for t songs sharing the title.
+    def remove(self, handle):
+        """Drops a song from the index. Returns False if it was not indexed."""
+        if handle >= len(self._key_of) or self._key_of[handle] < 0:
+            return False
+        key_id = self._key_of[handle]
+        self._key_of[handle] = -1
+        self._count -= 1
+        more = self._more.get(key_id)
+        if self._first[key_id] == handle:
+            # Promote the next song so the bucket keeps insertion order.
+            self._first[key_id] = more.pop(0) if more else -1
+        else:
+            del more[more.index(handle)]
+        if more is not None and not more:
+            del self._more[key_id]
+        return True
+
+    def _bucket(self, key_id):
+        first = self._first[key_id]
+        if first < 0:
+            return []
+        more = self._more.get(key_id)
+        return [first] if more is None else [first, *more]
+
+    def _merge_buffer(self):
+        """Folds the insertion buffer into the main sorted list and drops tombstones."""
+        first = self._first
+        key_ids = self._key_ids
+        # Timsort merges the two sorted runs in C.
+        merged = sorted(self._sorted + self._buffer)
+        self._sorted = [key for key in merged if first[key_ids[key]] >= 0]
+        self._buffer = []
+
+    # O(1) average time.
+    def exact(self, title):
+        """All handles whose title normalizes to the same key, in insertion order."""
+        key_id = self._key_ids.get(normalize_title(title))
+        return [] if key_id is None else self._bucket(key_id)
+
+    # O(log n + limit) time.
+    def prefix(self, text, limit=10):
+        """Handles of songs whose normalized title starts with `text`, in key order."""
+        prefix = normalize_title(text)
+        results = []
+        for key in merge(self._scan(self._sorted, prefix), self._scan(self._buffer, prefix)):
+            results.extend(self._bucket(self._key_ids[key]))
+            if len(results) >= limit:
+                return results[:limit]
+        return results
+
+    def _scan(self, keys, prefix):
+        first = self._first
+        key_ids = self._key_ids
+        position = bisect_left(keys, prefix)
+        previous = None
+        while position < len(keys) and keys[position].startswith(prefix):
+            key = keys[position]
+            position += 1
+            if key != previous and first[key_ids[key]] >= 0:
+                previous = key
+                yield key
+
+    # O(c * L^2) time for c candidate keys of length L, with c <= `candidates`.
+    def fuzzy(self, text, limit=10, max_distance=2, candidates=64, max_postings=20_000):
+        """
+        Returns up to `limit` (handle, distance) pairs for titles within `max_distance`
+        edits of `text`, closest first. Candidates are the keys sharing the most trigrams
+        with the query; the rarest trigrams are read first and at most `max_postings`
+        postings are scanned, which bounds the work on very large catalogs.
+        """
+        query = normalize_title(text)
+        if self._grams is None:
+            self._build_grams()
+        postings = sorted((self._grams[gram] for gram in _trigrams(query) if gram in self._grams), key=len)
+        shared = {}
+        scanned = 0
+        for key_ids in postings:
+            if scanned + len(key_ids) > max_postings:
+                break
+            scanned += len(key_ids)
+            for key_id in key_ids:
+                shared[key_id] = shared.get(key_id, 0) + 1
+        best = nlargest(candidates, shared, key=shared.__getitem__)
+        ranked = []
+        for key_id in best:
+            if self._first[key_id] < 0:
+                continue
+            distance = _edit_distance(query, self._keys[key_id], max_distance)
+            if distance <= max_distance:
+                ranked.append((distance, self._keys[key_id], key_id))
+        ranked.sort()
+        results = []
+        for distance, _, key_id in ranked:
+            for handle in self._bucket(key_id):
+                results.append((handle, distance))
+                if len(results) >= limit:
+                    return results
+        return results
+
+    def _build_grams(self):
+        grams = {}
+        for key_id, key in enumerate(self._keys):
+            for gram in _trigrams(key):
+                postings = grams.get(gram)
+                if postings is None:
+                    postings = grams[gram] = array('I')
+                postings.append(key_id)
+        self._grams = grams
@@ -0,0 +1,80 @@
+# top_k_index_12.py - Incrementally Maintained Top-N Songs by Duration
+
+import heapq
+from itertools import islice
+
+from modules.duration_index_11 import DurationIndex
+from modules.song_store_10 import artist_key
+
+class TopKIndex:
+    """
+    Answers "top N longest (or shortest) songs", optionally for a single artist,
+    in O(K) time regardless of playlist size.
+    The whole-playlist index reuses the engine's DurationIndex; an artist index keeps its own
+    DurationIndex and is attached to the engine so every add/delete keeps it current.
+    """
+    def __init__(self, playlist_engine, k=5, longest=True, artist=None):
+        self.engine = playlist_engine
+        self.k = k
+        self.longest = longest
+        self.artist = artist
+        if artist is None:
+            # Read through the engine's duration_index property on every query, which
+            # builds a lazily restored playlist before it is read.
+            self._durations = None
+        else:
+            self._artist_key = artist_key(artist)
+            self._durations = DurationIndex()
+            playlist_engine.attach_index(self)
+
+    # O(1) average time (engine mutation hook).
+    def add(self, node):
+        if artist_key(node.artist) == self._artist_key:
+            self._durations.add(node)
+
+    # O(1) average time (engine mutation hook).
+    def remove(self, node):
+        if artist_key(node.artist) == self._artist_key:
+            self._durations.remove(node)
+
+    # O(1) average time (engine mutation hook).
+    def update(self, node, field, old_value, new_value):
+        """
+        Follows edits of a listed song: an artist change moves it in or out of this
+        artist's index, a duration change re-buckets it. The whole-playlist index is the
+        engine's own DurationIndex, which the engine updates itself.
+        """
+        if self.artist is None:
+            return
+        if field == "artist":
+            was_listed = artist_key(old_value) == self._artist_key
+            is_listed = artist_key(new_value) == self._artist_key
+            if was_listed and not is_listed:
+                self._durations.remove(node)
+            elif is_listed and not was_listed:
+                self._durations.add(node)
+        elif field == "duration" and artist_key(node.artist) == self._artist_key:
+            self._durations.update(node, field, old_value, new_value)
+
+    # O(K) time.
+    def top(self, k=None):
+        """Returns the top k (default: the configured K) songs as title/duration dicts."""
+        durations = self.engine.duration_index if self.artist is None else self._durations
+        nodes = durations.iter_descending() if self.longest else durations.iter_ascending()
+        return [{"title": node.title, "duration": node.duration}
+                for node in islice(nodes, self.k if k is None else k)]
+
+    def close(self):
+        """Stops maintaining an artist index."""
+        if self.artist is not None:
+            self.engine.detach_index(self)
+
+# O(n log k) time, O(k) space.
+def top_k_streaming(nodes, k=5, longest=True):
+    """
+    One-off top-k over any iterable of song nodes using a bounded heap, for callers
+    that do not want to keep an index attached to the engine.
+    """
+    select = heapq.nlargest if longest else heapq.nsmallest
+    return [{"title": node.title, "duration": node.duration}
+            for node in select(k, nodes, key=lambda node: node.duration)]
\ No newline at end of file
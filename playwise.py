@@ -1,5 +1,8 @@
+import os
+from functools import partial
+
 from modules.playlist_engine_1 import PlaylistEngine
-from modules.playback_history_2 import PlaybackHistory
+from modules.playback_history_2 import PlaybackHistory, DEFAULT_CAPACITY
 from modules.song_rating_tree_3 import SongRatingBST
 from modules.song_lookup_4 import SongLookup
 from modules.playlist_sorter_5 import PlaylistSorter
@@ -7,52 +10,333 @@ from modules.performance_analyzer_6 import PerformanceAnalyzer
 from modules.system_snapshot_7 import SystemSnapshot
 from modules.artist_blocklist_8 import ArtistBlocklist
 from modules.playlist_duration_visualizer_9 import PlayDurationVisualizer
+from modules.song_store_10 import SongStore
+from modules.change_journal_13 import ChangeJournal
+from modules.state_format_14 import save_state, load_state
+from modules.bulk_ingest_15 import ingest_songs, iter_csv_rows, iter_jsonl_rows
+from modules.parallel_analytics_18 import ParallelAnalytics
+from modules.numpy_analytics_19 import VectorAnalytics
+from modules.artist_index_21 import ArtistIndex
+from modules.instrumentation_23 import Instrumentation
+from modules.operation_log_24 import DurableState
+from modules.result_cache_25 import ResultCache
+from modules.sorted_views_26 import SortedView
+from modules.stream_pipeline_27 import Pipeline
+from modules.playback_queue_28 import SongPool, PlaybackQueue
 
 class PlayWise:
     """
     Main class for the PlayWise application, integrating all modules.
     """
-    def __init__(self):
-        # Initialize various modules used by the application
-        self.playlist_engine = PlaylistEngine()
-        self.playback_history = PlaybackHistory()
-        self.song_rating_tree = SongRatingBST()
-        self.song_lookup = SongLookup()
+    def __init__(self, history_capacity=DEFAULT_CAPACITY, history_spill_dir=None):
+        """
+        history_capacity: plays kept in memory (None keeps every play). Older plays are
+        dropped or, with history_spill_dir, written to segment files in that directory.
+        """
+        # Initialize various modules used by the application.
+        # All song metadata lives once in the shared columnar store,
+        # and every mutation is recorded in one versioned journal.
+        self.song_store = SongStore()
+        self.journal = ChangeJournal()
+        self.playlist_engine = PlaylistEngine(self.song_store, self.journal)
+        self.playback_history = PlaybackHistory(self.journal, capacity=history_capacity,
+                                                spill_dir=history_spill_dir)
+        self.song_rating_tree = SongRatingBST(self.song_store, self.journal)
+        self.song_lookup = SongLookup(self.song_store, self.journal)
         self.playlist_sorter = PlaylistSorter()
-        self.performance_analyzer = PerformanceAnalyzer(self.playlist_engine)
+        self.performance_analyzer = PerformanceAnalyzer(self.playlist_engine, type(self))
+        self.artist_blocklist = ArtistBlocklist(self.song_store, self.journal)
+        # Opt-in hot-path metrics; nothing is wrapped until enable_instrumentation().
+        self.instrumentation = Instrumentation()
         self.system_snapshot = SystemSnapshot(
             self.playlist_engine,
             self.playback_history,
-            self.song_rating_tree
+            self.song_rating_tree,
+            song_lookup=self.song_lookup,
+            artist_blocklist=self.artist_blocklist,
+            journal=self.journal,
+            instrumentation=self.instrumentation
         )
-        self.artist_blocklist = ArtistBlocklist()
         self.duration_visualizer = PlayDurationVisualizer(self.playlist_engine)
+        # Sorts and aggregates very large playlists across processes (serial below a size threshold).
+        self.parallel_analytics = ParallelAnalytics(self.song_store)
+        # Duration/rating statistics, vectorized with NumPy when it is installed.
+        self.vector_analytics = VectorAnalytics(self.playlist_engine)
+        # Songs per artist across the whole store, used to purge blocked artists.
+        self.artist_index = ArtistIndex(self.song_store)
+        # DurableState logging every change when opened from a data directory (see open()).
+        self.durable = None
+        # Derived query results, kept until the state they depend on changes.
+        self.result_cache = ResultCache(self.journal)
+        # Incrementally maintained sorted views by field, created on first use.
+        self._sorted_views = {}
+        # Weighted pool of playable songs shared by the listeners' playback queues,
+        # attached on the first call to playback_queue().
+        self._song_pool = None
+        self._playback_queues = {}
+
+    @classmethod
+    def load(cls, path, **options):
+        """
+        Restores a PlayWise instance from a binary state file written by save().
+        Columns are bulk-copied from a memory map; playlist nodes are built on first use.
+        Options (history_capacity, history_spill_dir) are passed to the constructor.
+        """
+        return load_state(cls(**options), path)
+
+    @classmethod
+    def open(cls, directory, sync="batch", history_capacity=DEFAULT_CAPACITY, history_spill_dir=None,
+             **options):
+        """
+        Opens a crash-safe PlayWise instance backed by a data directory: the latest
+        snapshot is loaded, the operation log written since is replayed on top of it,
+        and every further change is appended to the log (group-committed; see
+        OperationLog for the sync modes). Call durable.maybe_compact() between
+        operations to keep the log short, and close() when done.
+        Evicted history plays spill to DIRECTORY/history unless history_spill_dir is given.
+        """
+        if history_spill_dir is None:
+            history_spill_dir = os.path.join(directory, "history")
+        durable = DurableState(directory, sync, **options)
+        playwise = durable.open(partial(cls, history_capacity=history_capacity,
+                                        history_spill_dir=history_spill_dir))
+        playwise.durable = durable
+        return playwise
+
+    def close(self):
+        """Flushes and closes the operation log of an instance created by open()."""
+        if self.durable is not None:
+            self.durable.close()
+
+    def save(self, path):
+        """Writes the full state to a binary file that load() can restore quickly."""
+        save_state(self, path)
 
     def export_snapshot(self):
-        """Exports a snapshot of the current system state."""
-        return self.system_snapshot.export_snapshot()
+        """
+        Exports a snapshot of the current system state.
+        Cached until the songs, ratings or history change (not while metrics are
+        being recorded, since those change on every call).
+        """
+        if self.instrumentation.enabled:
+            return self.system_snapshot.export_snapshot()
+        return self.result_cache.get_or_compute("snapshot", (), ("playlist", "lookup", "rating", "history"),
+                                                self.system_snapshot.export_snapshot)
+
+    def stream_snapshot(self, path, since=None):
+        """
+        Streams the full state (or, with `since`, the changes after that version) to a
+        JSON Lines file and returns the snapshot version.
+        """
+        return self.system_snapshot.stream_snapshot(path, since=since)
+
+    def enable_instrumentation(self):
+        """
+        Starts recording call counts, latency histograms and treap walk lengths for the
+        engine, rating tree, lookup, sorter and snapshot; the snapshot then includes them.
+        """
+        self.instrumentation.enable(self)
+
+    def disable_instrumentation(self):
+        """Stops recording; the instrumented methods run unwrapped again."""
+        self.instrumentation.disable()
+
+    def export_metrics(self, fmt="json"):
+        """Recorded metrics as a dictionary (fmt="json") or Prometheus text (fmt="prometheus")."""
+        if fmt == "prometheus":
+            return self.instrumentation.to_prometheus()
+        return self.instrumentation.metrics()
 
     def analyze_performance(self):
         """Analyzes the performance of the playlist engine."""
         return self.performance_analyzer.run_analysis()
 
     def get_duration_summary(self):
-        """Gets a summary of the total playlist duration."""
-        return self.duration_visualizer.get_duration_summary()
-
-    def add_song_safe(self, title, artist, duration):
-        """Adds a song only if the artist is not on the blocklist."""
+        """Gets a summary of the total playlist duration (cached until the songs change)."""
+        return self.result_cache.get_or_compute("duration_summary", (), ("playlist", "lookup"),
+                                                self.duration_visualizer.get_duration_summary)
+
+    def get_duration_statistics(self):
+        """Gets percentiles, histograms and the longest songs of the playlist (cached)."""
+        return self.result_cache.get_or_compute("duration_statistics", (), ("playlist", "lookup"),
+                                                self.vector_analytics.summary)
+
+    def get_sorted_playlist(self, keys="title"):
+        """
+        Returns the playlist's song metadata sorted by one or more keys (a field name or
+        (field, descending) pairs, as for PlaylistSorter). Very large playlists are sorted
+        across processes. The result is cached until the songs or ratings change.
+        """
+        keys = tuple(self.playlist_sorter.normalize_keys(keys))
+
+        def compute():
+            store = self.song_store
+            handles = [node.handle for node in self.playlist_engine]
+            return [store.metadata(handle) for handle in self.parallel_analytics.sort_handles(handles, keys)]
+
+        return self.result_cache.get_or_compute("sorted_playlist", keys, ("playlist", "lookup", "rating"), compute)
+
+    def sorted_view(self, field):
+        """
+        The persistent view of the playlist sorted by "title", "duration" or "artist".
+        It is built once (one sort) and then kept current by the engine's mutation hooks.
+        """
+        view = self._sorted_views.get(field)
+        if view is None:
+            view = self._sorted_views[field] = SortedView(field).attach(self.playlist_engine)
+        return view
+
+    def page_sorted(self, field, offset=0, limit=50, descending=False):
+        """One page of the playlist sorted by a field, in O(log n + limit) time."""
+        return self.sorted_view(field).page(offset, limit, descending)
+
+    def stream_playlist(self, start=0, stop=None, skip_blocked=False):
+        """
+        A lazy Pipeline over the playlist nodes at positions [start, stop). With
+        skip_blocked=True songs by blocked artists are filtered inside the iterator.
+        """
+        return Pipeline.playlist(self.playlist_engine, start, stop,
+                                 self.artist_blocklist if skip_blocked else None)
+
+    def stream_ratings(self, min_rating=None, max_rating=None, descending=False, skip_blocked=False):
+        """A lazy Pipeline over the rating tree's {"id", "metadata"} entries in rating order."""
+        return Pipeline.ratings(self.song_rating_tree, min_rating, max_rating, descending,
+                                self.artist_blocklist if skip_blocked else None)
+
+    def playback_queue(self, listener="default", mode=None, window=20):
+        """
+        The shuffle/smart playback queue of a listener, created on first use. `mode` is
+        "shuffle" (each song once per cycle) or "weighted" (favours higher ratings);
+        songs by blocked artists are never queued.
+        """
+        if self._song_pool is None:
+            self._song_pool = SongPool(self.song_store, self.artist_blocklist, self.journal,
+                                       rating_tree=self.song_rating_tree).attach(self.playlist_engine)
+        queue = self._playback_queues.get(listener)
+        if queue is None:
+            queue = self._playback_queues[listener] = PlaybackQueue(
+                self._song_pool, mode or "shuffle", window, self.playback_history)
+        elif mode is not None:
+            if mode not in PlaybackQueue.MODES:
+                raise ValueError(f"mode must be one of {', '.join(PlaybackQueue.MODES)}")
+            queue.mode = mode
+        return queue
+
+    def next_track(self, listener="default", mode=None):
+        """Plays a listener's next track (recorded in the playback history) and returns it."""
+        return self.playback_queue(listener, mode).next_track()
+
+    def search_by_rating(self, rating):
+        """Songs with exactly the given rating (cached until the songs or ratings change)."""
+        return self.result_cache.get_or_compute(
+            "search_by_rating", rating, ("rating", "lookup", "playlist"),
+            lambda: self.song_rating_tree.search_by_rating(rating))
+
+    def update_song(self, song_id, title=None, artist=None, duration=None):
+        """
+        Edits a stored song by ID; None leaves a field unchanged. The edit goes through
+        the lookup tables (as a lookup sync), so it is journaled, logged and replayed on
+        recovery, unlike direct SongStore.update_song calls. Raises KeyError for an unknown ID.
+        """
+        handle = self.song_store.handle_of(song_id)
+        if handle is None:
+            raise KeyError(song_id)
+        if title is None:
+            title = self.song_store.titles[handle]
+        self.song_lookup.sync_song(song_id, title, {"artist": artist, "duration": duration})
+
+    def block_artist(self, artist_name, purge=False):
+        """
+        Blocks an artist. With purge=True, songs by blocked artists (including
+        collaborations and pattern matches) are also removed from the playlist,
+        lookup tables and rating tree; returns the number of songs purged.
+        """
+        self.artist_blocklist.block_artist(artist_name)
+        return self.purge_blocked() if purge else 0
+
+    def purge_blocked(self):
+        """
+        Removes every song whose artist is currently blocked from the playlist, lookup
+        tables and rating tree. Costs O(distinct artists) to find the blocked artists plus
+        O(songs by them), using the artist index instead of scanning the library.
+        Returns the number of songs purged.
+        """
+        purged = 0
+        for artist_id in self.artist_blocklist.blocked_artist_ids():
+            for handle in self.artist_index.handles_of(artist_id):
+                nodes = self.playlist_engine.nodes_of(handle)
+                for node in nodes:
+                    self.playlist_engine.delete_node(node)
+                song_id = self.song_store.song_ids[handle]
+                in_lookup = song_id is not None and self.song_lookup.song_by_id.get(song_id) == handle
+                if in_lookup:
+                    self.song_lookup.remove_handle(handle)
+                rated = song_id is not None and self.song_rating_tree.delete_song(song_id)
+                if nodes or in_lookup or rated:
+                    purged += 1
+        return purged
+
+    def add_song_safe(self, title, artist, duration, song_id=None, rating=None):
+        """
+        Adds a song only if the artist is not on the blocklist and the song ID is new.
+        When a song ID is given, the song is also indexed in the lookup tables and,
+        if a rating is given, in the rating tree; all of them share one store entry.
+        """
         if self.artist_blocklist.is_blocked(artist):
             print(f"[BLOCKED] '{title}' by '{artist}' cannot be added (artist blocked).")
             return False
-        self.playlist_engine.add_song(title, artist, duration)
+        if song_id is not None and self.song_store.handle_of(song_id) is not None:
+            print(f"[DUPLICATE] '{title}' cannot be added (song ID '{song_id}' already exists).")
+            return False
+        node = self.playlist_engine.add_song(title, artist, duration, song_id=song_id)
+        if song_id is not None:
+            self.song_lookup.sync_handle(node.handle)
+            if rating is not None:
+                self.song_rating_tree.insert_handle(node.handle, rating)
         return True
 
+    def add_songs_bulk(self, rows):
+        """
+        Adds many songs at once, skipping blocked artists and invalid rows.
+        Rows are (title, artist, duration, rating, id) tuples or dicts; returns a report
+        with the accepted count and the rejected rows with their reasons.
+        """
+        return ingest_songs(self, rows)
+
+    def import_songs(self, path):
+        """Bulk-adds songs from a CSV (with a header row) or JSON Lines file."""
+        rows = iter_jsonl_rows(path) if path.endswith((".jsonl", ".json")) else iter_csv_rows(path)
+        return ingest_songs(self, rows)
 
 if __name__ == "__main__":
-    pw = PlayWise()
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        # Server mode: python playwise.py serve [--host H] [--port P] [--unix PATH] [--state FILE]
+        from modules.playwise_server_17 import main
+        main(PlayWise, sys.argv[2:])
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        # Benchmarks: python playwise.py bench [--sizes N ...] [--output FILE] [--baseline FILE]
+        from modules.benchmark_suite_22 import main
+        sys.exit(main(PlayWise, sys.argv[2:]))
+
+    # Interactive mode: python playwise.py [--data DIR] [--history-capacity N] [--history-spill-dir DIR]
+    import argparse
+    parser = argparse.ArgumentParser(prog="playwise.py")
+    parser.add_argument("--data", help="data directory for crash-safe mode")
+    parser.add_argument("--history-capacity", type=int, default=DEFAULT_CAPACITY,
+                        help="plays kept in memory (0 keeps every play)")
+    parser.add_argument("--history-spill-dir", help="directory for plays evicted from memory")
+    args = parser.parse_args(sys.argv[1:])
+    options = {"history_capacity": args.history_capacity or None, "history_spill_dir": args.history_spill_dir}
+    if args.data:
+        pw = PlayWise.open(args.data, **options)
+    else:
+        pw = PlayWise(**options)
 
     while True:
+        if pw.durable is not None:
+            pw.durable.maybe_compact()
         # Main menu for user interaction
         print("\n" + "="*50)
         print("🎵 PLAYWISE - Smart Playlist Engine 🎵")
@@ -67,6 +351,7 @@ if __name__ == "__main__":
         print("8. View Blocked Artists")
         print("9. View Playlist Duration Summary")
         print("10. Sort Playlist")
+        print("11. Play Next Track")
         print("0. Exit")
         print("="*50)
 
@@ -81,16 +366,14 @@ if __name__ == "__main__":
             except ValueError:
                 print("❌ Invalid duration")
                 continue
-            added = pw.add_song_safe(title, artist, duration)
-            if added:
-                sid = input("Enter song ID: ").strip()
-                try:
-                    rating = int(input("Enter rating (1-5): ").strip())
-                    pw.song_rating_tree.insert_song(sid, rating, {"title": title})
-                    pw.song_lookup.sync_song(sid, title, {"artist": artist, "duration": duration})
-                    print("✅ Song added successfully!")
-                except ValueError:
-                    print("❌ Invalid rating")
+            sid = input("Enter song ID: ").strip()
+            try:
+                rating = int(input("Enter rating (1-5): ").strip())
+            except ValueError:
+                print("❌ Invalid rating")
+                continue
+            if pw.add_song_safe(title, artist, duration, song_id=sid, rating=rating):
+                print("✅ Song added successfully!")
 
         elif choice == "2":
             # Searches for a song by its unique ID
@@ -117,8 +400,8 @@ if __name__ == "__main__":
         elif choice == "6":
             # Blocks a specified artist
             artist = input("Enter artist to block: ").strip()
-            pw.artist_blocklist.block_artist(artist)
-            print(f"🚫 Artist '{artist}' blocked.")
+            purged = pw.block_artist(artist, purge=True)
+            print(f"🚫 Artist '{artist}' blocked; {purged} song(s) removed.")
 
         elif choice == "7":
             # Unblocks a specified artist
@@ -138,27 +421,36 @@ if __name__ == "__main__":
 
         elif choice == "10":
             # Sorts the playlist based on user input
-            key = input("Sort by 'duration' or 'title': ").strip().lower()
+            key = input("Sort by 'duration', 'title' or 'artist': ").strip().lower()
             reverse = input("Reverse order? (y/n): ").strip().lower() == "y"
 
-            current = pw.playlist_engine.head
-            songs_list = []
-            while current:
-                songs_list.append({
-                    "title": current.title,
-                    "duration": current.duration,
-                    "artist": getattr(current, 'artist', 'Unknown')
-                })
-                current = current.next
-
-            sorted_list = pw.playlist_sorter.sort_playlist(songs_list, key=key, reverse=reverse)
-            print("🎼 Sorted Playlist:")
-            for i, song in enumerate(sorted_list, 1):
+            if key not in SortedView.FIELDS:
+                print("❌ Invalid sort key")
+                continue
+            try:
+                offset = int(input("Start at position (default 1): ").strip() or 1) - 1
+            except ValueError:
+                offset = 0
+
+            # Pages come from a persistent sorted view, so nothing is re-sorted per request.
+            sorted_list = pw.page_sorted(key, offset, 50, descending=reverse)
+            print(f"🎼 Sorted Playlist ({len(pw.sorted_view(key))} songs):")
+            for i, song in enumerate(sorted_list, offset + 1):
                 print(f"{i}. {song}")
 
+        elif choice == "11":
+            # Picks the next track from the shuffle or rating-weighted queue
+            mode = input("Mode 'shuffle' or 'weighted' (default shuffle): ").strip().lower() or "shuffle"
+            if mode not in PlaybackQueue.MODES:
+                print("❌ Invalid mode")
+                continue
+            track = pw.next_track(mode=mode)
+            print("▶️ Now Playing:", track if track else "❌ No playable songs")
+
         elif choice == "0":
             # Exits the application
             print("👋 Exiting PlayWise. Goodbye!")
+            pw.close()
             break
 
         else: